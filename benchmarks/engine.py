@@ -0,0 +1,66 @@
+"""
+Counting engine scaling benchmark.
+
+Generates a synthetic tree and counts it with every
+backend for a growing number of jobs:
+
+    python -m benchmarks.engine --files 4000 --lines 2000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from codel.collector import FilesCollector
+from codel.engine import CountingEngine
+
+
+def generate_tree(folder: str, files: int, lines: int, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(files):
+        directory = os.path.join(folder, 'd{}'.format(i % 64))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'f{}.py'.format(i)), 'w') as f:
+            for _ in range(rng.randint(lines // 2, lines)):
+                f.write('x' * rng.randint(0, 80) + '\n')
+
+
+def run(folder: str, backend: str, jobs: int, repeat: int) -> float:
+    files = list(FilesCollector(folder, extensions=['.py']))
+    engine = CountingEngine(backend=backend, jobs=jobs)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sum(engine.count(files))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=4000)
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    jobs_list = sorted({1, 2, 4, cpu_count})
+
+    folder = tempfile.mkdtemp(prefix='codel-bench-')
+    try:
+        generate_tree(folder, args.files, args.lines)
+        serial = run(folder, 'serial', 1, args.repeat)
+        print('{: <10} {: >4} {: >10.3f}s {: >7.2f}x'.format('serial', 1, serial, 1.0))
+        for backend in ('thread', 'process'):
+            for jobs in jobs_list:
+                elapsed = run(folder, backend, jobs, args.repeat)
+                print('{: <10} {: >4} {: >10.3f}s {: >7.2f}x'.format(
+                    backend, jobs, elapsed, serial / elapsed))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
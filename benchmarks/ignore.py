@@ -0,0 +1,77 @@
+"""
+Ignore matcher microbenchmark.
+
+Matches synthetic paths against a generated rule set with the
+compiled IgnoreParser and with the per-rule gitignore_parser
+approach (measured on a sample and extrapolated):
+
+    python -m benchmarks.ignore --rules 500 --paths 1000000
+"""
+import argparse
+import random
+import time
+from gitignore_parser import rule_from_pattern
+from codel.utils import IgnoreParser
+
+FOLDER = '/bench'
+
+
+def generate_rules(count: int, rng: random.Random):
+    rules = []
+    for i in range(count):
+        kind = i % 5
+        if kind == 0:
+            rules.append('dir{}/'.format(i))
+        elif kind == 1:
+            rules.append('*.ext{}'.format(i))
+        elif kind == 2:
+            rules.append('name{}.py'.format(i))
+        elif kind == 3:
+            rules.append('/top{}/**/*.py'.format(i))
+        else:
+            rules.append('src/*/gen{}_*.py'.format(i))
+    rng.shuffle(rules)
+    return rules
+
+
+def generate_paths(count: int, rng: random.Random):
+    paths = []
+    for i in range(count):
+        depth = rng.randint(1, 6)
+        parts = ['d{}'.format(rng.randint(0, 40)) for _ in range(depth)]
+        if rng.random() < 0.01:
+            parts[0] = 'dir{}'.format(rng.randrange(0, 500, 5))
+        parts.append('f{}.{}'.format(i, rng.choice(['py', 'c', 'ext1', 'h'])))
+        paths.append(FOLDER + '/' + '/'.join(parts))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rules', type=int, default=500)
+    parser.add_argument('--paths', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rules = generate_rules(args.rules, rng)
+    paths = generate_paths(args.paths, rng)
+
+    start = time.perf_counter()
+    ignore_parser = IgnoreParser(rules, FOLDER)
+    matched = sum(1 for path in paths if ignore_parser.matches(path))
+    compiled = time.perf_counter() - start
+    print('compiled  {: >10.3f}s  {} of {} paths ignored'.format(compiled, matched, len(paths)))
+
+    legacy_rules = [rule_from_pattern(rule, FOLDER) for rule in rules]
+    sample = paths[:args.sample]
+    start = time.perf_counter()
+    for path in sample:
+        any(r.match(path) for r in legacy_rules)
+    legacy = (time.perf_counter() - start) * len(paths) / len(sample)
+    print('per-rule  {: >10.3f}s  (extrapolated from {} paths)'.format(legacy, len(sample)))
+    print('speedup   {: >10.1f}x'.format(legacy / compiled))
+
+
+if __name__ == '__main__':
+    main()
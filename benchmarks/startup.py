@@ -0,0 +1,98 @@
+"""
+Startup time benchmark.
+
+Runs `codel count` on a small tree the way pre-commit hooks
+do, reports the wall time of whole invocations and the import
+time of the CLI and checks that counting wrote no config files.
+Counting with the cache is timed on a tree counted before, and
+nothing under the tree may be created or modified by it:
+
+    python -m benchmarks.startup --runs 50
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def generate_tree(folder: str, files: int):
+    for i in range(files):
+        with open(os.path.join(folder, 'f{}.py'.format(i)), 'w') as f:
+            f.write('x\n' * (i + 1))
+
+
+def timed_run(command: list, cwd: str, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def snapshot(folder: str) -> dict:
+    # Path -> (inode, mtime, size) of everything under the folder
+    entries = {}
+    for root, dirs, files in os.walk(folder):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            entries[path] = (st.st_ino, st.st_mtime_ns, st.st_size)
+    return entries
+
+
+def report(name: str, timings: list):
+    print('{: <10} min {: >8.1f}ms  median {: >8.1f}ms'.format(
+        name, min(timings) * 1000, statistics.median(timings) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--files', type=int, default=10)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='codel-startup-')
+    home = tempfile.mkdtemp(prefix='codel-home-')
+    try:
+        generate_tree(folder, args.files)
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.getcwd()] + ([env['PYTHONPATH']] if 'PYTHONPATH' in env else []))
+
+        baseline = [sys.executable, '-c', 'pass']
+        imports = [sys.executable, '-c', 'import codel.cli']
+        count = [sys.executable, '-m', 'codel.cli', 'count', '-e', '.py', '--format', 'json']
+        uncached = count + ['--no-cache']
+
+        results = {}
+        for name, command in (('python', baseline), ('import', imports), ('count', uncached)):
+            results[name] = [timed_run(command, folder, env) for _ in range(args.runs)]
+            report(name, results[name])
+
+        written = [
+            path for path in (folder, home)
+            if os.path.exists(os.path.join(path, '.codel'))
+        ]
+        print('config writes: {}'.format(', '.join(written) if written else 'none'))
+
+        # The first run creates the cache, the
+        # following ones must leave the tree alone
+        timed_run(count, folder, env)
+        before = snapshot(folder)
+        results['cached'] = [timed_run(count, folder, env) for _ in range(args.runs)]
+        report('cached', results['cached'])
+        after = snapshot(folder)
+        changed = sorted(path for path in set(before) | set(after) if before.get(path) != after.get(path))
+        print('cached writes: {}'.format(', '.join(changed) if changed else 'none'))
+        if written or changed:
+            sys.exit('Counting wrote to the counted tree')
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
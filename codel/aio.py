@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+from concurrent.futures import Executor
+from typing import AsyncIterator, List, NamedTuple, Optional
+from .collector import File, FilesCollector
+from .counter import count_file
+from .report import CountReport
+
+# Number of files taken from the
+# collector per blocking walk step
+WALK_BATCH_SIZE = 256
+
+
+class CountResult(NamedTuple):
+    file: File
+    lines: Optional[int]
+    bytes: int
+
+
+async def acount_files(collector: FilesCollector,
+                       concurrency: int = 16,
+                       executor: Executor = None,
+                       timeout: float = None) -> AsyncIterator[CountResult]:
+    """
+    Count files of the collector yielding results as they finish.
+
+    Blocking reads run in `executor` (the loop default one if
+    None) with at most `concurrency` files in flight. Raises
+    `asyncio.TimeoutError` when `timeout` seconds elapse.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+    files = iter(collector)
+    pending = set()
+    pending_files = {}
+    walked = False
+
+    def next_batch() -> List[File]:
+        return list(itertools.islice(files, WALK_BATCH_SIZE))
+
+    def remaining() -> Optional[float]:
+        if deadline is None:
+            return None
+        left = deadline - loop.time()
+        if left <= 0:
+            raise asyncio.TimeoutError()
+        return left
+
+    try:
+        queue: List[File] = []
+        while True:
+            # Walk lazily, only as
+            # far as workers need files
+            if not queue and not walked and len(pending) < concurrency:
+                queue = await asyncio.wait_for(
+                    loop.run_in_executor(None, next_batch),
+                    remaining()
+                )
+                queue.reverse()
+                walked = not queue
+
+            while queue and len(pending) < concurrency:
+                file = queue.pop()
+                future = loop.run_in_executor(executor, count_file, file.file_path)
+                pending_files[future] = file
+                pending.add(future)
+
+            if not pending:
+                if walked:
+                    return
+                continue
+
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=remaining(),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise asyncio.TimeoutError()
+            for future in done:
+                lines, size = future.result()
+                yield CountResult(pending_files.pop(future), lines, size)
+    finally:
+        # Cancellation, timeout or consumer
+        # leaving early drops queued work
+        for future in pending:
+            future.cancel()
+
+
+async def acount(folder: str,
+                 extensions: List[str],
+                 ignore: List[str] = None,
+                 gitignore: bool = True,
+                 concurrency: int = 16,
+                 executor: Executor = None,
+                 timeout: float = None) -> AsyncIterator[CountResult]:
+    # Walking the folder happens lazily
+    # in the loop's default executor
+    collector = FilesCollector(
+        folder_path=folder,
+        ignore=ignore,
+        extensions=extensions,
+        gitignore=gitignore
+    )
+    async for result in acount_files(
+            collector,
+            concurrency=concurrency,
+            executor=executor,
+            timeout=timeout):
+        yield result
+
+
+async def areport(collector: FilesCollector,
+                  keep_files: bool = True,
+                  concurrency: int = 16,
+                  executor: Executor = None,
+                  timeout: float = None) -> CountReport:
+    report = CountReport(
+        folder_path=collector.folder_path,
+        extensions=collector.extensions,
+        ignore=collector.ignore,
+        keep_files=keep_files
+    )
+    async for result in acount_files(
+            collector,
+            concurrency=concurrency,
+            executor=executor,
+            timeout=timeout):
+        report.add(result.file.file_path, result.file.file_ext, result.lines, result.bytes)
+    return report
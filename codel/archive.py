@@ -0,0 +1,110 @@
+import os
+from typing import IO, Iterator, List, Tuple
+from .cache import Result
+from .collector import File, FilesCollector
+from .constants import TAR_SUFFIXES, ZIP_SUFFIXES
+from .counter import count_stream, count_stream_classified
+from .stats import Stats
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(TAR_SUFFIXES + ZIP_SUFFIXES) and os.path.isfile(path)
+
+
+class ArchiveCollector(FilesCollector):
+    """
+    Members of a tar or zip archive as a virtual tree
+    under the archive path. Tar archives, compressed or
+    not, are read in one sequential pass and members are
+    counted on the way, nothing is extracted.
+    """
+
+    streamed = True
+
+    def __init__(self,
+                 archive_path: str,
+                 ignore: List[str] = None,
+                 extensions: List[str] = None,
+                 stats: Stats = None):
+        FilesCollector.__init__(
+            self,
+            folder_path=archive_path,
+            ignore=ignore,
+            extensions=extensions,
+            stats=stats
+        )
+
+    def _tar_members(self) -> Iterator[Tuple[str, int, IO[bytes]]]:
+        # Stream mode never seeks back, compressed
+        # archives are decompressed on the fly
+        import tarfile
+        with tarfile.open(self.folder_path, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, archive.extractfile(member)
+
+    def _zip_members(self) -> Iterator[Tuple[str, int, IO[bytes]]]:
+        import zipfile
+        with zipfile.ZipFile(self.folder_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as f:
+                        yield info.filename, info.file_size, f
+
+    def _members(self) -> Iterator[Tuple[str, int, IO[bytes]]]:
+        if self.folder_path.lower().endswith(ZIP_SUFFIXES):
+            return self._zip_members()
+        return self._tar_members()
+
+    def results(self, classified: bool = False) -> Iterator[Tuple[File, Result]]:
+        # Files of the archive and results of counting them,
+        # with (code, comment, blank) lines when classified.
+        # Archive modules are only imported when used.
+        import tarfile
+        import zipfile
+        ignore_parser = self.ignore_parser
+        extensions = set(self.extensions)
+        evaluations = ignore_parser.evaluations
+        seen = 0
+        pruned = 0
+        size = 0
+        try:
+            for name, member_size, f in self._members():
+                seen += 1
+                # Member names are relative, "./" prefixed
+                # or even absolute depending on the tool
+                name = name.lstrip('/')
+                while name.startswith('./'):
+                    name = name[2:]
+                file_name = name.rpartition('/')[2]
+                if os.path.splitext(file_name)[-1] not in extensions:
+                    pruned += 1
+                    continue
+                file = File.from_path(os.path.join(self.folder_path, *name.split('/')), file_name)
+                if ignore_parser.matches(file.file_path):
+                    pruned += 1
+                    continue
+
+                if classified:
+                    result = count_stream_classified(f, file.file_ext)
+                else:
+                    result = count_stream(f), member_size
+                size += result[1]
+                yield file, result
+        except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile) as e:
+            raise ArchiveError("Couldn't read archive {}: {}".format(self.folder_path, e))
+        finally:
+            if self.stats is not None:
+                self.stats.add('archive_members', seen)
+                self.stats.add('entries_pruned', pruned)
+                self.stats.add('files_read', seen - pruned)
+                self.stats.add('bytes_read', size)
+                self.stats.add('ignore_evaluations', ignore_parser.evaluations - evaluations)
+
+    def __iter__(self) -> Iterator[File]:
+        for file, _ in self.results():
+            yield file
@@ -0,0 +1,2 @@
+from .generator import WORKLOADS, generate
+from .runner import compare_results, estimate_failures, format_results, run_benchmarks, write_results
@@ -0,0 +1,117 @@
+import os
+import random
+from typing import Callable, Dict, List
+from ..constants import WORKLOAD_NAMES
+
+# Extensions used by generated files,
+# benchmarks count the first two
+EXTENSIONS = ['.py', '.c', '.txt', '.json']
+COUNTED_EXTENSIONS = EXTENSIONS[:2]
+
+_LINE_LENGTHS = (0, 4, 12, 24, 40, 60, 80, 120)
+
+
+def _write_file(path: str, lines: int, rng: random.Random):
+    with open(path, 'w') as f:
+        f.writelines(
+            'x' * rng.choice(_LINE_LENGTHS) + '\n'
+            for _ in range(lines)
+        )
+
+
+def _write_large_file(path: str, size: int, rng: random.Random):
+    # Repeat one block so that
+    # huge files are fast to write
+    block_lines = []
+    block_size = 0
+    while block_size < 1024 * 1024:
+        line = 'y' * rng.choice(_LINE_LENGTHS) + '\n'
+        block_lines.append(line)
+        block_size += len(line)
+    block = ''.join(block_lines).encode()
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            chunk = block[:size - written]
+            f.write(chunk)
+            written += len(chunk)
+
+
+def _file_name(i: int, rng: random.Random) -> str:
+    return 'f{}{}'.format(i, rng.choice(EXTENSIONS))
+
+
+def _deep(root: str, scale: float, rng: random.Random) -> List[str]:
+    # Long chain of nested directories
+    depth = max(2, int(64 * min(scale * 10, 1)))
+    files_per_level = max(1, int(160 * scale))
+    path = root
+    for level in range(depth):
+        path = os.path.join(path, 'level{}'.format(level))
+        os.makedirs(path)
+        for i in range(files_per_level):
+            _write_file(os.path.join(path, _file_name(i, rng)), rng.randint(1, 200), rng)
+    return []
+
+
+def _wide(root: str, scale: float, rng: random.Random) -> List[str]:
+    # Everything in one flat directory
+    for i in range(max(1, int(20000 * scale))):
+        _write_file(os.path.join(root, _file_name(i, rng)), rng.randint(1, 200), rng)
+    return []
+
+
+def _tiny(root: str, scale: float, rng: random.Random) -> List[str]:
+    # Lots of one or two line files
+    for i in range(max(1, int(100000 * scale))):
+        directory = os.path.join(root, 'd{}'.format(i % 256), 'e{}'.format(i % 16))
+        os.makedirs(directory, exist_ok=True)
+        _write_file(os.path.join(directory, _file_name(i, rng)), rng.randint(0, 2), rng)
+    return []
+
+
+def _huge(root: str, scale: float, rng: random.Random) -> List[str]:
+    # Few multi-GB files at full scale
+    for i in range(3):
+        size = int(2 * 1024 ** 3 * scale)
+        _write_large_file(os.path.join(root, 'huge{}.py'.format(i)), max(1, size), rng)
+    return []
+
+
+def _ignore(root: str, scale: float, rng: random.Random) -> List[str]:
+    # Regular tree with many rules and
+    # ignored vendored directories
+    for i in range(max(1, int(20000 * scale))):
+        top = 'vendor{}'.format(i % 8) if i % 3 == 0 else 'src{}'.format(i % 8)
+        directory = os.path.join(root, top, 'm{}'.format(i % 64))
+        os.makedirs(directory, exist_ok=True)
+        _write_file(os.path.join(directory, _file_name(i, rng)), rng.randint(1, 100), rng)
+
+    rules = ['vendor{}/'.format(i) for i in range(8)]
+    for i in range(500):
+        kind = i % 4
+        if kind == 0:
+            rules.append('*.gen{}'.format(i))
+        elif kind == 1:
+            rules.append('generated_{}.py'.format(i))
+        elif kind == 2:
+            rules.append('/build{}/**'.format(i))
+        else:
+            rules.append('src*/m{}/f{}_*.c'.format(i % 64, i))
+    return rules
+
+
+# name -> builder returning ignore patterns
+WORKLOADS: Dict[str, Callable[[str, float, random.Random], List[str]]] = dict(
+    zip(WORKLOAD_NAMES, (_deep, _wide, _tiny, _huge, _ignore))
+)
+
+
+def generate(root: str, workload: str, scale: float = 1.0, seed: int = 0) -> List[str]:
+    """
+    Generate a deterministic synthetic tree for the
+    workload in `root` and return ignore patterns
+    to benchmark it with.
+    """
+    os.makedirs(root, exist_ok=True)
+    return WORKLOADS[workload](root, scale, random.Random(seed))
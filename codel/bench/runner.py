@@ -0,0 +1,274 @@
+import json
+import os
+import shutil
+import sys
+import time
+from io import StringIO
+from typing import Dict, List, TextIO, Tuple
+from ..collector import File, FilesCollector
+from ..engine import CountingEngine
+from ..report import CountReport
+from ..style import DefaultStylizer
+from ..utils import IgnoreParser
+from ..walker import DirectoryWalker
+from .generator import COUNTED_EXTENSIONS, WORKLOADS, generate
+
+PHASES = ('walk', 'filter', 'count', 'render', 'total')
+RESULTS_VERSION = 1
+# Share of files counted by --estimate runs and the
+# largest relative error of their total lines
+ESTIMATE_FRACTION = 0.05
+MAX_ESTIMATE_ERROR = 0.05
+# Smaller trees leave too few files in
+# the sample for the error to be checked
+MIN_ESTIMATE_SCALE = 0.05
+
+
+def drop_page_cache(root: str, system: bool = False) -> str:
+    # Returns the method used to evict the files of the tree
+    # from page cache, dropping caches of the whole system
+    # only when asked to as it slows everything else down
+    if system:
+        try:
+            os.sync()
+            with open('/proc/sys/vm/drop_caches', 'w') as f:
+                f.write('3\n')
+            return 'drop_caches'
+        except OSError:
+            pass
+
+    if not hasattr(os, 'posix_fadvise'):
+        return 'none'
+    for directory_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            try:
+                fd = os.open(os.path.join(directory_path, file_name), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fdatasync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+    return 'fadvise'
+
+
+def _run_phases(root: str,
+                ignore: List[str],
+                engine: CountingEngine,
+                cold: bool = False,
+                drop_caches: bool = False) -> Tuple[Dict[str, float], CountReport]:
+    timings = {}
+    if cold:
+        drop_page_cache(root, drop_caches)
+
+    # Plain enumeration of the tree
+    start = time.perf_counter()
+    entries = list(DirectoryWalker(root))
+    timings['walk'] = time.perf_counter() - start
+
+    # Extension and ignore filtering
+    # of the enumerated files
+    start = time.perf_counter()
+    extensions = set(COUNTED_EXTENSIONS)
+    ignore_parser = IgnoreParser(ignore, root)
+    files = [
+        File.from_entry(entry) for entry in entries
+        if os.path.splitext(entry.name)[-1] in extensions
+        and not ignore_parser.matches(entry.path)
+    ]
+    timings['filter'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = CountReport(root, COUNTED_EXTENSIONS, ignore)
+    for file, (lines, size) in engine.count_files(files):
+        report.add(file.file_path, file.file_ext, lines, size)
+    timings['count'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    DefaultStylizer().write(report, StringIO())
+    timings['render'] = time.perf_counter() - start
+
+    # Real pipeline walking with pruning
+    if cold:
+        drop_page_cache(root, drop_caches)
+    start = time.perf_counter()
+    collector = FilesCollector(root, ignore=ignore, extensions=COUNTED_EXTENSIONS)
+    report = engine.report(collector)
+    DefaultStylizer().write(report, StringIO())
+    timings['total'] = time.perf_counter() - start
+    return timings, report
+
+
+def _run_estimate(root: str,
+                  ignore: List[str],
+                  engine: CountingEngine,
+                  exact: CountReport,
+                  checked: bool = True) -> dict:
+    # Estimate on warm page cache checked
+    # against the exact count of the tree
+    from ..estimate import estimate_reports
+    start = time.perf_counter()
+    collector = FilesCollector(root, ignore=ignore, extensions=COUNTED_EXTENSIONS)
+    report = estimate_reports(engine, [collector], ESTIMATE_FRACTION)[0]
+    elapsed = time.perf_counter() - start
+    error = abs(report.total_lines - exact.total_lines) / exact.total_lines if exact.total_lines else 0.0
+    return {
+        'time': elapsed,
+        'sampled_files': report.sampled_files,
+        'lines': report.total_lines,
+        'margin': report.lines_margin,
+        'error': error,
+        'covered': abs(report.total_lines - exact.total_lines) <= report.lines_margin,
+        'checked': checked
+    }
+
+
+def _best(runs: List[Tuple[Dict[str, float], CountReport]]) -> Dict[str, float]:
+    return {phase: min(timings[phase] for timings, _ in runs) for phase in PHASES}
+
+
+def _git_commit() -> str:
+    import subprocess
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True
+        ).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run_benchmarks(workloads: List[str] = None,
+                   scale: float = 0.1,
+                   repeat: int = 3,
+                   jobs: int = None,
+                   backend: str = 'auto',
+                   root: str = None,
+                   keep: bool = False,
+                   drop_caches: bool = False,
+                   log: TextIO = sys.stderr) -> dict:
+    # Only needed when benchmarks
+    # run, not to set the parser up
+    import platform
+    import tempfile
+    workloads = workloads if workloads else list(WORKLOADS)
+    base = root if root else tempfile.mkdtemp(prefix='codel-bench-')
+    engine = CountingEngine(backend=backend, jobs=jobs)
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': scale,
+        'repeat': repeat,
+        'backend': backend,
+        'jobs': engine.jobs,
+        'workloads': {}
+    }
+
+    try:
+        for workload in workloads:
+            workload_root = os.path.join(base, workload)
+            log.write('Generating {}...\n'.format(workload))
+            if os.path.exists(workload_root):
+                shutil.rmtree(workload_root)
+            ignore = generate(workload_root, workload, scale)
+
+            cold_runs = [
+                _run_phases(workload_root, ignore, engine, cold=True, drop_caches=drop_caches)
+                for _ in range(repeat)
+            ]
+            warm_runs = [
+                _run_phases(workload_root, ignore, engine)
+                for _ in range(repeat)
+            ]
+
+            report = warm_runs[-1][1]
+            results['workloads'][workload] = {
+                'files': report.files_count,
+                'lines': report.total_lines,
+                'bytes': report.total_bytes,
+                'rules': len(ignore),
+                'cold_method': drop_page_cache(workload_root, drop_caches),
+                'cold': _best(cold_runs),
+                'warm': _best(warm_runs),
+                'estimate': _run_estimate(workload_root, ignore, engine, report, scale >= MIN_ESTIMATE_SCALE)
+            }
+            log.write('Finished {}\n'.format(workload))
+            if not keep:
+                shutil.rmtree(workload_root)
+    finally:
+        if not keep and not root:
+            shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+def format_results(results: dict) -> str:
+    lines = ['{: <8} {: <5} '.format('workload', 'cache') + ' '.join(
+        '{: >9}'.format(phase) for phase in PHASES)]
+    for workload, result in results['workloads'].items():
+        for cache in ('cold', 'warm'):
+            lines.append('{: <8} {: <5} '.format(workload, cache) + ' '.join(
+                '{: >8.3f}s'.format(result[cache][phase]) for phase in PHASES))
+
+    lines.append('')
+    lines.append('{: <8} {: >9} {: >9} {: >9} {: >9}'.format('workload', 'estimate', 'sampled', 'error', 'margin'))
+    for workload, result in results['workloads'].items():
+        estimate = result.get('estimate')
+        if estimate is None:
+            continue
+        note = ''
+        if not estimate.get('checked', True):
+            note = '  not checked'
+        elif estimate['error'] > MAX_ESTIMATE_ERROR:
+            note = '  too large'
+        lines.append('{: <8} {: >8.3f}s {: >9} {: >8.2f}% {: >8.2f}%{}'.format(
+            workload,
+            estimate['time'],
+            estimate['sampled_files'],
+            estimate['error'] * 100,
+            estimate['margin'] / estimate['lines'] * 100 if estimate['lines'] else 0.0,
+            note
+        ))
+    return '\n'.join(lines)
+
+
+def estimate_failures(results: dict) -> List[str]:
+    # Workloads estimated with an error above MAX_ESTIMATE_ERROR,
+    # runs below MIN_ESTIMATE_SCALE aren't checked
+    return [
+        workload for workload, result in results['workloads'].items()
+        if result.get('estimate', {}).get('checked', True)
+        and result.get('estimate', {}).get('error', 0.0) > MAX_ESTIMATE_ERROR
+    ]
+
+
+def compare_results(old: dict, new: dict) -> str:
+    # Relative change of every phase, positive
+    # values mean the new results are slower
+    lines = ['{: <8} {: <5} '.format('workload', 'cache') + ' '.join(
+        '{: >9}'.format(phase) for phase in PHASES)]
+    for workload, result in new['workloads'].items():
+        if workload not in old['workloads']:
+            continue
+        for cache in ('cold', 'warm'):
+            changes = []
+            for phase in PHASES:
+                before = old['workloads'][workload][cache][phase]
+                after = result[cache][phase]
+                change = (after - before) / before * 100 if before else 0.0
+                changes.append('{: >+8.1f}%'.format(change))
+            lines.append('{: <8} {: <5} '.format(workload, cache) + ' '.join(changes))
+    return '\n'.join(lines)
+
+
+def write_results(results: dict, stream: TextIO):
+    json.dump(results, stream, indent=2)
+    stream.write('\n')
@@ -0,0 +1,277 @@
+import itertools
+import os
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+from .cache import Result
+from .collector import File, FilesCollector
+from .estimate import CONFIDENCE_Z, Stratum, StratumEstimate, estimate_stratum, fill_totals, size_bucket
+from .report import CountReport
+
+# Files counted between looks at the clock,
+# few enough for threads to be picked
+BATCH_SIZE = 64
+# Cost of opening a file in bytes read,
+# small files are mostly that
+FILE_COST = 16 * 1024
+
+
+def _lines_per_byte(results: Sequence[Result]) -> float:
+    size = sum(file_size for _, file_size, *_ in results)
+    return sum(lines for lines, *_ in results if lines is not None) / size if size else 0.0
+
+
+def _extrapolated(files_count: int, size: int, sample: Sequence[Result]) -> StratumEstimate:
+    """
+    Estimate of a stratum with at least two counted files
+    (`sample`, a random sample of it): their exact totals
+    plus the rest of it at their lines per byte. Only the
+    rest is estimated, its variance is the spread of the
+    uncounted files around that ratio and the error of the
+    ratio itself.
+    """
+    n = len(sample)
+    text = [(lines, file_size) for lines, file_size, *_ in sample if lines is not None]
+    counted_lines = sum(lines for lines, _ in text)
+    counted_text_bytes = sum(file_size for _, file_size in text)
+    counted_bytes = sum(file_size for _, file_size, *_ in sample)
+    rest_count = files_count - n
+    rest_size = size - counted_bytes
+    ratio = counted_lines / counted_bytes if counted_bytes else 0.0
+    text_share = counted_text_bytes / counted_bytes if counted_bytes else 1.0
+    # Residuals of binary files are their
+    # size, they have no lines
+    residuals = sum(
+        ((lines if lines is not None else 0) - ratio * file_size) ** 2
+        for lines, file_size, *_ in sample
+    )
+    spread = residuals / (n - 1)
+    return StratumEstimate(
+        len(text) + rest_count * len(text) / n,
+        counted_lines + ratio * rest_size,
+        counted_text_bytes + text_share * rest_size,
+        rest_count * spread * (1 + rest_count / n)
+    )
+
+
+def _borrowed(files_count: int,
+              size: int,
+              sample: Sequence[Result],
+              donors: Sequence[Sequence[Result]]) -> StratumEstimate:
+    """
+    Estimate of a stratum with fewer than two counted files
+    (`sample`). The rest of it is estimated as the rest of a
+    stratum made of it and files counted in similar strata
+    (`donors`, results grouped by stratum). That variance holds
+    if the rest is like the donors, so the spread of lines per
+    byte between donor strata is added for it being different,
+    all of their lines per byte when there's one donor stratum.
+    Lines are at most one per byte, without donors they get
+    half of that with a margin covering the rest, and margins
+    of borrowed lines aren't wider than that.
+    """
+    text = [(lines, file_size) for lines, file_size, *_ in sample if lines is not None]
+    rest_count = files_count - len(sample)
+    rest_size = size - sum(file_size for _, file_size, *_ in sample)
+    unknown = (rest_size / (2 * CONFIDENCE_Z)) ** 2
+    results = [result for group in donors for result in group]
+    if not results:
+        rest = StratumEstimate(rest_count, rest_size / 2, rest_size, unknown)
+    else:
+        donors_text = [(lines, file_size) for lines, file_size, *_ in results if lines is not None]
+        estimate = estimate_stratum(
+            rest_count + len(results),
+            rest_size + sum(file_size for _, file_size, *_ in results),
+            results
+        )
+        ratios = [_lines_per_byte(group) for group in donors]
+        if len(ratios) > 1:
+            mean = sum(ratios) / len(ratios)
+            spread = sum((ratio - mean) ** 2 for ratio in ratios) / (len(ratios) - 1)
+        else:
+            spread = ratios[0] ** 2
+        rest = StratumEstimate(
+            estimate.files_count - len(donors_text),
+            estimate.lines - sum(lines for lines, _ in donors_text),
+            estimate.bytes - sum(file_size for _, file_size in donors_text),
+            min(estimate.variance + spread * rest_size ** 2, unknown)
+        )
+    return StratumEstimate(
+        rest.files_count + len(text),
+        rest.lines + sum(lines for lines, _ in text),
+        rest.bytes + sum(file_size for _, file_size in text),
+        rest.variance
+    )
+
+
+def budget_reports(engine,
+                   collectors: Sequence[FilesCollector],
+                   budget: float,
+                   keep_files: bool = True,
+                   progress: Callable[[], None] = None) -> List[CountReport]:
+    """
+    Reports counted within `budget` seconds. Files the cache
+    knows aren't read, then a few files of every stratum
+    (extension and size bucket) are counted smallest first so
+    that all of them can be estimated, then the rest by size
+    bucket, largest first. Files which can't be read in the
+    time left at the rate measured so far are skipped and
+    tried again later, one batch is counted however short the
+    budget is. Reports of roots which weren't counted in full
+    keep the counted files and their exact totals, plus ones
+    estimated for the uncounted files from the counted ones.
+    The walk stops at the deadline too, files it didn't reach
+    are unknown and reports of their roots are marked
+    truncated. Archives are counted in full.
+    """
+    import random
+    deadline = time.perf_counter() + budget
+    rng = random.Random(0)
+    files: List[File] = []
+    sizes: Dict[int, int] = {}
+    strata: Dict[Tuple[int, str, int], Stratum] = {}
+    truncated = [False] * len(collectors)
+    for root, collector in enumerate(collectors):
+        if collector.streamed:
+            continue
+        for file in collector:
+            if time.perf_counter() >= deadline:
+                truncated[root] = True
+                break
+            try:
+                size = os.stat(file.file_path).st_size
+            except OSError:
+                continue
+            file.root = root
+            key = (root, file.file_ext, size_bucket(size))
+            stratum = strata.get(key)
+            if stratum is None:
+                stratum = strata[key] = Stratum()
+            stratum.add(file, size, 0.0, rng)
+            files.append(file)
+            sizes[id(file)] = size
+
+    results: Dict[int, Result] = {}
+    queue = files
+    cache = engine.cache
+    if cache is not None:
+        queue = []
+        for file in files:
+            try:
+                results[id(file)] = cache.get(file, cache.key(file))
+            except KeyError:
+                queue.append(file)
+                continue
+            if progress is not None:
+                progress()
+        if engine.stats is not None:
+            engine.stats.add('cache_hits', len(results))
+
+    first = sorted(
+        (file for stratum in strata.values() for file in stratum.reservoir if id(file) not in results),
+        key=lambda file: sizes[id(file)]
+    )
+    chosen = {id(file) for file in first}
+    # Largest size buckets first, in random order within
+    # one so that counted files of a stratum are a random
+    # sample of it and the rest can be estimated from them
+    rest = sorted(
+        (file for file in queue if id(file) not in chosen),
+        key=lambda file: (-size_bucket(sizes[id(file)]), rng.random())
+    )
+
+    start = time.perf_counter()
+    scheduled_cost = 0
+    counted_cost = 0
+    counted_files = 0
+
+    def scheduled():
+        # Skipped files are tried again while others
+        # get counted, the rate is better known then
+        nonlocal scheduled_cost
+        pending = list(itertools.chain(first, rest))
+        while pending:
+            skipped = []
+            progressed = counted_files
+            for file in pending:
+                now = time.perf_counter()
+                # One batch is counted however short the budget
+                # is, so that there's something to estimate with
+                if now >= deadline and counted_files:
+                    return
+                # Files waiting to be read and this one
+                # have to fit into the time left
+                cost = sizes[id(file)] + FILE_COST
+                waiting = scheduled_cost - counted_cost + cost
+                if counted_cost and waiting * (now - start) > counted_cost * (deadline - now):
+                    skipped.append(file)
+                    continue
+                scheduled_cost += cost
+                yield file
+            if len(skipped) == len(pending) and counted_files == progressed:
+                return
+            pending = skipped
+
+    for file, result in engine.count_files(scheduled(), BATCH_SIZE):
+        results[id(file)] = result
+        counted_cost += sizes[id(file)] + FILE_COST
+        counted_files += 1
+        if progress is not None:
+            progress()
+
+    reports = []
+    for collector in collectors:
+        if collector.streamed:
+            reports.append(engine.reports([collector], keep_files=keep_files, progress=progress)[0])
+            continue
+        reports.append(CountReport(
+            folder_path=collector.folder_path,
+            extensions=collector.extensions,
+            ignore=collector.ignore,
+            keep_files=keep_files
+        ))
+
+    # Counted results of every stratum in walk order
+    counted: Dict[Tuple[int, str, int], List[Result]] = {}
+    files_count = [0] * len(collectors)
+    for file in files:
+        files_count[file.root] += 1
+        result = results.get(id(file))
+        if result is None:
+            continue
+        reports[file.root].add(file.file_path, file.file_ext, *result)
+        reports[file.root].sampled_files += 1
+        counted.setdefault((file.root, file.file_ext, size_bucket(sizes[id(file)])), []).append(result)
+
+    # Strata lend their results to others of the
+    # extension in the root, of the extension or any
+    similar: Dict[tuple, List[List[Result]]] = {}
+    for (root, file_ext, _), sample in counted.items():
+        similar.setdefault((root, file_ext), []).append(sample)
+        similar.setdefault((file_ext,), []).append(sample)
+    everything = list(counted.values())
+
+    estimates: List[Dict[str, List[StratumEstimate]]] = [{} for _ in collectors]
+    for (root, file_ext, bucket), stratum in strata.items():
+        if reports[root].sampled_files == files_count[root]:
+            continue
+        sample = counted.get((root, file_ext, bucket), [])
+        if len(sample) == stratum.files_count:
+            estimate = estimate_stratum(stratum.files_count, stratum.bytes, sample)
+        elif len(sample) > 1:
+            estimate = _extrapolated(stratum.files_count, stratum.bytes, sample)
+        else:
+            # One file tells nothing of the spread
+            donors = similar.get((root, file_ext)) or similar.get((file_ext,)) or everything
+            estimate = _borrowed(stratum.files_count, stratum.bytes, sample, donors)
+        estimates[root].setdefault(file_ext, []).append(estimate)
+
+    for root, report in enumerate(reports):
+        if not (estimates[root] or truncated[root]):
+            continue
+        report.estimated = True
+        report.partial = True
+        report.truncated = truncated[root]
+        if estimates[root]:
+            report.totals = {}
+            report.binary_files = round(files_count[root] - fill_totals(report, estimates[root]))
+    return reports
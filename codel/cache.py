@@ -0,0 +1,323 @@
+import os
+import struct
+from typing import Dict, Optional, Sequence, Tuple, Union
+from .collector import File
+from .config import CONFIG_FOLDER
+from .counter import Kinds
+
+CACHE_REL_PATH = 'cache.bin'
+CACHE_MAGIC = b'CODELC02'
+BLOB_CACHE_MAGIC = b'CODELB03'
+
+# size, mtime_ns, inode, lines, code,
+# comment, blank lines, path length
+_RECORD = struct.Struct('<QqQqqqqH')
+# Lines value stored for binary files
+_BINARY = -1
+# Stored in place of (code, comment, blank)
+# lines of files which weren't classified
+_UNCLASSIFIED = (-1, -1, -1)
+
+Key = Tuple[int, int, int]
+# Lines count (None for binary files) and size of
+# the file, optionally followed by (code, comment,
+# blank) lines when files are classified
+Result = Tuple
+
+
+def _atomic_write(path: str, data: bytes):
+    # Write to a temporary file and atomically
+    # replace the target so that concurrent runs
+    # never see a partially written file
+    import tempfile
+    folder = os.path.dirname(path)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.cache-')
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+
+def _kinds(result: Result) -> Kinds:
+    if len(result) < 3 or result[2] is None:
+        return _UNCLASSIFIED
+    return result[2]
+
+
+def _result(lines: int, size: int, kinds: Kinds, classified: bool) -> Optional[Result]:
+    # Cached entry as counting result, None when it
+    # has to be classified but it wasn't before
+    lines = None if lines == _BINARY else lines
+    if not classified:
+        return lines, size
+    if kinds == _UNCLASSIFIED:
+        return (lines, size, None) if lines is None else None
+    return lines, size, kinds
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def file_key(file_path: str) -> Optional[Key]:
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class CountCache:
+    """
+    Per-folder lines count cache stored in `.codel/`.
+
+    Entries are keyed by path relative to the folder
+    and (size, mtime_ns, inode) of the file. The file is
+    only written when entries were added, changed or
+    pruned, runs over an unchanged tree don't touch it.
+    """
+
+    # Whether equal keys mean equal content
+    content_addressed = False
+
+    def __init__(self, folder: str, load: bool = True):
+        self.folder = os.path.abspath(folder)
+        self.cache_path = os.path.join(self.folder, CONFIG_FOLDER, CACHE_REL_PATH)
+        self._entries: Dict[str, Tuple[Key, int, Kinds]] = {}
+        self._touched = set()
+        self._loaded_mtime = None
+        # Rebuilt caches replace the file
+        self._dirty = not load
+        self.hits = 0
+        self.misses = 0
+        if load:
+            self._entries = self._read()
+
+    def _relative(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.folder)
+
+    def _read(self) -> Dict[str, Tuple[Key, int, Kinds]]:
+        entries = {}
+        try:
+            with open(self.cache_path, 'rb') as f:
+                self._loaded_mtime = os.fstat(f.fileno()).st_mtime_ns
+                data = f.read()
+        except OSError:
+            return entries
+        if not data.startswith(CACHE_MAGIC):
+            return entries
+
+        offset = len(CACHE_MAGIC)
+        try:
+            while offset < len(data):
+                size, mtime_ns, inode, lines, *kinds, path_length = _RECORD.unpack_from(data, offset)
+                offset += _RECORD.size
+                path = data[offset:offset + path_length].decode('utf-8', 'surrogateescape')
+                offset += path_length
+                entries[path] = ((size, mtime_ns, inode), lines, tuple(kinds))
+        except struct.error:
+            # Truncated cache, use what was read
+            pass
+        return entries
+
+    def key(self, file: File) -> Optional[Key]:
+        return file_key(file.file_path)
+
+    def get(self, file: File, key: Optional[Key], classified: bool = False) -> Result:
+        # Returns cached lines count (None for binary files)
+        # and size or raises KeyError on a cache miss
+        path = self._relative(file.file_path)
+        self._touched.add(path)
+        entry = self._entries.get(path)
+        if key is None or entry is None or entry[0] != key:
+            self.misses += 1
+            raise KeyError(path)
+        result = _result(entry[1], key[0], entry[2], classified)
+        if result is None:
+            self.misses += 1
+            raise KeyError(path)
+        self.hits += 1
+        return result
+
+    def set(self, file: File, key: Optional[Key], result: Result):
+        path = self._relative(file.file_path)
+        self._touched.add(path)
+        lines, size = result[:2]
+        if key is None or size != key[0]:
+            # Changed while being counted
+            if self._entries.pop(path, None) is not None:
+                self._dirty = True
+            return
+        entry = (key, _BINARY if lines is None else lines, _kinds(result))
+        if self._entries.get(path) != entry:
+            self._entries[path] = entry
+            self._dirty = True
+
+    def _merged_entries(self) -> Dict[str, Tuple[Key, int, Kinds]]:
+        # Keep entries written by concurrent runs
+        # meanwhile unless they were updated here
+        entries = self._entries
+        mtime = _mtime(self.cache_path)
+        if mtime is not None and mtime != self._loaded_mtime:
+            entries = self._read()
+            for path in self._touched:
+                if path in self._entries:
+                    entries[path] = self._entries[path]
+                else:
+                    entries.pop(path, None)
+        return entries
+
+    def save(self):
+        entries = self._merged_entries()
+        # Prune entries of deleted files
+        kept = {
+            path: entry for path, entry in entries.items()
+            if path in self._touched or os.path.lexists(os.path.join(self.folder, path))
+        }
+        if not self._dirty and len(kept) == len(entries):
+            return
+        entries = kept
+        chunks = [CACHE_MAGIC]
+        for path, ((size, mtime_ns, inode), lines, kinds) in entries.items():
+            encoded = path.encode('utf-8', 'surrogateescape')
+            chunks.append(_RECORD.pack(size, mtime_ns, inode, lines, *kinds, len(encoded)))
+            chunks.append(encoded)
+
+        _atomic_write(self.cache_path, b''.join(chunks))
+        self._entries = entries
+        self._loaded_mtime = _mtime(self.cache_path)
+        self._dirty = False
+
+
+class BlobCache:
+    """
+    Lines count cache keyed by git blob hash. Blobs
+    are immutable, so entries never get stale.
+    """
+
+    content_addressed = True
+
+    def __init__(self, cache_path: str, hash_size: int = 20, load: bool = True):
+        self.cache_path = cache_path
+        self.hash_size = hash_size
+        # hash, lines, size, code, comment, blank lines
+        self._record = struct.Struct('<{}sqqqqq'.format(hash_size))
+        self._entries: Dict[bytes, Tuple[int, int, Kinds]] = {}
+        self._added: Dict[bytes, Tuple[int, int, Kinds]] = {}
+        self._loaded_mtime = None
+        self.hits = 0
+        self.misses = 0
+        if load:
+            self._entries = self._read()
+
+    def _read(self) -> Dict[bytes, Tuple[int, int, Kinds]]:
+        try:
+            with open(self.cache_path, 'rb') as f:
+                self._loaded_mtime = os.fstat(f.fileno()).st_mtime_ns
+                data = f.read()
+        except OSError:
+            return {}
+        if not data.startswith(BLOB_CACHE_MAGIC):
+            return {}
+        body = memoryview(data)[len(BLOB_CACHE_MAGIC):]
+        body = body[:len(body) - len(body) % self._record.size]
+        return {
+            sha: (lines, size, tuple(kinds))
+            for sha, lines, size, *kinds in self._record.iter_unpack(body)
+        }
+
+    def key(self, file: File) -> Optional[bytes]:
+        return file.blob_sha
+
+    def get(self, file: File, key: Optional[bytes], classified: bool = False) -> Result:
+        entry = self._entries.get(key) if key is not None else None
+        result = _result(*entry, classified) if entry is not None else None
+        if result is None:
+            self.misses += 1
+            raise KeyError(file.file_path)
+        self.hits += 1
+        return result
+
+    def set(self, file: File, key: Optional[bytes], result: Result):
+        if key is None:
+            return
+        lines, size = result[:2]
+        entry = (_BINARY if lines is None else lines, size, _kinds(result))
+        self._entries[key] = entry
+        self._added[key] = entry
+
+    def save(self):
+        if not self._added:
+            return
+        entries = self._entries
+        mtime = _mtime(self.cache_path)
+        if mtime is not None and mtime != self._loaded_mtime:
+            entries = self._read()
+            entries.update(self._added)
+        chunks = [BLOB_CACHE_MAGIC]
+        chunks.extend(
+            self._record.pack(sha, lines, size, *kinds)
+            for sha, (lines, size, kinds) in entries.items()
+        )
+        _atomic_write(self.cache_path, b''.join(chunks))
+        self._entries = entries
+        self._added = {}
+
+
+class CacheGroup:
+    """
+    Caches of several roots counted together. Files are
+    routed to the cache of the root they were collected from.
+    """
+
+    def __init__(self, caches: Sequence[Optional[Union[CountCache, BlobCache]]]):
+        self.caches = list(caches)
+        self.content_addressed = all(
+            cache is None or cache.content_addressed for cache in self.caches)
+
+    @property
+    def hits(self) -> int:
+        return sum(cache.hits for cache in self._unique())
+
+    @property
+    def misses(self) -> int:
+        return sum(cache.misses for cache in self._unique())
+
+    def _unique(self) -> list:
+        # Roots of one repository share its cache
+        unique = {}
+        for cache in self.caches:
+            if cache is not None:
+                unique[id(cache)] = cache
+        return list(unique.values())
+
+    def key(self, file: File):
+        cache = self.caches[file.root]
+        return cache.key(file) if cache is not None else None
+
+    def get(self, file: File, key, classified: bool = False) -> Result:
+        cache = self.caches[file.root]
+        if cache is None:
+            raise KeyError(file.file_path)
+        return cache.get(file, key, classified)
+
+    def set(self, file: File, key, result: Result):
+        cache = self.caches[file.root]
+        if cache is not None:
+            cache.set(file, key, result)
+
+    def save(self):
+        for cache in self._unique():
+            cache.save()
@@ -0,0 +1,232 @@
+import re
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Pattern, Tuple
+
+
+class Language(NamedTuple):
+    name: str
+    extensions: Tuple[str, ...]
+    # Markers starting comments to the end of the line
+    line_comments: Tuple[str, ...] = ()
+    # (start, end) pairs of block comments
+    block_comments: Tuple[Tuple[str, str], ...] = ()
+    # String delimiters, backslash escapes inside them
+    strings: Tuple[str, ...] = ('"', "'")
+    # Delimiters of strings which may span lines
+    multiline_strings: Tuple[str, ...] = ()
+
+
+_C_LIKE = dict(line_comments=('//',), block_comments=(('/*', '*/'),))
+
+LANGUAGES = [
+    Language('C', ('.c', '.h'), **_C_LIKE),
+    Language('C++', ('.cpp', '.cc', '.cxx', '.hpp', '.hh', '.hxx'), **_C_LIKE),
+    Language('C#', ('.cs',), **_C_LIKE),
+    Language('Java', ('.java',), **_C_LIKE),
+    Language('Kotlin', ('.kt', '.kts'), multiline_strings=('"""',), **_C_LIKE),
+    Language('Scala', ('.scala',), multiline_strings=('"""',), **_C_LIKE),
+    Language('Swift', ('.swift',), multiline_strings=('"""',), **_C_LIKE),
+    Language('Go', ('.go',), multiline_strings=('`',), **_C_LIKE),
+    Language('Rust', ('.rs',), strings=('"',), **_C_LIKE),
+    Language('JavaScript', ('.js', '.jsx', '.mjs', '.cjs'), multiline_strings=('`',), **_C_LIKE),
+    Language('TypeScript', ('.ts', '.tsx'), multiline_strings=('`',), **_C_LIKE),
+    Language('CSS', ('.css',), block_comments=(('/*', '*/'),)),
+    Language('SCSS', ('.scss', '.less'), **_C_LIKE),
+    Language('PHP', ('.php',), line_comments=('//', '#'), block_comments=(('/*', '*/'),)),
+    Language('Python', ('.py', '.pyw', '.pyi'), line_comments=('#',),
+             multiline_strings=('"""', "'''")),
+    Language('Ruby', ('.rb',), line_comments=('#',), block_comments=(('=begin', '=end'),)),
+    Language('Shell', ('.sh', '.bash', '.zsh'), line_comments=('#',)),
+    Language('Perl', ('.pl', '.pm'), line_comments=('#',)),
+    Language('R', ('.r', '.R'), line_comments=('#',)),
+    Language('YAML', ('.yml', '.yaml'), line_comments=('#',)),
+    Language('TOML', ('.toml',), line_comments=('#',)),
+    Language('Makefile', ('.mk',), line_comments=('#',), strings=()),
+    Language('SQL', ('.sql',), line_comments=('--',), block_comments=(('/*', '*/'),), strings=("'",)),
+    Language('Lua', ('.lua',), line_comments=('--',), block_comments=(('--[[', ']]'),)),
+    Language('Haskell', ('.hs',), line_comments=('--',), block_comments=(('{-', '-}'),), strings=('"',)),
+    Language('HTML', ('.html', '.htm', '.xml', '.vue', '.svg'), block_comments=(('<!--', '-->'),),
+             strings=()),
+    Language('Lisp', ('.lisp', '.el', '.clj', '.scm'), line_comments=(';',), strings=('"',)),
+    Language('Erlang', ('.erl', '.hrl'), line_comments=('%',), strings=('"',)),
+    Language('TeX', ('.tex', '.sty'), line_comments=('%',), strings=()),
+    Language('Vim script', ('.vim',), line_comments=('"',), strings=("'",)),
+]
+
+LANGUAGES_BY_EXTENSION: Dict[str, Language] = {
+    file_ext: language
+    for language in LANGUAGES
+    for file_ext in language.extensions
+}
+
+# Text kept while a block comment or a multiline string
+# isn't closed yet, longer ones make a file unclassified
+MAX_PENDING = 16 * 1024 * 1024
+
+# Whitespace only lines after the first one, starting
+# with a literal newline keeps the scan fast
+_BLANK = re.compile(rb'\n[ \t\r\f\v]*(?=\n)')
+_FIRST_BLANK = re.compile(rb'[ \t\r\f\v]*\n')
+
+
+def _string_regex(delimiter: str, multiline: bool) -> str:
+    # Unrolled loops, much faster than an
+    # alternation per character in `re`
+    first = re.escape(delimiter[0])
+    inner = r'\\[\s\S]' if multiline else r'\\[^\n]'
+    if len(delimiter) > 1:
+        # Delimiter characters not starting its end
+        inner += r'|{}(?!{})'.format(first, re.escape(delimiter[1:]))
+    plain = r'[^{}\\]*' if multiline else r'[^{}\\\n]*'
+    plain = plain.format(first)
+    end = r'(?:{}|\Z)' if multiline else '{}'
+    return r'{0}{1}(?:(?:{2}){1})*{3}'.format(
+        re.escape(delimiter), plain, inner, end.format(re.escape(delimiter))
+    )
+
+
+@lru_cache(maxsize=None)
+def _language_regex(file_ext: str) -> Optional[Pattern]:
+    """
+    One regex per language matching its strings and comments,
+    the state machine of the language is compiled into it.
+    Strings only have to be matched to skip comment markers
+    inside them. Longer delimiters come first to win.
+    """
+    language = LANGUAGES_BY_EXTENSION.get(file_ext)
+    if language is None:
+        return None
+
+    strings = [
+        _string_regex(delimiter, multiline=True)
+        for delimiter in sorted(language.multiline_strings, key=len, reverse=True)
+    ]
+    strings += [
+        _string_regex(delimiter, multiline=False)
+        for delimiter in sorted(language.strings, key=len, reverse=True)
+    ]
+    comments = [
+        r'{}[\s\S]*?(?:{}|\Z)'.format(re.escape(start), re.escape(end))
+        for start, end in sorted(language.block_comments, key=lambda pair: -len(pair[0]))
+    ]
+    comments += [
+        r'{}[^\n]*'.format(re.escape(marker))
+        for marker in sorted(language.line_comments, key=len, reverse=True)
+    ]
+
+    # Block comments go first so that markers like `--[[`
+    # win over line comments sharing their prefix
+    if not comments:
+        return None
+    alternatives = ['(?P<c>{})'.format('|'.join(comments))]
+    if strings:
+        alternatives.append('|'.join(strings))
+    return re.compile('|'.join(alternatives).encode('ascii'))
+
+
+def _strip_comment(match) -> bytes:
+    # Comments keep their newlines to keep line
+    # numbers, strings are code and stay as they are
+    if match.lastgroup == 'c':
+        return b'\n' * match.group().count(b'\n')
+    return match.group()
+
+
+class Classifier:
+    """
+    Splits lines of text fed in chunks into code, comment and
+    blank ones. Complete lines are classified as they come,
+    the regex state between them is plain code unless a block
+    comment or multiline string isn't closed by the end of a
+    chunk, lines from where it starts are kept until it is.
+    Memory is bounded by the chunks and MAX_PENDING, text
+    with longer unclosed spans isn't classified.
+    """
+
+    def __init__(self, file_ext: str):
+        self.known = file_ext in LANGUAGES_BY_EXTENSION
+        self._regex = _language_regex(file_ext)
+        self._pending = b''
+        self._blank = 0
+        # Lines without code
+        self._not_code = 0
+        self._last_span = None
+
+    def _strip(self, match) -> bytes:
+        self._last_span = match.span()
+        return _strip_comment(match)
+
+    def _add(self, text: bytes, stripped: bytes = None):
+        # Complete lines ending with a newline
+        if stripped is None:
+            stripped = self._regex.sub(_strip_comment, text) if self._regex is not None else text
+        self._blank += _blank_count(text)
+        self._not_code += _blank_count(stripped)
+
+    def _safe_end(self, text: bytes, end: int) -> int:
+        # Start of the line where the span left open at the
+        # end starts, moved up while a span crosses it
+        spans = [match.span() for match in self._regex.finditer(text)]
+        cut = text.rfind(b'\n', 0, spans[-1][0]) + 1
+        for start, span_end in reversed(spans[:-1]):
+            if span_end <= cut:
+                break
+            if start < cut:
+                cut = text.rfind(b'\n', 0, start) + 1
+        return cut
+
+    def feed(self, data: bytes):
+        if not self.known:
+            return
+        data = self._pending + data if self._pending else data
+        end = data.rfind(b'\n') + 1
+        text = data[:end]
+        if self._regex is None:
+            self._add(text, text)
+        else:
+            self._last_span = None
+            stripped = self._regex.sub(self._strip, text)
+            if self._last_span is None or self._last_span[1] < end:
+                self._add(text, stripped)
+            else:
+                # Matches ending with the text reached its end
+                # instead of their closing delimiter
+                end = self._safe_end(text, end)
+                self._add(data[:end])
+        self._pending = data[end:]
+        if len(self._pending) > MAX_PENDING:
+            self.known = False
+            self._pending = b''
+
+    def close(self, lines: int) -> Optional[Tuple[int, int, int]]:
+        # (code, comment, blank) lines of the text, None
+        # for languages which aren't known
+        if not self.known:
+            return None
+        if self._pending:
+            # Comments may leave nothing of the last line
+            self._add(self._pending if self._pending.endswith(b'\n') else self._pending + b'\n')
+            self._pending = b''
+        blank = min(self._blank, lines)
+        code = lines - min(self._not_code, lines)
+        return code, lines - code - blank, blank
+
+
+def classify(data: bytes, file_ext: str, lines: int) -> Optional[Tuple[int, int, int]]:
+    """
+    Split `lines` lines of the text into (code, comment, blank)
+    lines. Blank lines have nothing but whitespace, comment ones
+    have comments and no code. Returns None for languages
+    which aren't known.
+    """
+    classifier = Classifier(file_ext)
+    classifier.feed(data)
+    return classifier.close(lines)
+
+
+def _blank_count(data: bytes) -> int:
+    # Expects text ending with a newline
+    blank = len(_BLANK.findall(data))
+    if _FIRST_BLANK.match(data):
+        blank += 1
+    return blank
@@ -1,10 +1,14 @@
 import argparse
 import os
-from .collector import FilesCollector
-from .style import DefaultStylizer
-from .config import UnifiedConfiguration
-from typing import List
-from colored import attr, fg
+import sys
+from .constants import (
+    BACKENDS, DEFAULT_FRACTION, DIFF_FORMATS, FORMATS, HISTORY_FORMATS, SPLIT_THRESHOLD, WATCH_FORMATS,
+    WORKLOAD_NAMES
+)
+from typing import List, Optional, Tuple
+
+# Modules of subcommands are imported in their
+# branches, `count` doesn't pay for the others
 
 
 def _setup_config_parser(subparsers: argparse._SubParsersAction):
@@ -56,27 +60,610 @@ def _setup_count_parser(subparsers: argparse._SubParsersAction):
     )
     count_parser.add_argument(
         '-f', '--folder',
-        help='folder to work with.',
-        default=os.getcwd()
+        nargs='+',
+        help='folders or tar/zip archives to work with (current folder by default).',
+        required=False
+    )
+    count_parser.add_argument(
+        '--roots-file',
+        help='file listing folders or archives to work with, one per line (- for stdin).',
+        required=False
     )
     count_parser.add_argument(
         '-s', '--short',
         help='enable short output.',
         action='store_true'
     )
+    count_parser.add_argument(
+        '--by-dir',
+        help='show lines of every directory subtree instead of files.',
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--depth',
+        help='deepest directory level shown by --by-dir (all by default).',
+        type=int,
+        default=None
+    )
+    count_parser.add_argument(
+        '--top',
+        help='show only the N files (or directories at --depth with --by-dir) with most lines.',
+        type=int,
+        default=None,
+        metavar='N'
+    )
+    count_parser.add_argument(
+        '--format',
+        help='output format (json, ndjson and csv are free of colors).',
+        choices=('text',) + FORMATS,
+        default='text'
+    )
+    count_parser.add_argument(
+        '-o', '--output',
+        help='file to write the result to instead of stdout.',
+        required=False
+    )
+    count_parser.add_argument(
+        '-j', '--jobs',
+        help='number of workers to count lines with (CPU count by default).',
+        type=int,
+        default=None
+    )
+    count_parser.add_argument(
+        '-b', '--backend',
+        help='counting backend.',
+        choices=BACKENDS,
+        default='auto'
+    )
+    count_parser.add_argument(
+        '--split-size',
+        help='size in MB from which files are counted by byte ranges on all workers (0 disables it).',
+        type=int,
+        default=SPLIT_THRESHOLD // (1024 * 1024)
+    )
+    count_parser.add_argument(
+        '--git',
+        help='count files tracked in the git index instead of walking the folder.',
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--no-gitignore',
+        help="don't apply .gitignore files found in the folder.",
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--no-cache',
+        help="don't read or write the lines count cache.",
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--rebuild-cache',
+        help='ignore the lines count cache and write it from scratch.',
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '-c', '--classify',
+        help='split lines into code, comment and blank ones for known languages.',
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--estimate',
+        help='estimate lines from a sample of files, the given share of them (0.05 by default).',
+        nargs='?',
+        type=float,
+        const=DEFAULT_FRACTION,
+        default=None,
+        metavar='FRACTION'
+    )
+    count_parser.add_argument(
+        '--time-budget',
+        help='stop counting after this many seconds, estimating lines of files left.',
+        type=float,
+        required=False,
+        metavar='SECONDS'
+    )
+    count_parser.add_argument(
+        '--dedup',
+        help='count every content once and show the largest groups of identical files.',
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--no-daemon',
+        help="count locally even if `codel serve` is running.",
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--stats',
+        help='print counters and per phase timings to stderr.',
+        action='store_true'
+    )
+    count_parser.add_argument(
+        '--profile',
+        help='write a cProfile file, or a Chrome trace when the name ends with .json.',
+        required=False
+    )
     count_parser.add_argument(
         '-m', '--multiproc',
-        help='enable multiprocessing.',
+        help='enable multiprocessing (same as --backend process).',
         action='store_true'
     )
 
 
+def _setup_watch_parser(subparsers: argparse._SubParsersAction):
+    watch_parser = subparsers.add_parser('watch')
+    watch_parser.add_argument(
+        '-e', '--extensions',
+        nargs='+',
+        help='file extensions to count lines for.',
+        required=False
+    )
+    watch_parser.add_argument(
+        '-i', '--ignore',
+        nargs='+',
+        help='patterns to ignore (gitignore-like).',
+        required=False
+    )
+    watch_parser.add_argument(
+        '-f', '--folder',
+        help='folder to work with.',
+        default=os.getcwd()
+    )
+    watch_parser.add_argument(
+        '-s', '--short',
+        help='enable short output.',
+        action='store_true'
+    )
+    watch_parser.add_argument(
+        '--format',
+        help='output format, ndjson emits changed files and totals on every update.',
+        choices=WATCH_FORMATS,
+        default='text'
+    )
+    watch_parser.add_argument(
+        '--debounce',
+        help='seconds without changes to wait for before recounting.',
+        type=float,
+        default=0.2
+    )
+    watch_parser.add_argument(
+        '--poll',
+        help='poll the folder for changes instead of using inotify.',
+        action='store_true'
+    )
+    watch_parser.add_argument(
+        '--interval',
+        help='seconds between polls.',
+        type=float,
+        default=1.0
+    )
+    watch_parser.add_argument(
+        '-j', '--jobs',
+        help='number of workers for the initial count.',
+        type=int,
+        default=None
+    )
+    watch_parser.add_argument(
+        '--no-gitignore',
+        help="don't apply .gitignore files found in the folder.",
+        action='store_true'
+    )
+    watch_parser.add_argument(
+        '--no-cache',
+        help="don't use the lines count cache for the initial count.",
+        action='store_true'
+    )
+
+
+def _setup_history_parser(subparsers: argparse._SubParsersAction):
+    history_parser = subparsers.add_parser('history')
+    history_parser.add_argument(
+        '-e', '--extensions',
+        nargs='+',
+        help='file extensions to count lines for.',
+        required=False
+    )
+    history_parser.add_argument(
+        '-i', '--ignore',
+        nargs='+',
+        help='patterns to ignore (gitignore-like).',
+        required=False
+    )
+    history_parser.add_argument(
+        '-f', '--folder',
+        help='folder to work with.',
+        default=os.getcwd()
+    )
+    history_parser.add_argument(
+        '-r', '--rev',
+        help='revision to walk first parents back from.',
+        default='HEAD'
+    )
+    history_parser.add_argument(
+        '--since',
+        help='skip commits older than this date (ISO format or unix timestamp).',
+        required=False
+    )
+    history_parser.add_argument(
+        '--every',
+        help='count every Nth commit.',
+        type=int,
+        default=1
+    )
+    history_parser.add_argument(
+        '--format',
+        help='output format (json, ndjson and csv are free of colors).',
+        choices=('text',) + HISTORY_FORMATS,
+        default='text'
+    )
+    history_parser.add_argument(
+        '-o', '--output',
+        help='file to write the result to instead of stdout.',
+        required=False
+    )
+    history_parser.add_argument(
+        '--no-gitignore',
+        help="don't apply .gitignore files found in the folder.",
+        action='store_true'
+    )
+    history_parser.add_argument(
+        '--no-cache',
+        help="don't read or write the blob lines count cache.",
+        action='store_true'
+    )
+
+
+def _setup_diff_parser(subparsers: argparse._SubParsersAction):
+    diff_parser = subparsers.add_parser('diff')
+    diff_parser.add_argument(
+        'before',
+        help='folder or git revision to compare from.'
+    )
+    diff_parser.add_argument(
+        'after',
+        help='folder or git revision to compare to (folders win over revisions of the same name).'
+    )
+    diff_parser.add_argument(
+        '-e', '--extensions',
+        nargs='+',
+        help='file extensions to count lines for.',
+        required=False
+    )
+    diff_parser.add_argument(
+        '-i', '--ignore',
+        nargs='+',
+        help='patterns to ignore (gitignore-like).',
+        required=False
+    )
+    diff_parser.add_argument(
+        '-f', '--folder',
+        help='folder whose repository revisions are read from.',
+        default=os.getcwd()
+    )
+    diff_parser.add_argument(
+        '-s', '--short',
+        help='show only changes per extension.',
+        action='store_true'
+    )
+    diff_parser.add_argument(
+        '--format',
+        help='output format (json, ndjson and csv are free of colors).',
+        choices=('text',) + DIFF_FORMATS,
+        default='text'
+    )
+    diff_parser.add_argument(
+        '-o', '--output',
+        help='file to write the result to instead of stdout.',
+        required=False
+    )
+    diff_parser.add_argument(
+        '-j', '--jobs',
+        help='number of workers counting changed files of folders.',
+        type=int,
+        required=False
+    )
+    diff_parser.add_argument(
+        '--no-gitignore',
+        help="don't apply .gitignore files found in the folder.",
+        action='store_true'
+    )
+    diff_parser.add_argument(
+        '--no-cache',
+        help="don't read or write lines count caches.",
+        action='store_true'
+    )
+
+
+def _setup_serve_parser(subparsers: argparse._SubParsersAction):
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument(
+        '--socket',
+        help='unix socket to listen on (per user one in the runtime directory by default).',
+        required=False
+    )
+    serve_parser.add_argument(
+        '--poll',
+        help='revalidate files by stat data instead of using inotify.',
+        action='store_true'
+    )
+    serve_parser.add_argument(
+        '--interval',
+        help='seconds between walks of indexed folders when polling.',
+        type=float,
+        default=1.0
+    )
+    serve_parser.add_argument(
+        '--rescan',
+        help='make the running server count its indexed folders again.',
+        action='store_true'
+    )
+    serve_parser.add_argument(
+        '--status',
+        help='print whether the server is running and which folders it has indexed.',
+        action='store_true'
+    )
+    serve_parser.add_argument(
+        '--stop',
+        help='stop the running server.',
+        action='store_true'
+    )
+
+
+def _setup_bench_parser(subparsers: argparse._SubParsersAction):
+    bench_parser = subparsers.add_parser('bench')
+    bench_parser.add_argument(
+        '-w', '--workloads',
+        nargs='+',
+        help='workloads to run (all by default).',
+        choices=list(WORKLOAD_NAMES),
+        required=False
+    )
+    bench_parser.add_argument(
+        '--scale',
+        help='size of generated trees relative to the full workloads.',
+        type=float,
+        default=0.1
+    )
+    bench_parser.add_argument(
+        '-r', '--repeat',
+        help='number of runs per cache state, the best one is reported.',
+        type=int,
+        default=3
+    )
+    bench_parser.add_argument(
+        '-j', '--jobs',
+        help='number of workers to count lines with.',
+        type=int,
+        default=None
+    )
+    bench_parser.add_argument(
+        '-b', '--backend',
+        help='counting backend.',
+        choices=BACKENDS,
+        default='auto'
+    )
+    bench_parser.add_argument(
+        '--root',
+        help='folder to generate trees in (temporary by default).',
+        required=False
+    )
+    bench_parser.add_argument(
+        '--keep',
+        help="don't remove generated trees.",
+        action='store_true'
+    )
+    bench_parser.add_argument(
+        '--drop-caches',
+        help='drop page cache of the whole system for cold runs (needs root), '
+             'only files of generated trees are evicted otherwise.',
+        action='store_true'
+    )
+    bench_parser.add_argument(
+        '-o', '--output',
+        help='file to write JSON results to.',
+        required=False
+    )
+    bench_parser.add_argument(
+        '--compare',
+        help='JSON results of a previous run to compare with.',
+        required=False
+    )
+
+
+def _read_roots(args: argparse.Namespace) -> List[str]:
+    roots = list(args.folder) if args.folder else []
+    if args.roots_file:
+        stream = sys.stdin if args.roots_file == '-' else open(args.roots_file)
+        try:
+            for line in stream:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    roots.append(line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    if not roots and not args.roots_file:
+        roots = [os.getcwd()]
+
+    # Every root is counted once
+    unique = []
+    for root in roots:
+        root = os.path.abspath(root)
+        if root not in unique:
+            unique.append(root)
+    return unique
+
+
+def _root_options(args: argparse.Namespace, root: str) -> Tuple[List[str], List[str]]:
+    # Flags override configuration of the root,
+    # which is only read when something is missing
+    ignore = args.ignore
+    extensions = args.extensions
+    if ignore is None or extensions is None:
+        from .archive import is_archive
+        from .config import UnifiedConfiguration, parse_list
+        # Archives use configuration of their folder
+        folder = os.path.dirname(root) if is_archive(root) else root
+        defaults = UnifiedConfiguration(folder, read_only=True)['DEFAULT']
+        if ignore is None:
+            ignore = parse_list(defaults['ignore']) if 'ignore' in defaults else []
+        if extensions is None:
+            if 'extensions' not in defaults:
+                raise ValueError("Couldn't clarify extensions to count for.")
+            extensions = parse_list(defaults['extensions'])
+    return extensions, ignore
+
+
+def _keep_files(args: argparse.Namespace) -> bool:
+    # Rollups are kept by reports while counting
+    return not (args.short or args.by_dir or args.top)
+
+
+def _top_files(args: argparse.Namespace) -> Optional[int]:
+    # --top of --by-dir is about directories
+    return args.top if not args.by_dir else None
+
+
+def _count_with_server(args: argparse.Namespace,
+                       root_options: List[Tuple[str, List[str], List[str]]]) -> Optional[List['CountReport']]:
+    # Reports from a running `codel serve`,
+    # None to count locally instead
+    from .client import query_count
+    reports = []
+    for root, extensions, ignore in root_options:
+        report = query_count(
+            root,
+            extensions,
+            ignore,
+            gitignore=not args.no_gitignore,
+            keep_files=_keep_files(args),
+            top_files=_top_files(args),
+            by_directory=args.by_dir
+        )
+        if report is None:
+            return None
+        reports.append(report)
+    return reports
+
+
+def _count_locally(args: argparse.Namespace,
+                   root_options: List[Tuple[str, List[str], List[str]]],
+                   backend: str,
+                   stats: Optional['Stats']) -> List['CountReport']:
+    from .archive import ArchiveCollector, ArchiveError, is_archive
+    from .cache import BlobCache, CacheGroup, CountCache
+    from .collector import FilesCollector
+    from .engine import CountingEngine
+    from .utils import empty_content
+    collectors = []
+    for root, extensions, ignore in root_options:
+        if is_archive(root):
+            collector = ArchiveCollector(
+                archive_path=root,
+                ignore=ignore,
+                extensions=extensions,
+                stats=stats
+            )
+        elif args.git:
+            from .git import GitError, GitFilesCollector
+            try:
+                collector = GitFilesCollector(
+                    folder_path=root,
+                    ignore=ignore,
+                    extensions=extensions,
+                    stats=stats
+                )
+            except GitError as e:
+                print(e)
+                exit(-1)
+        else:
+            collector = FilesCollector(
+                folder_path=root,
+                ignore=ignore,
+                extensions=extensions,
+                gitignore=not args.no_gitignore,
+                stats=stats
+            )
+        collectors.append(collector)
+
+    caches = []
+    blob_caches = {}
+    for collector in collectors:
+        if args.no_cache or collector.streamed:
+            cache = None
+        elif args.git:
+            # Roots of one repository share its cache
+            repository = collector.repository
+            cache = blob_caches.get(repository.blob_cache_path)
+            if cache is None:
+                cache = blob_caches[repository.blob_cache_path] = BlobCache(
+                    cache_path=repository.blob_cache_path,
+                    hash_size=repository.hash_size,
+                    load=not args.rebuild_cache
+                )
+        else:
+            cache = CountCache(
+                folder=collector.folder_path,
+                load=not args.rebuild_cache
+            )
+        caches.append(cache)
+
+    cache = caches[0]
+    if len(caches) > 1 and not args.no_cache:
+        cache = CacheGroup(caches)
+    engine = CountingEngine(
+        backend=backend,
+        jobs=args.jobs,
+        cache=cache,
+        stats=stats,
+        classify=args.classify,
+        split_size=args.split_size * 1024 * 1024,
+        dedup=args.dedup
+    )
+
+    # Progress is only drawn for a terminal, hooks and
+    # pipes don't pay for importing and updating tqdm
+    progress_bar = None
+    if sys.stderr.isatty():
+        from tqdm import tqdm
+        progress_bar = tqdm()
+    progress = progress_bar.update if progress_bar is not None else None
+    try:
+        with stats.phase('report') if stats is not None else empty_content():
+            if args.estimate is not None:
+                from .estimate import estimate_reports
+                reports = estimate_reports(engine, collectors, args.estimate, progress=progress)
+            elif args.time_budget is not None:
+                from .budget import budget_reports
+                reports = budget_reports(
+                    engine, collectors, args.time_budget, keep_files=_keep_files(args), progress=progress)
+            else:
+                reports = engine.reports(
+                    collectors,
+                    keep_files=_keep_files(args),
+                    progress=progress,
+                    top_files=_top_files(args),
+                    by_directory=args.by_dir
+                )
+    except ArchiveError as e:
+        print(e)
+        exit(-1)
+    finally:
+        if progress_bar is not None:
+            progress_bar.close()
+    return reports
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers(dest='command')
 
     _setup_count_parser(subparsers)
     _setup_config_parser(subparsers)
+    _setup_watch_parser(subparsers)
+    _setup_history_parser(subparsers)
+    _setup_diff_parser(subparsers)
+    _setup_serve_parser(subparsers)
+    _setup_bench_parser(subparsers)
 
     args = parser.parse_args()
     return args
@@ -84,14 +671,23 @@ def parse_args():
 
 def cli():
     args = parse_args()
-    config = UnifiedConfiguration()
 
     if args.command == 'config':
+        from .config import UnifiedConfiguration, format_list
+        from .utils import attr, fg
+        # Only changes write configuration files back
+        config = UnifiedConfiguration(read_only=args.list)
         if args.list:
             print(config)
             return
 
-        config = config.user_config if args.use_global else config.folder_config
+        # Leave the other configuration untouched
+        if args.use_global:
+            config.folder_config.auto_commit = False
+            config = config.user_config
+        else:
+            config.user_config.auto_commit = False
+            config = config.folder_config
 
         if args.delete:
             for option in args.delete:
@@ -107,49 +703,292 @@ def cli():
             return
 
         if args.extensions is not None:
-            config['DEFAULT']['extensions'] = str(args.extensions)
+            config['DEFAULT']['extensions'] = format_list(args.extensions)
 
         if args.ignore is not None:
-            config['DEFAULT']['ignore'] = str(args.ignore)
+            config['DEFAULT']['ignore'] = format_list(args.ignore)
 
     elif args.command == 'count':
-        # Items to ignore
-        ignore: List[str]
-        if args.ignore is None:
-            defaults = config['DEFAULT']
-            if 'ignore' in defaults:
-                ignore = eval(defaults['ignore'])
-            else:
-                ignore = []
-        else:
-            ignore = args.ignore
-
-        # Extensions to count for
-        extensions: List[str]
-        if args.extensions is None:
-            defaults = config['DEFAULT']
-            if 'extensions' in defaults:
-                extensions = eval(defaults['extensions'])
-            else:
-                print("Couldn't clarify extensions to count for.")
+        from .archive import is_archive
+        from .report import CountReport, RootsReport
+        from .stats import Stats
+        from .style import DefaultStylizer, DirectoryStylizer, RootsStylizer, TopFilesStylizer
+        from .utils import empty_content
+        # Instrumentation is only
+        # set up when asked for
+        trace = bool(args.profile) and args.profile.endswith('.json')
+        stats = Stats(trace=trace) if args.stats or trace else None
+        profiler = None
+        if args.profile and not trace:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        roots = _read_roots(args)
+        if not roots:
+            print('No folders to count lines in.')
+            exit(-1)
+
+        if args.dedup and args.classify:
+            print("--dedup can't be used with --classify.")
+            exit(-1)
+        if (args.top is not None and args.top < 1) or (args.depth is not None and args.depth < 0):
+            print('--top should be positive and --depth not negative.')
+            exit(-1)
+        if args.estimate is not None:
+            if args.by_dir or args.top:
+                print("--estimate can't be used with --by-dir or --top.")
                 exit(-1)
-        else:
-            extensions = args.extensions
-        multiproc = args.multiproc
+            if not 0 < args.estimate <= 1:
+                print('Estimate fraction should be in (0, 1].')
+                exit(-1)
+            if args.dedup or args.classify:
+                print("--estimate can't be used with --dedup or --classify.")
+                exit(-1)
+        if args.time_budget is not None:
+            if args.time_budget <= 0:
+                print('--time-budget should be positive.')
+                exit(-1)
+            if args.estimate is not None or args.dedup or args.classify or args.by_dir or args.top:
+                print("--time-budget can't be used with --estimate, --dedup, --classify, --by-dir or --top.")
+                exit(-1)
+
+        backend = args.backend
+        if args.multiproc:
+            if args.format == 'text':
+                print('Using multiprocessing mode...')
+            backend = 'process'
+
+        root_options = []
+        for root in roots:
+            try:
+                root_options.append((root,) + _root_options(args, root))
+            except ValueError as e:
+                print(e if len(roots) == 1 else '{}: {}'.format(root, e))
+                exit(-1)
+
+        # Keep machine readable output clean
+        if args.format == 'text':
+            print('Counting lines')
 
-        if multiproc:
-            print('Using multiprocessing mode...')
+        output = open(args.output, 'w', newline='') if args.output else sys.stdout
+        try:
+            # Header of one folder only needs its options,
+            # it's written before counting starts
+            header_stylizer = None
+            if args.format == 'text' and not (args.by_dir or args.top) and len(root_options) == 1:
+                header_stylizer = DefaultStylizer(short=args.short)
+                header_stylizer.write_header(CountReport(*root_options[0]), output)
+                output.flush()
 
+            reports = None
+            local_only = args.no_daemon or args.git or args.no_cache or args.rebuild_cache
+            local_only = local_only or any(is_archive(root) for root in roots)
+            if not (local_only or args.classify or args.dedup or args.estimate or args.time_budget or stats):
+                reports = _count_with_server(args, root_options)
+            if reports is None:
+                reports = _count_locally(args, root_options, backend, stats)
+            report = reports[0] if len(reports) == 1 else RootsReport(reports)
+
+            with stats.phase('render') if stats is not None else empty_content():
+                if (args.by_dir or args.top) and args.format != 'text':
+                    from .rollup import write_rollup
+                    write_rollup(reports, output, args.format, args.by_dir, args.depth, args.top)
+                elif header_stylizer is not None:
+                    header_stylizer.write_body(report, output)
+                    output.write('\n')
+                elif args.format == 'text':
+                    if args.by_dir:
+                        stylizer = DirectoryStylizer(depth=args.depth, top=args.top)
+                    elif args.top:
+                        stylizer = TopFilesStylizer(args.top)
+                    else:
+                        stylizer = RootsStylizer(short=args.short)
+                    stylizer.write(report, output)
+                    output.write('\n')
+                else:
+                    report.write(output, args.format)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if trace:
+            with open(args.profile, 'w') as f:
+                stats.write_trace(f)
+        if args.stats:
+            sys.stderr.write(str(stats) + '\n')
+
+    elif args.command == 'watch':
+        from .cache import CountCache
+        from .collector import FilesCollector
+        from .engine import CountingEngine
+        from .watch import watch
+        folder = os.path.abspath(args.folder)
+        try:
+            extensions, ignore = _root_options(args, folder)
+        except ValueError as e:
+            print(e)
+            exit(-1)
         collector = FilesCollector(
-            folder_path=args.folder,
+            folder_path=folder,
             ignore=ignore,
             extensions=extensions,
-            multiproc=multiproc
+            gitignore=not args.no_gitignore
         )
-        stylizer = DefaultStylizer(
-            short=args.short
+        cache = None if args.no_cache else CountCache(folder=folder)
+        try:
+            watch(
+                collector,
+                engine=CountingEngine(jobs=args.jobs, cache=cache),
+                format=args.format,
+                debounce=args.debounce,
+                poll=args.poll,
+                interval=args.interval,
+                short=args.short
+            )
+        except KeyboardInterrupt:
+            pass
+
+    elif args.command == 'history':
+        from .cache import BlobCache
+        from .collector import FilesCollector
+        from .git import GitError, Repository
+        from .history import History, HistoryReport, parse_time
+        from .style import HistoryStylizer
+        folder = os.path.abspath(args.folder)
+        try:
+            extensions, ignore = _root_options(args, folder)
+            since = parse_time(args.since) if args.since else None
+        except ValueError as e:
+            print(e)
+            exit(-1)
+        collector = FilesCollector(
+            folder_path=folder,
+            ignore=ignore,
+            extensions=extensions,
+            gitignore=not args.no_gitignore
+        )
+        try:
+            repository = Repository(folder)
+            cache = None
+            if not args.no_cache:
+                cache = BlobCache(repository.blob_cache_path, hash_size=repository.hash_size)
+            history = History(collector, cache)
+            try:
+                points = list(history.points(args.rev, since=since, every=args.every))
+            finally:
+                history.close()
+        except GitError as e:
+            print(e)
+            exit(-1)
+        report = HistoryReport(folder, extensions, ignore, points)
+
+        output = open(args.output, 'w', newline='') if args.output else sys.stdout
+        try:
+            if args.format == 'text':
+                HistoryStylizer().write(report, output)
+            else:
+                report.write(output, args.format)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    elif args.command == 'diff':
+        from .diff import Differ
+        from .git import GitError
+        from .style import DiffStylizer
+        folder = os.path.abspath(args.folder)
+        try:
+            extensions, ignore = _root_options(args, folder)
+        except ValueError as e:
+            print(e)
+            exit(-1)
+        differ = Differ(
+            folder,
+            extensions,
+            ignore,
+            gitignore=not args.no_gitignore,
+            use_cache=not args.no_cache,
+            jobs=args.jobs
+        )
+        try:
+            report = differ.diff(args.before, args.after, keep_files=not args.short or args.format != 'text')
+        except GitError as e:
+            print(e)
+            exit(-1)
+        finally:
+            differ.close()
+
+        output = open(args.output, 'w', newline='') if args.output else sys.stdout
+        try:
+            if args.format == 'text':
+                DiffStylizer(short=args.short).write(report, output)
+            else:
+                report.write(output, args.format)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    elif args.command == 'serve':
+        from .client import ServerError, ping, request, socket_path
+        path = args.socket if args.socket else socket_path()
+        if args.status or args.stop or args.rescan:
+            status = ping(path)
+            if status is None:
+                print('Server is not running.')
+                exit(-1)
+            if args.stop:
+                request({'command': 'stop'}, path)
+                print('Server stopped.')
+            elif args.rescan:
+                response = request({'command': 'rescan'}, path)
+                print('Rescanned {} indexes.'.format(response['indexes']))
+            else:
+                print('Server is running at {} (pid {}).'.format(path, status['pid']))
+                for folder in status['indexes']:
+                    print(folder)
+            return
+
+        from .server import CountServer
+        try:
+            server = CountServer(path, poll=args.poll, interval=args.interval)
+        except ServerError as e:
+            print(e)
+            exit(-1)
+        print('Listening at {}'.format(path))
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+
+    elif args.command == 'bench':
+        import json
+        from .bench import compare_results, estimate_failures, format_results, run_benchmarks, write_results
+        results = run_benchmarks(
+            workloads=args.workloads,
+            scale=args.scale,
+            repeat=args.repeat,
+            jobs=args.jobs,
+            backend=args.backend,
+            root=args.root,
+            keep=args.keep,
+            drop_caches=args.drop_caches
         )
-        print(stylizer.apply(collector))
+        print(format_results(results))
+        if args.output:
+            with open(args.output, 'w') as f:
+                write_results(results, f)
+        if args.compare:
+            with open(args.compare) as f:
+                print()
+                print(compare_results(json.load(f), results))
+        failures = estimate_failures(results)
+        if failures:
+            print('Estimate error is too large for: {}'.format(', '.join(failures)))
+            exit(-1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+from typing import List, Optional
+from .report import CountReport
+
+# Client side of `codel serve`, kept free of
+# server imports to not slow the CLI down
+
+PROTOCOL_VERSION = 1
+
+
+class ServerError(Exception):
+    pass
+
+
+def socket_path() -> str:
+    # Per user socket, CODEL_SOCKET overrides it
+    path = os.getenv('CODEL_SOCKET')
+    if path:
+        return path
+    runtime = os.getenv('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'codel.sock')
+    return os.path.join(os.getenv('TMPDIR', '/tmp'), 'codel-{}.sock'.format(os.getuid()))
+
+
+def request(message: dict, path: str = None, timeout: float = None) -> dict:
+    import socket
+    message = dict(message, version=PROTOCOL_VERSION)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        # Connecting is quick or the server is gone,
+        # counting a cold folder may take long
+        connection.settimeout(0.5)
+        connection.connect(path if path else socket_path())
+        connection.settimeout(timeout)
+        connection.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        with connection.makefile('rb') as stream:
+            line = stream.readline()
+    if not line:
+        raise ServerError('Server closed the connection')
+    response = json.loads(line)
+    if not response.get('ok'):
+        raise ServerError(response.get('error', 'Unknown error'))
+    return response
+
+
+def ping(path: str) -> Optional[dict]:
+    try:
+        return request({'command': 'ping'}, path)
+    except (OSError, ValueError, ServerError):
+        return None
+
+
+def query_count(folder: str,
+                extensions: List[str],
+                ignore: List[str],
+                gitignore: bool = True,
+                keep_files: bool = True,
+                rescan: bool = False,
+                top_files: int = None,
+                by_directory: bool = False) -> Optional[CountReport]:
+    """
+    Count the folder through the running server, counted
+    again from scratch with `rescan`. Returns None if no
+    server answers.
+    """
+    path = socket_path() if sys.platform != 'win32' else None
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        response = request({
+            'command': 'count',
+            'folder': folder,
+            'extensions': list(extensions),
+            'ignore': list(ignore),
+            'gitignore': gitignore,
+            'keep_files': keep_files,
+            'rescan': rescan,
+            'top_files': top_files,
+            'by_directory': by_directory
+        }, path)
+    except (OSError, ValueError, ServerError):
+        return None
+    return CountReport.from_dict(response['report'])
@@ -1,26 +1,75 @@
 import os
-from colored import attr, fg
-from .config import UnifiedConfiguration
-from typing import Iterable, List
-from .utils import IgnoreParser
-from tqdm import tqdm
-from multiprocessing import Pool, Manager, Process
+from typing import Dict, List, Optional
+from .stats import Stats
+from .utils import IgnoreParser, attr, fg
+from .walker import DirectoryWalker
+from .counter import count_lines
+
+
+# Interned extensions, few distinct
+# ones are shared by all files
+_extensions: Dict[str, str] = {}
+
+
+def _extension(file_name: str) -> str:
+    file_ext = os.path.splitext(file_name)[-1]
+    return _extensions.setdefault(file_ext, file_ext)
+
 
 class File:
+    """
+    File to count. Slots keep it small: the directory
+    string is shared by files collected from one folder,
+    extensions are interned and the path is derived.
+    """
+
+    __slots__ = ('directory', 'file_name', 'file_ext', 'exists', 'blob_sha', 'root')
+
     def __init__(self, file_path: str, safe: bool = True):
         if safe:
             assert os.path.isfile(file_path)
         self.exists = os.path.exists(file_path)
-        self.file_path = os.path.abspath(file_path)
-        self.file_name = os.path.split(file_path)[-1]
-        self.file_ext = os.path.splitext(file_path)[-1]
-
-    def count_lines(self) -> int:
-        with open(self.file_path) as f:
-            try:
-                return sum(1 for _ in f)
-            except Exception:
-                return 0
+        self.directory, self.file_name = os.path.split(os.path.abspath(file_path))
+        self.file_ext = _extension(self.file_name)
+        # Hash of the git blob with the file
+        # content if it's known to be up to date
+        self.blob_sha = None
+        # Index of the root the file belongs to
+        # when several roots are counted together
+        self.root = 0
+
+    @property
+    def file_path(self) -> str:
+        # Cheaper than os.path.join, only the
+        # filesystem root ends with a separator
+        directory = self.directory
+        if directory.endswith(os.sep):
+            return directory + self.file_name
+        return directory + os.sep + self.file_name
+
+    @classmethod
+    def from_path(cls, file_path: str, file_name: str = None, directory: str = None) -> 'File':
+        # Build file from the absolute path of
+        # existing file without touching the filesystem
+        file = cls.__new__(cls)
+        file.exists = True
+        if file_name is None:
+            directory, file_name = os.path.split(file_path)
+        elif directory is None:
+            directory = file_path[:len(file_path) - len(file_name) - 1]
+        file.directory = directory
+        file.file_name = file_name
+        file.file_ext = _extension(file_name)
+        file.blob_sha = None
+        file.root = 0
+        return file
+
+    @classmethod
+    def from_entry(cls, entry: os.DirEntry, directory: str = None) -> 'File':
+        return cls.from_path(entry.path, entry.name, directory)
+
+    def count_lines(self) -> Optional[int]:
+        return count_lines(self.file_path)
 
     def __str__(self):
         return "{}{}{} - {}".format(
@@ -30,94 +79,53 @@ class File:
             self.file_path)
 
 
-class Directory:
-    def __init__(self, directory_path: str, safe: bool = True, verbose: bool = False, multiproc: bool = False):
-        if safe:
-            assert os.path.isdir(directory_path)
-
-        self.exists = os.path.exists(directory_path)
-        self.directory_path = os.path.abspath(directory_path)
-        self.directory_name = os.path.split(directory_path)
-
-        files = os.listdir(self.directory_path)
-
-        if verbose:
-            print('Collecting files...')
-            progress_bar = tqdm(total=len(files))
-
-        self.objects = []  # Files, Directories
-
-        def add_item_to_objects(file_path: str, objects: list = self.objects):
-            if os.path.isfile(file_path):
-                obj = File(file_path)
-                objects.append(obj)
-            elif os.path.isdir(file_path):
-                obj = Directory(file_path)
-                objects.append(obj)
-
-        if not multiproc:
-            for file_name in files:
-                file_path = os.path.join(self.directory_path, file_name)
-                if os.path.isfile(file_path):
-                    obj = File(file_path)
-                    self.objects.append(obj)
-                elif os.path.isdir(file_path):
-                    obj = Directory(file_path)
-                    self.objects.append(obj)
-                else:
-                    continue
-                if verbose:
-                    progress_bar.update()
-
-        if multiproc:
-            with Manager() as manager:
-                
-                objects = manager.list()
-                for file_name in files:
-                    file_path = os.path.join(self.directory_path, file_name)
-                    proc = Process(target=add_item_to_objects, args=(file_path, objects))
-                    proc.start()
-                    proc.join()
-                    if verbose:
-                        progress_bar.update()
-                self.objects = list(objects)
-                
-        if verbose:
-            progress_bar.close()
-
-    def __iter__(self) -> Iterable[File]:
-        for obj in self.objects:
-            if isinstance(obj, File):
-                yield obj
-            if isinstance(obj, Directory):
-                for file in obj:
-                    yield file
-
-
 class FilesCollector:
+    # Collectors reading contents themselves
+    # yield results along with files instead
+    streamed = False
+
     def __init__(self,
                  folder_path: str = None,
                  ignore: List[str] = None,
                  extensions: List[str] = None,
-                 multiproc: bool = False):
-        self.multiproc = multiproc
+                 gitignore: bool = False,
+                 stats: Stats = None):
         self.folder_path: str
         if folder_path is None:
             self.folder_path = os.getcwd()
         else:
             self.folder_path = os.path.abspath(folder_path)
         self.folder_name = os.path.split(self.folder_path)[-1]
-        self.directory = Directory(
-            directory_path=self.folder_path, 
-            verbose=True, 
-            multiproc=self.multiproc
-        )
         self.ignore = ignore if ignore else []
         self.extensions = extensions if extensions else []
+        self.gitignore = gitignore
+        self.stats = stats
+        self.ignore_parser = IgnoreParser(
+            self.ignore,
+            self.folder_path,
+            gitignore=gitignore
+        )
 
     def __iter__(self):
-        ignore_parser = IgnoreParser(self.ignore)
-        for file in self.directory:
-            if file.file_ext in self.extensions:
-                if not ignore_parser.matches(file.file_path):
-                    yield file
+        walker = DirectoryWalker(
+            root=self.folder_path,
+            extensions=self.extensions,
+            ignore_parser=self.ignore_parser,
+            stats=self.stats
+        )
+        evaluations = self.ignore_parser.evaluations
+        directory = None
+        try:
+            for entry in walker:
+                # Files of one folder come in a row
+                # and share its path string
+                entry_directory = entry.path[:len(entry.path) - len(entry.name) - 1]
+                if entry_directory != directory:
+                    directory = entry_directory
+                yield File.from_entry(entry, directory)
+        finally:
+            if self.stats is not None:
+                self.stats.add(
+                    'ignore_evaluations',
+                    self.ignore_parser.evaluations - evaluations
+                )
@@ -1,14 +1,36 @@
 import os
 import sys
+import json
 import configparser
 import shutil
 import itertools
-from colored import attr, fg
+from typing import List
+from .utils import attr, fg
 
 CONFIG_FOLDER = '.codel'
 CONFIG_REL_PATH = 'codel.ini'
 
 
+def format_list(values: List[str]) -> str:
+    return json.dumps(list(values))
+
+
+def parse_list(value: str) -> List[str]:
+    # Lists are stored as JSON, older configs
+    # hold Python reprs of lists of strings
+    try:
+        result = json.loads(value)
+    except ValueError:
+        import ast
+        try:
+            result = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            raise ValueError('Invalid list value: {}'.format(value))
+    if not isinstance(result, (list, tuple)) or not all(isinstance(item, str) for item in result):
+        raise ValueError('Invalid list value: {}'.format(value))
+    return list(result)
+
+
 class FolderConfiguration:
     def __init__(self,
                  folder: str = None,
@@ -82,7 +104,7 @@ class FolderConfiguration:
 
 
 class UserConfiguration(FolderConfiguration):
-    def __init__(self):
+    def __init__(self, auto_commit: bool = True):
         if sys.platform == 'linux':
             user_folder = os.getenv('HOME')
         else:  # Windows
@@ -90,14 +112,17 @@ class UserConfiguration(FolderConfiguration):
         FolderConfiguration.__init__(
             self,
             user_folder,
+            auto_commit=auto_commit,
             name='User configuration'
         )
 
 
 class UnifiedConfiguration:
-    def __init__(self, folder: str = None):
-        self.folder_config = FolderConfiguration(folder)
-        self.user_config = UserConfiguration()
+    def __init__(self, folder: str = None, read_only: bool = False):
+        # Read only configuration never
+        # writes files back on deletion
+        self.folder_config = FolderConfiguration(folder, auto_commit=not read_only)
+        self.user_config = UserConfiguration(auto_commit=not read_only)
 
     def commit(self):
         self.folder_config.commit()
@@ -0,0 +1,21 @@
+# Values command line parsers are set up with. They live
+# apart from the modules using them, so that setting the
+# parser up doesn't import the whole package.
+
+# Machine readable output formats of reports
+FORMATS = ('json', 'ndjson', 'csv')
+HISTORY_FORMATS = FORMATS
+DIFF_FORMATS = FORMATS
+WATCH_FORMATS = ('text', 'ndjson')
+
+BACKENDS = ('auto', 'serial', 'thread', 'process')
+# Files from this size on are split into
+# byte ranges counted by several workers
+SPLIT_THRESHOLD = 128 * 1024 * 1024
+# Share of files counted by --estimate by default
+DEFAULT_FRACTION = 0.05
+# Synthetic trees of `codel bench`
+WORKLOAD_NAMES = ('deep', 'wide', 'tiny', 'huge', 'ignore')
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+ZIP_SUFFIXES = ('.zip', '.jar', '.whl')
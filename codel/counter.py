@@ -0,0 +1,243 @@
+import mmap
+import os
+import threading
+from typing import List, Optional, Tuple
+from .classify import Classifier
+
+# Size of the chunks files are read with
+CHUNK_SIZE = 1024 * 1024
+# Files from this size on are mapped
+# to memory instead of being read
+MMAP_THRESHOLD = 64 * 1024 * 1024
+# Lines count of a file left to be
+# counted by ranges (see `count_file`)
+SPLIT = -1
+# Size of the prefix to look for
+# NUL bytes in to detect binary files
+BINARY_SNIFF_SIZE = 8192
+
+# Code, comment and blank lines
+Kinds = Tuple[int, int, int]
+
+_local = threading.local()
+
+
+def _buffer() -> bytearray:
+    # One reusable read buffer per thread
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        buffer = _local.buffer = bytearray(CHUNK_SIZE)
+    return buffer
+
+
+def is_binary(prefix: bytes) -> bool:
+    # Same heuristic git uses
+    return b'\0' in prefix
+
+
+def _count_buffered(f) -> Optional[int]:
+    buffer = _buffer()
+    lines = 0
+    last = None
+    first = True
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        if first:
+            if buffer.find(b'\0', 0, min(n, BINARY_SNIFF_SIZE)) != -1:
+                return None
+            first = False
+        lines += buffer.count(b'\n', 0, n)
+        last = buffer[n - 1]
+    if last is not None and last != ord('\n'):
+        # Last line without trailing newline
+        lines += 1
+    return lines
+
+
+def _count_mapped(f, size: int) -> Optional[int]:
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        if is_binary(mm[:BINARY_SNIFF_SIZE]):
+            return None
+        lines = 0
+        for offset in range(0, size, CHUNK_SIZE):
+            lines += mm[offset:offset + CHUNK_SIZE].count(b'\n')
+        if mm[size - 1] != ord('\n'):
+            lines += 1
+    return lines
+
+
+def _newlines_buffered(f, digest=None) -> Tuple[int, int]:
+    # Newlines and last byte (-1 when nothing was read) from
+    # the position on, read bytes are fed to the digest
+    buffer = _buffer()
+    lines = 0
+    last = -1
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        lines += buffer.count(b'\n', 0, n)
+        last = buffer[n - 1]
+        if digest is not None:
+            digest.update(memoryview(buffer)[:n])
+    return lines, last
+
+
+def _newlines_mapped(f, start: int, size: int, digest=None) -> Tuple[int, int]:
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        lines = 0
+        for offset in range(start, size, CHUNK_SIZE):
+            data = mm[offset:offset + CHUNK_SIZE]
+            lines += data.count(b'\n')
+            if digest is not None:
+                digest.update(data)
+        last = mm[size - 1] if size > start else -1
+    return lines, last
+
+
+def count_file(file_path: str, split_size: int = None) -> Tuple[Optional[int], int]:
+    """
+    Count lines of the file reading raw bytes.
+
+    Returns lines count (None for binary files, 0 for
+    files which can't be read) and size of the file.
+    Files of `split_size` bytes or more are only sniffed
+    and get SPLIT lines, their ranges are to be counted
+    with `count_range`.
+    """
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if split_size and size >= split_size:
+                if is_binary(f.read(BINARY_SNIFF_SIZE)):
+                    return None, size
+                return SPLIT, size
+            if size >= MMAP_THRESHOLD:
+                return _count_mapped(f, size), size
+            return _count_buffered(f), size
+    except (OSError, ValueError):
+        return 0, 0
+
+
+def split_ranges(size: int, parts: int) -> List[Tuple[int, int]]:
+    # Byte ranges of about equal size covering the file,
+    # starts are aligned the way mmap offsets have to be
+    granularity = mmap.ALLOCATIONGRANULARITY
+    step = max(granularity, -(-size // max(1, parts)))
+    step = -(-step // granularity) * granularity
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def count_range(file_path: str, start: int, end: int) -> int:
+    """
+    Count newlines in the [start, end) byte range of the
+    file, the range ending the file also counts the last
+    line without trailing newline. Lines of the whole file
+    are the sum over ranges covering it.
+    """
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            end = min(end, size)
+            if start >= end:
+                return 0
+            length = end - start
+            with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=start) as mm:
+                if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                lines = 0
+                for offset in range(0, length, CHUNK_SIZE):
+                    lines += mm[offset:offset + CHUNK_SIZE].count(b'\n')
+                if end == size and mm[length - 1] != ord('\n'):
+                    lines += 1
+    except (OSError, ValueError):
+        return 0
+    return lines
+
+
+def count_rest(file_path: str, offset: int, digest=None) -> Tuple[int, int]:
+    """
+    Newlines and last byte (-1 when nothing was read) of the
+    file from `offset` on, read with the reusable buffer or
+    mapped the way `count_file` reads files. Read bytes are
+    fed to `digest` too, so one pass counts and hashes.
+    """
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size - offset >= MMAP_THRESHOLD:
+                return _newlines_mapped(f, offset, size, digest)
+            f.seek(offset)
+            return _newlines_buffered(f, digest)
+    except (OSError, ValueError):
+        return 0, -1
+
+
+def count_stream(f) -> Optional[int]:
+    # Lines of a file object read sequentially with
+    # the reusable buffer (None for binary content)
+    return _count_buffered(f)
+
+
+def count_data(data: bytes) -> Optional[int]:
+    # Same as counting a file with this content
+    if is_binary(data[:BINARY_SNIFF_SIZE]):
+        return None
+    lines = data.count(b'\n')
+    if data and not data.endswith(b'\n'):
+        # Last line without trailing newline
+        lines += 1
+    return lines
+
+
+def count_stream_classified(f, file_ext: str) -> Tuple[Optional[int], int, Optional[Kinds]]:
+    """
+    Lines, size and (code, comment, blank) lines of a file
+    object read sequentially in chunks which are classified
+    as they are read. Kinds are None for binary content,
+    languages which aren't known and block comments or
+    strings longer than MAX_PENDING left open.
+    """
+    data = f.read(CHUNK_SIZE)
+    if is_binary(data[:BINARY_SNIFF_SIZE]):
+        size = len(data)
+        while data:
+            data = f.read(CHUNK_SIZE)
+            size += len(data)
+        return None, size, None
+    classifier = Classifier(file_ext)
+    lines = size = 0
+    last = b'\n'
+    while data:
+        lines += data.count(b'\n')
+        size += len(data)
+        last = data[-1:]
+        classifier.feed(data)
+        data = f.read(CHUNK_SIZE)
+    if last != b'\n':
+        # Last line without trailing newline
+        lines += 1
+    return lines, size, classifier.close(lines)
+
+
+def count_file_classified(file_path: str) -> Tuple[Optional[int], int, Optional[Kinds]]:
+    """
+    Same as `count_file` followed by (code, comment, blank)
+    lines of the file, None for binary files and languages
+    which aren't known.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            return count_stream_classified(f, os.path.splitext(file_path)[-1])
+    except (OSError, ValueError):
+        return 0, 0, None
+
+
+def count_lines(file_path: str) -> Optional[int]:
+    return count_file(file_path)[0]
@@ -0,0 +1,132 @@
+import hashlib
+import heapq
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+from .collector import File
+from .counter import BINARY_SNIFF_SIZE, count_rest, is_binary
+
+# Bytes hashed to tell files of equal size apart,
+# the binary check sniffs the same prefix
+PREFIX_SIZE = BINARY_SNIFF_SIZE
+# Duplicate groups kept in reports,
+# the ones wasting most lines first
+DUPLICATE_GROUPS = 10
+
+_NEWLINE = ord('\n')
+
+
+def _digest(data: bytes = b'') -> 'hashlib.blake2b':
+    return hashlib.blake2b(data, digest_size=16)
+
+
+def read_prefix(file_path: str) -> Tuple[Optional[int], int, bytes]:
+    """
+    Newlines (None for binary files), last byte (-1 when
+    nothing was read) and digest of the file prefix.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read(PREFIX_SIZE)
+    except (OSError, ValueError):
+        return 0, -1, b''
+    if is_binary(data):
+        return None, -1, b''
+    return data.count(b'\n'), data[-1] if data else -1, _digest(data).digest()
+
+
+def read_rest(file_path: str, offset: int) -> Tuple[int, int, bytes]:
+    """
+    Newlines, last byte and digest of the file from
+    `offset` on, counted and hashed by one read.
+    """
+    digest = _digest()
+    lines, last = count_rest(file_path, offset, digest)
+    return lines, last, digest.digest()
+
+
+def _lines(newlines: int, last: int) -> int:
+    # Last line without trailing newline
+    return newlines + 1 if last not in (-1, _NEWLINE) else newlines
+
+
+def hash_files(files: Sequence[File], sizes: Sequence[int], executor) -> Iterator[Tuple[File, tuple, Hashable]]:
+    """
+    Count files which share their size with others and key
+    them by content. Prefixes are hashed first and only files
+    with equal size and prefix are hashed in full, by the same
+    read which counts the rest of their lines. Other files are
+    counted by the executor as usual. The key is None for
+    files which can't have copies.
+    """
+    prefixes = list(executor.apply(read_prefix, [file.file_path for file in files]))
+
+    # Text files longer than the hashed prefix are
+    # grouped by size and prefix digest
+    rest = [
+        i for i, (newlines, _, digest) in enumerate(prefixes)
+        if newlines is not None and digest and sizes[i] > PREFIX_SIZE
+    ]
+    groups: Dict[Tuple[int, bytes], int] = {}
+    for i in rest:
+        group = (sizes[i], prefixes[i][2])
+        groups[group] = groups.get(group, 0) + 1
+    hashed = [i for i in rest if groups[sizes[i], prefixes[i][2]] > 1]
+    rests = executor.apply(read_rest, [files[i].file_path for i in hashed], [PREFIX_SIZE] * len(hashed))
+    rest_results = dict(zip(hashed, rests))
+    # Files without candidate copies, huge
+    # ones can be counted by ranges then
+    hashed_set = set(hashed)
+    unique = [i for i in rest if i not in hashed_set]
+    counted = dict(zip(unique, executor.count([files[i].file_path for i in unique])))
+    if executor.stats is not None:
+        executor.stats.add('dedup_prefixes_hashed', len(files))
+        executor.stats.add('dedup_files_hashed', len(hashed))
+
+    for i, file in enumerate(files):
+        newlines, last, digest = prefixes[i]
+        size = sizes[i]
+        if newlines is None:
+            yield file, (None, size), None
+        elif not digest:
+            # Couldn't be read
+            yield file, (0, 0), None
+        elif i in counted:
+            yield file, (counted[i][0], size), None
+        elif i not in rest_results:
+            # Prefix is the whole file
+            yield file, (_lines(newlines, last), size), (size, digest)
+        else:
+            rest_newlines, rest_last, rest_digest = rest_results[i]
+            last = rest_last if rest_last != -1 else last
+            yield file, (_lines(newlines + rest_newlines, last), size), (size, digest, rest_digest)
+
+
+class ContentIndex:
+    """
+    First file seen with every content and paths
+    of its copies found later on.
+    """
+
+    def __init__(self):
+        self._groups: Dict[Hashable, List] = {}
+
+    def add(self, key: Hashable, file: File, lines: int, size: int) -> bool:
+        # Whether the file is the first
+        # one with its content
+        if key is None:
+            return True
+        group = self._groups.get(key)
+        if group is None:
+            self._groups[key] = [file.root, lines, size, [file.file_path]]
+            return True
+        group[3].append(file.file_path)
+        return False
+
+    def largest(self, count: int = DUPLICATE_GROUPS) -> List[Tuple[int, int, int, List[str]]]:
+        # (root, lines, bytes, paths) of groups with
+        # copies, most lines wasted by copies first
+        groups = (group for group in self._groups.values() if len(group[3]) > 1)
+        return heapq.nlargest(
+            count,
+            groups,
+            key=lambda group: (group[1] * (len(group[3]) - 1), group[2] * (len(group[3]) - 1))
+        )
@@ -0,0 +1,408 @@
+import csv
+import json
+import os
+import re
+from typing import Dict, Hashable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+from .cache import BlobCache, CountCache, Result
+from .collector import File, FilesCollector
+from .engine import CountingEngine
+from .git import GitError, Repository, is_regular, is_tree, stat_matches
+from .history import History
+
+
+class FileDelta(NamedTuple):
+    path: str
+    extension: str
+    # None on the side the file is missing
+    # from (or binary on)
+    lines_before: Optional[int]
+    lines_after: Optional[int]
+    bytes_before: Optional[int]
+    bytes_after: Optional[int]
+
+    @property
+    def status(self) -> str:
+        if self.lines_before is None:
+            return 'added'
+        if self.lines_after is None:
+            return 'removed'
+        return 'modified'
+
+    @property
+    def lines(self) -> int:
+        return (self.lines_after or 0) - (self.lines_before or 0)
+
+    @property
+    def bytes(self) -> int:
+        return (self.bytes_after or 0) - (self.bytes_before or 0)
+
+    def to_dict(self) -> dict:
+        row = self._asdict()
+        row.update(status=self.status, lines=self.lines, bytes=self.bytes)
+        return row
+
+
+class ExtensionDelta:
+    __slots__ = ('added', 'removed', 'modified', 'lines', 'bytes')
+
+    def __init__(self):
+        # Files by status and net
+        # change of lines and bytes
+        self.added = 0
+        self.removed = 0
+        self.modified = 0
+        self.lines = 0
+        self.bytes = 0
+
+    def add(self, delta: FileDelta):
+        status = delta.status
+        if status == 'added':
+            self.added += 1
+        elif status == 'removed':
+            self.removed += 1
+        else:
+            self.modified += 1
+        self.lines += delta.lines
+        self.bytes += delta.bytes
+
+    def to_dict(self) -> dict:
+        return {
+            'added': self.added,
+            'removed': self.removed,
+            'modified': self.modified,
+            'lines': self.lines,
+            'bytes': self.bytes
+        }
+
+
+class DiffReport:
+    """
+    Change of lines between two sides per extension and
+    per file. Only files whose counts differ are listed.
+    """
+
+    def __init__(self,
+                 before: str,
+                 after: str,
+                 folder_path: str = '',
+                 extensions: List[str] = None,
+                 ignore: List[str] = None,
+                 keep_files: bool = True):
+        self.before = before
+        self.after = after
+        self.folder_path = folder_path
+        self.extensions = list(extensions) if extensions else []
+        self.ignore = list(ignore) if ignore else []
+        self.keep_files = keep_files
+        self.totals: Dict[str, ExtensionDelta] = {}
+        self.files: List[FileDelta] = []
+
+    def add(self, delta: FileDelta):
+        totals = self.totals.get(delta.extension)
+        if totals is None:
+            totals = self.totals[delta.extension] = ExtensionDelta()
+        totals.add(delta)
+        if self.keep_files:
+            self.files.append(delta)
+
+    @property
+    def total_lines(self) -> int:
+        return sum(totals.lines for totals in self.totals.values())
+
+    def _meta(self) -> dict:
+        return {
+            'before': self.before,
+            'after': self.after,
+            'folder_path': self.folder_path,
+            'extensions': self.extensions,
+            'ignore': self.ignore
+        }
+
+    def to_dict(self) -> dict:
+        result = self._meta()
+        result['totals'] = {
+            file_ext: totals.to_dict() for file_ext, totals in sorted(self.totals.items())
+        }
+        if self.keep_files:
+            result['files'] = [delta.to_dict() for delta in sorted(self.files)]
+        return result
+
+    def write(self, stream: TextIO, format: str = 'json'):
+        if format == 'json':
+            json.dump(self.to_dict(), stream)
+            stream.write('\n')
+        elif format == 'ndjson':
+            meta = self._meta()
+            meta['type'] = 'diff'
+            stream.write(json.dumps(meta) + '\n')
+            for file_ext, totals in sorted(self.totals.items()):
+                row = totals.to_dict()
+                row.update(type='extension', extension=file_ext)
+                stream.write(json.dumps(row) + '\n')
+            for delta in sorted(self.files):
+                row = delta.to_dict()
+                row['type'] = 'file'
+                stream.write(json.dumps(row) + '\n')
+        elif format == 'csv':
+            writer = csv.writer(stream, lineterminator='\n')
+            writer.writerow(['path', 'extension', 'status', 'lines_before', 'lines_after', 'lines', 'bytes'])
+            writer.writerows(
+                [delta.path, delta.extension, delta.status,
+                 '' if delta.lines_before is None else delta.lines_before,
+                 '' if delta.lines_after is None else delta.lines_after,
+                 delta.lines, delta.bytes]
+                for delta in sorted(self.files)
+            )
+        else:
+            raise ValueError('Unknown format: {}'.format(format))
+
+
+class Differ:
+    """
+    Counts the difference of two sides, each of them a
+    folder or a revision of the repository of `folder`.
+    Files are matched by path and compared by blob hash
+    or stat data before anything is read: equal subtrees
+    of two revisions are skipped, and only files which
+    differ are counted, so the cost follows the change.
+    """
+
+    def __init__(self,
+                 folder: str,
+                 extensions: List[str],
+                 ignore: List[str],
+                 gitignore: bool = True,
+                 use_cache: bool = True,
+                 jobs: int = None):
+        self.folder = os.path.abspath(folder)
+        self.extensions = extensions
+        self.ignore = ignore
+        self.gitignore = gitignore
+        self.use_cache = use_cache
+        self.jobs = jobs
+        self._history: Optional[History] = None
+
+    def _collector(self, folder: str) -> FilesCollector:
+        return FilesCollector(
+            folder_path=folder,
+            ignore=self.ignore,
+            extensions=self.extensions,
+            gitignore=self.gitignore
+        )
+
+    @property
+    def history(self) -> History:
+        # Object store of the repository the
+        # folder is in, opened on first use
+        if self._history is None:
+            repository = Repository(self.folder)
+            cache = None
+            if self.use_cache:
+                cache = BlobCache(repository.blob_cache_path, hash_size=repository.hash_size)
+            self._history = History(self._collector(self.folder), cache)
+        return self._history
+
+    def _resolve(self, rev: str) -> bytes:
+        # Refs and hashes with `~N` and `^` suffixes
+        # walking back along first parents
+        match = re.fullmatch(r'(.+?)((?:~\d*|\^)*)', rev)
+        history = self.history
+        sha = history.repository.resolve(match.group(1))
+        for step in re.findall(r'~\d*|\^', match.group(2)):
+            for _ in range(int(step[1:] or 1) if step[0] == '~' else 1):
+                parents = history.objects.read_commit(sha).parents
+                if not parents:
+                    raise GitError('Unknown revision: {}'.format(rev))
+                sha = parents[0]
+        return sha
+
+    def _tree(self, rev: str) -> Optional[bytes]:
+        history = self.history
+        commit = history.objects.read_commit(self._resolve(rev))
+        return history.folder_tree(commit.tree)
+
+    # Revisions
+
+    def _wanted_file(self, name: str, rel_path: str) -> bool:
+        history = self.history
+        return (os.path.splitext(name)[-1] in history.extensions
+                and not history.collector.ignore_parser.matches(history.path(rel_path)))
+
+    def _wanted_dir(self, rel_path: str) -> bool:
+        history = self.history
+        return not history.collector.ignore_parser.matches_dir(history.path(rel_path))
+
+    def _tree_files(self, tree: Optional[bytes], rel_dir: str) -> Iterator[Tuple[str, bytes]]:
+        # (path in the work tree, blob hash) of
+        # every wanted file of the tree
+        if tree is None:
+            return
+        for entry in self.history.objects.read_tree(tree):
+            rel_path = rel_dir + '/' + entry.name if rel_dir else entry.name
+            if is_tree(entry.mode):
+                if self._wanted_dir(rel_path):
+                    yield from self._tree_files(entry.sha, rel_path)
+            elif is_regular(entry.mode) and self._wanted_file(entry.name, rel_path):
+                yield rel_path, entry.sha
+
+    def _diff_trees(self,
+                    before: Optional[bytes],
+                    after: Optional[bytes],
+                    rel_dir: str) -> Iterator[Tuple[str, Optional[bytes], Optional[bytes]]]:
+        # (path, blob before, blob after) of files which
+        # differ, subtrees with equal hashes are skipped
+        if before == after:
+            return
+        if before is None or after is None:
+            for rel_path, sha in self._tree_files(before or after, rel_dir):
+                yield (rel_path, sha, None) if after is None else (rel_path, None, sha)
+            return
+
+        objects = self.history.objects
+        entries_before = {entry.name: entry for entry in objects.read_tree(before)}
+        entries_after = {entry.name: entry for entry in objects.read_tree(after)}
+        for name in sorted(entries_before.keys() | entries_after.keys()):
+            entry_before = entries_before.get(name)
+            entry_after = entries_after.get(name)
+            if entry_before is not None and entry_after is not None and entry_before == entry_after:
+                continue
+            rel_path = rel_dir + '/' + name if rel_dir else name
+
+            # Trees and files of one name are
+            # compared with their own kind
+            trees = [
+                entry.sha if entry is not None and is_tree(entry.mode) else None
+                for entry in (entry_before, entry_after)
+            ]
+            if trees != [None, None] and self._wanted_dir(rel_path):
+                yield from self._diff_trees(trees[0], trees[1], rel_path)
+            blobs = [
+                entry.sha if entry is not None and is_regular(entry.mode) else None
+                for entry in (entry_before, entry_after)
+            ]
+            if blobs != [None, None] and blobs[0] != blobs[1] and self._wanted_file(name, rel_path):
+                yield rel_path, blobs[0], blobs[1]
+
+    # Folders
+
+    def _folder_files(self, folder: str, by_blob: bool) -> Dict[str, Tuple[File, Hashable]]:
+        # Path relative to the folder -> (file, key). Keys are
+        # blob hashes from the git index for files known to be
+        # clean when compared with a revision, stat data otherwise.
+        index = {}
+        written = 0
+        if by_blob:
+            try:
+                repository = self.history.repository
+                prefix = os.path.relpath(folder, repository.work_tree).replace(os.sep, '/')
+                if not prefix.startswith('..'):
+                    prefix = '' if prefix == '.' else prefix + '/'
+                    index = {
+                        entry.path[len(prefix):]: entry
+                        for entry in repository.read_index() if entry.path.startswith(prefix)
+                    }
+                    written = repository.index_mtime()
+            except GitError:
+                pass
+
+        files = {}
+        start = len(folder) + 1
+        for file in self._collector(folder):
+            try:
+                st = os.stat(file.file_path)
+            except OSError:
+                continue
+            rel_path = file.file_path[start:].replace(os.sep, '/')
+            entry = index.get(rel_path)
+            if entry is not None and stat_matches(entry, st, written, repository.trust_ctime):
+                key = entry.sha
+            else:
+                key = (st.st_size, st.st_mtime_ns)
+            files[rel_path] = (file, key)
+        return files
+
+    def _count_folder(self, folder: str, files: List[File]) -> Dict[str, Result]:
+        cache = CountCache(folder) if self.use_cache else None
+        engine = CountingEngine(jobs=self.jobs, cache=cache)
+        return {file.file_path: result for file, result in engine.count_files(files)}
+
+    # Both
+
+    def diff(self, before: str, after: str, keep_files: bool = True) -> DiffReport:
+        report = DiffReport(before, after, self.folder, self.extensions, self.ignore, keep_files)
+        sides = [
+            os.path.abspath(side) if os.path.isdir(side) else None
+            for side in (before, after)
+        ]
+
+        if sides == [None, None]:
+            trees = [self._tree(before), self._tree(after)]
+            prefix = self.history.prefix
+            for rel_path, sha_before, sha_after in self._diff_trees(trees[0], trees[1], prefix):
+                results = [
+                    self.history.blob(sha, rel_path) if sha is not None else (None, None)
+                    for sha in (sha_before, sha_after)
+                ]
+                path = rel_path[len(prefix) + 1:] if prefix else rel_path
+                self._add(report, path, results[0], results[1])
+            self._save()
+            return report
+
+        # Paths relative to the side root -> key
+        listings = []
+        for rev, folder in zip((before, after), sides):
+            if folder is not None:
+                listings.append(self._folder_files(folder, by_blob=None in sides))
+            else:
+                prefix = self.history.prefix
+                listings.append({
+                    rel_path[len(prefix) + 1:] if prefix else rel_path: (rel_path, sha)
+                    for rel_path, sha in self._tree_files(self._tree(rev), prefix)
+                })
+
+        changed = sorted(
+            path for path in listings[0].keys() | listings[1].keys()
+            if path not in listings[0] or path not in listings[1]
+            or listings[0][path][1] != listings[1][path][1]
+        )
+
+        # Files of every side counted at
+        # once, folders with their workers
+        counted = []
+        for folder, listing in zip(sides, listings):
+            results = {}
+            present = [listing[path] for path in changed if path in listing]
+            if folder is not None:
+                by_path = self._count_folder(folder, [file for file, _ in present])
+                results = {
+                    path: by_path[listing[path][0].file_path] for path in changed if path in listing
+                }
+            else:
+                results = {
+                    path: self.history.blob(listing[path][1], listing[path][0])
+                    for path in changed if path in listing
+                }
+            counted.append(results)
+
+        for path in changed:
+            self._add(report, path, counted[0].get(path, (None, None)), counted[1].get(path, (None, None)))
+        self._save()
+        return report
+
+    @staticmethod
+    def _add(report: DiffReport, path: str, before: Result, after: Result):
+        # Binary files count as missing
+        lines_before, bytes_before = before[:2] if before[0] is not None else (None, None)
+        lines_after, bytes_after = after[:2] if after[0] is not None else (None, None)
+        if (lines_before, bytes_before) == (lines_after, bytes_after):
+            return
+        file_ext = os.path.splitext(path)[-1]
+        report.add(FileDelta(path, file_ext, lines_before, lines_after, bytes_before, bytes_after))
+
+    def _save(self):
+        if self._history is not None and self._history.cache is not None:
+            self._history.cache.save()
+
+    def close(self):
+        if self._history is not None:
+            self._history.close()
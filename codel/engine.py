@@ -0,0 +1,561 @@
+import itertools
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import partial
+from typing import Callable, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from .cache import CountCache, Result
+from .classify import LANGUAGES_BY_EXTENSION
+from .collector import File, FilesCollector
+from .constants import BACKENDS, SPLIT_THRESHOLD
+from .counter import BINARY_SNIFF_SIZE, SPLIT, count_file, count_file_classified, count_range, split_ranges
+from .report import CountReport
+from .stats import Stats
+from .utils import empty_content
+
+# Thresholds used to pick the
+# backend in auto mode
+PARALLEL_MIN_FILES = 64
+PROCESS_MIN_FILES = 256
+PROCESS_MIN_BYTES = 32 * 1024 * 1024
+
+# Number of files taken from the
+# collector at once while streaming
+BATCH_SIZE = 8192
+
+
+def _count_batch(file_paths: List[str], count: Callable = count_file) -> List[Result]:
+    return [count(file_path) for file_path in file_paths]
+
+
+def _timed_batch(file_paths: Sequence[str],
+                 worker: str,
+                 cpu_clock: Callable[[], float],
+                 count: Callable = count_file) -> tuple:
+    start = time.time()
+    cpu = cpu_clock()
+    results = _count_batch(file_paths, count)
+    return results, worker, start, time.time(), cpu_clock() - cpu
+
+
+def _count_batch_in_process(file_paths: List[str], count: Callable = count_file) -> tuple:
+    return _timed_batch(file_paths, 'process-{}'.format(os.getpid()), time.process_time, count)
+
+
+def _count_batch_in_thread(file_paths: List[str], count: Callable = count_file) -> tuple:
+    return _timed_batch(file_paths, threading.current_thread().name, time.thread_time, count)
+
+
+def _chunks(items: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _tagged(collectors: Sequence[FilesCollector]) -> Iterator[File]:
+    for root, collector in enumerate(collectors):
+        if collector.streamed:
+            continue
+        for file in collector:
+            file.root = root
+            yield file
+
+
+class _Executor(ABC):
+    name: str
+
+    def __init__(self,
+                 jobs: int = 1,
+                 stats: Stats = None,
+                 classify: bool = False,
+                 split_size: int = None):
+        self.jobs = max(1, jobs)
+        # Workers report busy time
+        # only when stats are collected
+        self.stats = stats
+        # Module level functions, so
+        # they can be sent to processes
+        self.count_file = count_file_classified if classify else count_file
+        # Classifying needs whole files, so only
+        # plain counting splits huge ones
+        self.split_size = split_size if split_size and not classify and self.jobs > 1 else None
+        if self.split_size:
+            self.count_file = partial(count_file, split_size=self.split_size)
+
+    def _batch_function(self, function: Callable) -> Callable:
+        if self.count_file is count_file:
+            return function
+        return partial(function, count=self.count_file)
+
+    @abstractmethod
+    def map(self, file_paths: Sequence[str]) -> Iterable[Result]:
+        pass
+
+    def apply(self, function: Callable, *iterables: Sequence) -> Iterable:
+        # Module level function over the
+        # items in order, run by the workers
+        return map(function, *iterables)
+
+    def count(self, file_paths: Sequence[str]) -> Iterable[Result]:
+        # Same as `map` with files left by workers
+        # counted by ranges spread over all of them
+        results = self.map(file_paths)
+        if not self.split_size:
+            return results
+        results = list(results)
+        split = [i for i, result in enumerate(results) if result[0] == SPLIT]
+        if not split:
+            return results
+
+        ranges = []
+        parts = []
+        for i in split:
+            file_ranges = split_ranges(results[i][1], self.jobs * 2)
+            ranges.extend((file_paths[i], start, end) for start, end in file_ranges)
+            parts.append(len(file_ranges))
+        counts = iter(self.apply(count_range, *zip(*ranges)))
+        for i, file_parts in zip(split, parts):
+            results[i] = (sum(itertools.islice(counts, file_parts)), results[i][1])
+        if self.stats is not None:
+            self.stats.add('files_split', len(split))
+            self.stats.add('ranges_counted', len(ranges))
+        return results
+
+    def _record(self, timed_batches: Iterable[tuple]) -> Iterator[Result]:
+        for results, worker, start, end, cpu in timed_batches:
+            self.stats.add_worker(worker, start, end, cpu, len(results))
+            yield from results
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SerialExecutor(_Executor):
+    name = 'serial'
+
+    def __init__(self,
+                 jobs: int = 1,
+                 stats: Stats = None,
+                 classify: bool = False,
+                 split_size: int = None):
+        _Executor.__init__(self, 1, stats, classify)
+
+    def map(self, file_paths: Sequence[str]) -> Iterable[Result]:
+        if self.stats is None:
+            return map(self.count_file, file_paths)
+        return self._record([
+            _timed_batch(file_paths, 'main', time.process_time, self.count_file)])
+
+
+class _PoolExecutor(_Executor):
+    # Pool is started on first use and
+    # reused until the executor is closed
+
+    def __init__(self,
+                 jobs: int = 1,
+                 stats: Stats = None,
+                 classify: bool = False,
+                 split_size: int = None):
+        _Executor.__init__(self, jobs, stats, classify, split_size)
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = self._create_pool()
+        return self._pool
+
+    @abstractmethod
+    def _create_pool(self):
+        pass
+
+    def apply(self, function: Callable, *iterables: Sequence) -> Iterable:
+        return self.pool.map(function, *iterables)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class ThreadExecutor(_PoolExecutor):
+    name = 'thread'
+
+    def _create_pool(self):
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=self.jobs)
+
+    def map(self, file_paths: Sequence[str]) -> Iterable[Result]:
+        if self.stats is None:
+            return self.pool.map(self.count_file, file_paths)
+        # Timing every file would cost more
+        # than counting it, time chunks instead
+        chunk_size = max(1, len(file_paths) // (self.jobs * 8))
+        chunks = _chunks(file_paths, chunk_size)
+        return self._record(self.pool.map(self._batch_function(_count_batch_in_thread), chunks))
+
+
+class ProcessExecutor(_PoolExecutor):
+    name = 'process'
+
+    def __init__(self,
+                 jobs: int = 1,
+                 chunk_size: int = None,
+                 stats: Stats = None,
+                 classify: bool = False,
+                 split_size: int = None):
+        _PoolExecutor.__init__(self, jobs, stats, classify, split_size)
+        self.chunk_size = chunk_size
+
+    def _create_pool(self):
+        # Spawning machinery is only
+        # imported when processes are used
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=self.jobs)
+
+    def _chunk_size(self, files_count: int) -> int:
+        if self.chunk_size:
+            return self.chunk_size
+        # Few chunks per worker to balance
+        # the load without paying per file IPC
+        return max(1, min(1024, files_count // (self.jobs * 8)))
+
+    def apply(self, function: Callable, *iterables: Sequence) -> Iterable:
+        chunk_size = self._chunk_size(len(iterables[0])) if iterables else 1
+        return self.pool.map(function, *iterables, chunksize=chunk_size)
+
+    def map(self, file_paths: Sequence[str]) -> Iterable[Result]:
+        chunks = _chunks(file_paths, self._chunk_size(len(file_paths)))
+        if self.stats is not None:
+            return self._record(self.pool.map(self._batch_function(_count_batch_in_process), chunks))
+        return itertools.chain.from_iterable(
+            self.pool.map(self._batch_function(_count_batch), chunks))
+
+
+EXECUTORS = {
+    executor.name: executor
+    for executor in (SerialExecutor, ThreadExecutor, ProcessExecutor)
+}
+
+
+def _size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def _total_size(file_paths: Iterable[str]) -> int:
+    return sum(_size(file_path) for file_path in file_paths)
+
+
+def _has_huge(file_paths: Iterable[str], split_size: int) -> bool:
+    return any(_size(file_path) >= split_size for file_path in file_paths)
+
+
+def select_backend(file_paths: Sequence[str],
+                   jobs: int,
+                   classify: bool = False,
+                   split_size: int = None) -> str:
+    if jobs <= 1:
+        return 'serial'
+    # Few files are cheap to stat, when one of
+    # them is split its ranges need processes
+    if (split_size and not classify
+            and len(file_paths) < PROCESS_MIN_FILES
+            and _has_huge(file_paths, split_size)):
+        return 'process'
+    if len(file_paths) < PARALLEL_MIN_FILES:
+        return 'serial'
+    if len(file_paths) < PROCESS_MIN_FILES:
+        return 'thread'
+    # Classifying holds the GIL, so threads
+    # don't help however small files are
+    if not classify and _total_size(file_paths) < PROCESS_MIN_BYTES:
+        return 'thread'
+    return 'process'
+
+
+class CountingEngine:
+    def __init__(self,
+                 backend: str = 'auto',
+                 jobs: int = None,
+                 cache: CountCache = None,
+                 stats: Stats = None,
+                 classify: bool = False,
+                 split_size: int = SPLIT_THRESHOLD,
+                 dedup: bool = False):
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend: {}'.format(backend))
+        if dedup and classify:
+            raise ValueError("Files can't be classified and deduplicated at once")
+        self.backend = backend
+        self.jobs = jobs if jobs else (os.cpu_count() or 1)
+        self.cache = cache
+        self.stats = stats
+        # Results get (code, comment, blank) lines
+        # as third item, None when not known
+        self.classify = classify
+        # Files from this size on are counted by
+        # byte ranges in parallel, None disables it
+        self.split_size = split_size
+        # Reports get totals with every content
+        # counted once and the largest copies
+        self.dedup = dedup
+
+    def executor(self, file_paths: Sequence[str]) -> _Executor:
+        backend = self.backend
+        if backend == 'auto':
+            backend = select_backend(file_paths, self.jobs, self.classify, self.split_size)
+        if self.stats is not None:
+            self.stats.add('backend_' + backend)
+        return EXECUTORS[backend](
+            self.jobs,
+            stats=self.stats,
+            classify=self.classify,
+            split_size=self.split_size
+        )
+
+    def count(self, files: Iterable[File]) -> Iterator[Optional[int]]:
+        # Yields lines count for each file in the
+        # given order (None for binary files)
+        for _, result in self.count_files(files):
+            yield result[0]
+
+    def report(self,
+               collector: FilesCollector,
+               keep_files: bool = True,
+               progress: Callable[[], None] = None,
+               top_files: int = None,
+               by_directory: bool = False) -> CountReport:
+        return self.reports([collector], keep_files, progress, top_files, by_directory)[0]
+
+    def reports(self,
+                collectors: Sequence[FilesCollector],
+                keep_files: bool = True,
+                progress: Callable[[], None] = None,
+                top_files: int = None,
+                by_directory: bool = False) -> List[CountReport]:
+        # Files of all roots form one stream, so batches
+        # span roots and workers never wait for a small
+        # root to finish. With several roots the cache has
+        # to be a CacheGroup with one cache per root.
+        # Rollups of reports without files are kept
+        # while counting, see CountReport.
+        reports = [
+            CountReport(
+                folder_path=collector.folder_path,
+                extensions=collector.extensions,
+                ignore=collector.ignore,
+                keep_files=keep_files,
+                classified=self.classify,
+                deduplicated=self.dedup,
+                top_files=top_files,
+                by_directory=by_directory
+            )
+            for collector in collectors
+        ]
+        index = None
+        if self.dedup:
+            from .dedup import ContentIndex
+            index = ContentIndex()
+
+        if not all(collector.streamed for collector in collectors):
+            files = collectors[0] if len(collectors) == 1 else _tagged(collectors)
+            if index is None:
+                for file, result in self.count_files(files):
+                    reports[file.root].add(file.file_path, file.file_ext, *result)
+                    if progress is not None:
+                        progress()
+            else:
+                for file, result, key in self.count_deduplicated(files):
+                    copy = result[0] is not None and not index.add(key, file, *result)
+                    reports[file.root].add(file.file_path, file.file_ext, *result, copy=copy)
+                    if progress is not None:
+                        progress()
+
+        # Archives are read sequentially
+        # by their collectors instead
+        for report, collector in zip(reports, collectors):
+            if collector.streamed:
+                for file, result in collector.results(self.classify):
+                    report.add(file.file_path, file.file_ext, *result)
+                    if progress is not None:
+                        progress()
+
+        if index is not None:
+            for root, lines, size, paths in index.largest():
+                reports[root].add_duplicates(lines, size, paths)
+        return reports
+
+    def count_deduplicated(self, files: Iterable[File]) -> Iterator[Tuple[File, Result, Hashable]]:
+        # Same as `count_files` with a content key for every
+        # file (None when it can't have copies). Files of a
+        # size no other file has are counted as usual, blob
+        # hashes from the git index key content as they are
+        from .dedup import hash_files
+        files = list(files)
+        sizes = [_size(file.file_path) if file.blob_sha is None else 0 for file in files]
+        if self.stats is not None:
+            self.stats.add('stat_calls', sum(file.blob_sha is None for file in files))
+        sizes_count = {}
+        for size in sizes:
+            if size:
+                sizes_count[size] = sizes_count.get(size, 0) + 1
+        shared = [i for i, size in enumerate(sizes) if size and sizes_count[size] > 1]
+
+        shared_set = set(shared)
+        usual = [file for i, file in enumerate(files) if i not in shared_set]
+        for file, result in self.count_files(usual):
+            # Empty files aren't copies of each other
+            yield file, result, file.blob_sha if result[1] else None
+        if not shared:
+            return
+
+        candidates = [files[i] for i in shared]
+        with self.executor([file.file_path for file in candidates]) as executor:
+            with self.stats.phase('dedup') if self.stats is not None else empty_content():
+                results = list(hash_files(candidates, [sizes[i] for i in shared], executor))
+        yield from results
+
+    def count_files(self, files: Iterable[File], batch_size: int = BATCH_SIZE) -> Iterator[Tuple[File, Result]]:
+        stats = self.stats
+        if stats is not None:
+            yield from self._count_files_timed(files, stats, batch_size)
+            return
+
+        # Files are consumed in batches so that
+        # they never have to be held all at once
+        batches = _batches(files, batch_size)
+        first = next(batches, None)
+        if first is None:
+            if self.cache is not None:
+                self.cache.save()
+            return
+
+        # Backend is picked by the first batch
+        executor = self.executor([file.file_path for file in first])
+        with executor:
+            for batch in itertools.chain([first], batches):
+                yield from zip(batch, self._count_batch(batch, executor))
+
+        if self.cache is not None:
+            self.cache.save()
+
+    def _count_files_timed(self,
+                           files: Iterable[File],
+                           stats: Stats,
+                           batch_size: int = BATCH_SIZE) -> Iterator[Tuple[File, Result]]:
+        # Same as `count_files` with walking and
+        # counting of every batch timed apart
+        cache = self.cache
+        hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+        batches = stats.timed(_batches(files, batch_size), 'walk')
+        first = next(batches, None)
+        if first is not None:
+            executor = self.executor([file.file_path for file in first])
+            with executor:
+                for batch in itertools.chain([first], batches):
+                    with stats.phase('count'):
+                        counts = list(self._count_batch(batch, executor))
+                    yield from zip(batch, counts)
+
+        if cache is not None:
+            with stats.phase('cache'):
+                cache.save()
+            stats.add('cache_hits', cache.hits - hits)
+            stats.add('cache_misses', cache.misses - misses)
+
+    def _count_batch(self, files: Sequence[File], executor: _Executor) -> Iterable[Result]:
+        if self.cache is not None:
+            return self._count_cached(files, executor)
+        counts = executor.count([file.file_path for file in files])
+        if self.stats is not None:
+            counts = list(counts)
+            self._record(counts)
+        return counts
+
+    def _record(self, results: Sequence[Result]):
+        stats = self.stats
+        binary = 0
+        size = 0
+        for lines, file_size, *_ in results:
+            if lines is None:
+                # Reading stops at the sniffed prefix
+                binary += 1
+                file_size = min(file_size, BINARY_SNIFF_SIZE)
+            size += file_size
+        stats.add('files_read', len(results))
+        stats.add('bytes_read', size)
+        stats.add('binary_skipped', binary)
+
+    def _cached(self, file: File, key) -> Result:
+        cache = self.cache
+        if not self.classify:
+            return cache.get(file, key)
+        # Files of languages which aren't known
+        # have no classification to look up
+        if file.file_ext in LANGUAGES_BY_EXTENSION:
+            return cache.get(file, key, classified=True)
+        return cache.get(file, key) + (None,)
+
+    def _count_cached(self, files: Sequence[File], executor: _Executor) -> List[Result]:
+        cache = self.cache
+        keys = [cache.key(file) for file in files]
+        if self.stats is not None and not cache.content_addressed:
+            # Keys are taken from stat data
+            self.stats.add('stat_calls', len(files))
+
+        # Look up the cache first and
+        # count only changed files
+        counts = []
+        missing = []
+        for i, (file, key) in enumerate(zip(files, keys)):
+            try:
+                counts.append(self._cached(file, key))
+            except KeyError:
+                counts.append(None)
+                missing.append(i)
+
+        # Files with equal content
+        # are only counted once
+        to_count = missing
+        duplicates = []
+        if cache.content_addressed:
+            to_count = []
+            first = {}
+            for i in missing:
+                if keys[i] is not None and keys[i] in first:
+                    duplicates.append((i, first[keys[i]]))
+                else:
+                    first[keys[i]] = i
+                    to_count.append(i)
+
+        fresh = executor.count([files[i].file_path for i in to_count])
+        if self.stats is not None:
+            fresh = list(fresh)
+            self._record(fresh)
+            self.stats.add('duplicates_skipped', len(duplicates))
+        for i, result in zip(to_count, fresh):
+            counts[i] = result
+            cache.set(files[i], keys[i], result)
+        for i, original in duplicates:
+            counts[i] = counts[original]
+            # Roots may not share the cache
+            cache.set(files[i], keys[i], counts[i])
+        return counts
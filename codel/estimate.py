@@ -0,0 +1,175 @@
+import math
+import os
+from typing import Callable, Dict, List, Sequence, Tuple
+from .cache import Result
+from .collector import File, FilesCollector
+from .constants import DEFAULT_FRACTION
+from .report import CountReport, ExtensionTotals
+
+# Files counted in every stratum at least,
+# so that their spread can be measured
+MIN_SAMPLE = 5
+# Normal quantile of 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
+
+def size_bucket(size: int) -> int:
+    # Powers of four, empty files on their own
+    return (size.bit_length() + 1) // 2
+
+
+class Stratum:
+    """
+    Files of one extension and size bucket: their number,
+    stat size and a uniform sample of them. The sample
+    takes every file with the given probability, a
+    reservoir stands in when that leaves too few files.
+    """
+
+    __slots__ = ('files_count', 'bytes', 'sample', 'reservoir')
+
+    def __init__(self):
+        self.files_count = 0
+        self.bytes = 0
+        self.sample: List[File] = []
+        self.reservoir: List[File] = []
+
+    def add(self, file: File, size: int, fraction: float, rng) -> None:
+        self.files_count += 1
+        self.bytes += size
+        if rng.random() < fraction:
+            self.sample.append(file)
+        if len(self.reservoir) < MIN_SAMPLE:
+            self.reservoir.append(file)
+        else:
+            i = rng.randrange(self.files_count)
+            if i < MIN_SAMPLE:
+                self.reservoir[i] = file
+
+    def chosen(self) -> List[File]:
+        return self.sample if len(self.sample) >= len(self.reservoir) else self.reservoir
+
+
+class StratumEstimate:
+    __slots__ = ('files_count', 'lines', 'bytes', 'variance')
+
+    def __init__(self, files_count: float, lines: float, size: float, variance: float):
+        self.files_count = files_count
+        self.lines = lines
+        self.bytes = size
+        # Variance of the lines estimate
+        self.variance = variance
+
+
+def estimate_stratum(files_count: int, size: int, results: Sequence[Result]) -> StratumEstimate:
+    """
+    Extrapolate text files, lines and bytes of a stratum from
+    results of its sample. Lines use the ratio estimator: the
+    lines per byte of the sample times bytes of the stratum.
+    Binary files count as text files without lines.
+    """
+    n = len(results)
+    text = [(lines, file_size) for lines, file_size, *_ in results if lines is not None]
+    if n >= files_count:
+        return StratumEstimate(
+            len(text), sum(lines for lines, _ in text), sum(file_size for _, file_size in text), 0.0)
+
+    sample_bytes = sum(file_size for _, file_size, *_ in results)
+    ratio = sum(lines for lines, _ in text) / sample_bytes if sample_bytes else 0.0
+    text_share = sum(file_size for _, file_size in text) / sample_bytes if sample_bytes else 1.0
+    # Residuals of binary files are their
+    # size, they have no lines
+    residuals = sum(
+        ((lines if lines is not None else 0) - ratio * file_size) ** 2
+        for lines, file_size, *_ in results
+    )
+    variance = 0.0
+    if n > 1:
+        variance = files_count ** 2 * (1 - n / files_count) / n * residuals / (n - 1)
+    return StratumEstimate(files_count * len(text) / n, ratio * size, text_share * size, variance)
+
+
+def fill_totals(report: CountReport, estimates: Dict[str, List[StratumEstimate]]) -> float:
+    # Totals of the report summed over strata of every
+    # extension, returns the estimated text files
+    files_count = 0.0
+    for file_ext, strata in estimates.items():
+        totals = ExtensionTotals(
+            round(sum(stratum.files_count for stratum in strata)),
+            round(sum(stratum.lines for stratum in strata)),
+            round(sum(stratum.bytes for stratum in strata))
+        )
+        totals.lines_margin = round(CONFIDENCE_Z * math.sqrt(sum(stratum.variance for stratum in strata)))
+        files_count += sum(stratum.files_count for stratum in strata)
+        if totals.files_count:
+            report.totals[file_ext] = totals
+    return files_count
+
+
+def estimate_reports(engine,
+                     collectors: Sequence[FilesCollector],
+                     fraction: float = DEFAULT_FRACTION,
+                     seed: int = 0,
+                     progress: Callable[[], None] = None) -> List[CountReport]:
+    """
+    Reports with lines estimated from a sample of files. Trees
+    are only walked and stat'ed, files are split into strata by
+    extension and size and a `fraction` of every stratum is
+    counted by the engine. Archives are counted in full.
+    """
+    import random
+    rng = random.Random(seed)
+    strata: List[Dict[Tuple[str, int], Stratum]] = []
+    for root, collector in enumerate(collectors):
+        root_strata = {}
+        strata.append(root_strata)
+        if collector.streamed:
+            continue
+        for file in collector:
+            try:
+                size = os.stat(file.file_path).st_size
+            except OSError:
+                continue
+            file.root = root
+            key = (file.file_ext, size_bucket(size))
+            stratum = root_strata.get(key)
+            if stratum is None:
+                stratum = root_strata[key] = Stratum()
+            stratum.add(file, size, fraction, rng)
+
+    chosen = [
+        stratum.chosen() for root_strata in strata for stratum in root_strata.values()
+    ]
+    results: Dict[int, Result] = {}
+    for file, result in engine.count_files(file for files in chosen for file in files):
+        results[id(file)] = result
+        if progress is not None:
+            progress()
+
+    reports = []
+    for collector, root_strata in zip(collectors, strata):
+        if collector.streamed:
+            reports.append(engine.reports([collector], keep_files=False, progress=progress)[0])
+            continue
+        report = CountReport(
+            folder_path=collector.folder_path,
+            extensions=collector.extensions,
+            ignore=collector.ignore,
+            keep_files=False,
+            estimated=True
+        )
+        estimates: Dict[str, List[StratumEstimate]] = {}
+        files_count = 0
+        for (file_ext, _), stratum in root_strata.items():
+            sample = stratum.chosen()
+            report.sampled_files += len(sample)
+            files_count += stratum.files_count
+            estimates.setdefault(file_ext, []).append(estimate_stratum(
+                stratum.files_count,
+                stratum.bytes,
+                [results[id(file)] for file in sample]
+            ))
+        text_files = fill_totals(report, estimates)
+        report.binary_files = round(files_count - text_files)
+        reports.append(report)
+    return reports
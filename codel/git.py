@@ -0,0 +1,720 @@
+import mmap
+import os
+import re
+import struct
+import zlib
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from .collector import File, FilesCollector
+from .stats import Stats
+
+INDEX_SIGNATURE = b'DIRC'
+BLOB_CACHE_REL_PATH = os.path.join('codel', 'blobs.bin')
+
+# ctime s/ns, mtime s/ns, dev, ino, mode, uid, gid, size
+_ENTRY_HEADER = struct.Struct('>10I')
+
+_MODE_TYPE_MASK = 0o170000
+_MODE_REGULAR = 0o100000
+_FLAG_EXTENDED = 0x4000
+_FLAG_STAGE_MASK = 0x3000
+_FLAG_NAME_MASK = 0x0fff
+_EXTENDED_SKIP_WORKTREE = 0x4000
+
+PACK_INDEX_SIGNATURE = b'\377tOc'
+# Objects types stored in packs
+_PACK_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+_OFS_DELTA = 6
+_REF_DELTA = 7
+# Size of decompressed objects kept
+# around to resolve delta chains
+OBJECT_CACHE_SIZE = 64 * 1024 * 1024
+
+_MODE_DIRECTORY = 0o040000
+
+# Times are in nanoseconds, seconds of
+# the index are the low 32 bits of them
+IndexEntry = namedtuple('IndexEntry', [
+    'path', 'mode', 'ctime', 'mtime', 'ino', 'size', 'sha', 'stage', 'skip_worktree'
+])
+
+_NS = 10 ** 9
+
+
+class GitError(Exception):
+    pass
+
+
+class Repository:
+    def __init__(self, folder: str):
+        # Look for the repository the
+        # folder belongs to
+        folder = os.path.abspath(folder)
+        work_tree = folder
+        while True:
+            dot_git = os.path.join(work_tree, '.git')
+            if os.path.exists(dot_git):
+                break
+            parent = os.path.dirname(work_tree)
+            if parent == work_tree:
+                raise GitError('Not a git repository: {}'.format(folder))
+            work_tree = parent
+
+        self.work_tree = work_tree
+        self.git_dir = self._git_dir(dot_git)
+        self.common_dir = self.git_dir
+        commondir_path = os.path.join(self.git_dir, 'commondir')
+        if os.path.isfile(commondir_path):
+            with open(commondir_path) as f:
+                self.common_dir = os.path.normpath(
+                    os.path.join(self.git_dir, f.read().strip()))
+        self.hash_size = self._hash_size()
+        self.trust_ctime = self._trust_ctime()
+
+    @staticmethod
+    def _git_dir(dot_git: str) -> str:
+        if os.path.isdir(dot_git):
+            return dot_git
+        # Worktrees and submodules have
+        # a "gitdir: <path>" file instead
+        with open(dot_git) as f:
+            content = f.read().strip()
+        if not content.startswith('gitdir:'):
+            raise GitError('Invalid .git file: {}'.format(dot_git))
+        git_dir = content[len('gitdir:'):].strip()
+        return os.path.normpath(os.path.join(os.path.dirname(dot_git), git_dir))
+
+    def _config(self) -> str:
+        try:
+            with open(os.path.join(self.common_dir, 'config')) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def _hash_size(self) -> int:
+        if re.search(r'^\s*objectformat\s*=\s*sha256\s*$', self._config(), re.IGNORECASE | re.MULTILINE):
+            return 32
+        return 20
+
+    def _trust_ctime(self) -> bool:
+        # core.trustctime, git compares ctime by default
+        return not re.search(
+            r'^\s*trustctime\s*=\s*(false|no|off|0)\s*$', self._config(), re.IGNORECASE | re.MULTILINE)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.git_dir, 'index')
+
+    @property
+    def blob_cache_path(self) -> str:
+        # Shared by all worktrees
+        return os.path.join(self.common_dir, BLOB_CACHE_REL_PATH)
+
+    def read_index(self) -> List[IndexEntry]:
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise GitError("Couldn't read git index: {}".format(e))
+        return parse_index(data, self.hash_size)
+
+    def index_mtime(self) -> int:
+        # When the index was last written, in nanoseconds
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _read_ref(self, ref: str) -> Optional[str]:
+        # Loose refs win over packed ones, HEAD
+        # and friends belong to the worktree
+        for folder in (self.git_dir, self.common_dir):
+            try:
+                with open(os.path.join(folder, *ref.split('/'))) as f:
+                    return f.read().strip()
+            except OSError:
+                pass
+        try:
+            with open(os.path.join(self.common_dir, 'packed-refs')) as f:
+                for line in f:
+                    if line.startswith(('#', '^')):
+                        continue
+                    value, _, name = line.strip().partition(' ')
+                    if name == ref:
+                        return value
+        except OSError:
+            pass
+        return None
+
+    def resolve(self, rev: str = 'HEAD') -> bytes:
+        """
+        Hash of the object a revision points to. Full hashes,
+        HEAD, branches, tags and other refs are understood, then
+        unique prefixes of at least 4 hex digits of objects.
+        Expressions like `HEAD~2` aren't.
+        """
+        if re.fullmatch('[0-9a-fA-F]{{{}}}'.format(self.hash_size * 2), rev):
+            return bytes.fromhex(rev)
+        candidates = [rev] if rev == 'HEAD' or rev.startswith('refs/') else [
+            'refs/' + rev, 'refs/tags/' + rev, 'refs/heads/' + rev, 'refs/remotes/' + rev
+        ]
+        for ref in candidates:
+            # Symbolic refs point to other refs
+            for _ in range(8):
+                value = self._read_ref(ref)
+                if value is None or not value.startswith('ref:'):
+                    break
+                ref = value[len('ref:'):].strip()
+            if value is not None and not value.startswith('ref:'):
+                return bytes.fromhex(value)
+        if re.fullmatch('[0-9a-fA-F]{{4,{}}}'.format(self.hash_size * 2 - 1), rev):
+            objects = ObjectStore(self)
+            try:
+                shas = objects.find_prefix(rev.lower())
+            finally:
+                objects.close()
+            if len(shas) > 1:
+                raise GitError('Ambiguous revision: {} ({})'.format(
+                    rev, ', '.join(sorted(sha.hex() for sha in shas))
+                ))
+            if shas:
+                return shas.pop()
+        raise GitError('Unknown revision: {}'.format(rev))
+
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    # Offset encoding used by index v4
+    byte = data[offset]
+    offset += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[offset]
+        offset += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, offset
+
+
+def parse_index(data: bytes, hash_size: int = 20) -> List[IndexEntry]:
+    if len(data) < 12 or data[:4] != INDEX_SIGNATURE:
+        raise GitError('Invalid git index signature')
+    version, count = struct.unpack_from('>II', data, 4)
+    if version not in (2, 3, 4):
+        raise GitError('Unsupported git index version: {}'.format(version))
+
+    entries = []
+    offset = 12
+    previous_path = b''
+    for _ in range(count):
+        entry_start = offset
+        (ctime, ctime_ns, mtime, mtime_ns, _, ino, mode, _, _, size) = _ENTRY_HEADER.unpack_from(data, offset)
+        offset += _ENTRY_HEADER.size
+        sha = data[offset:offset + hash_size]
+        offset += hash_size
+        flags, = struct.unpack_from('>H', data, offset)
+        offset += 2
+        extended_flags = 0
+        if version >= 3 and flags & _FLAG_EXTENDED:
+            extended_flags, = struct.unpack_from('>H', data, offset)
+            offset += 2
+
+        if version == 4:
+            # Path is stored as the number of bytes to strip
+            # from the previous path and a suffix to append
+            strip, offset = _read_varint(data, offset)
+            end = data.index(b'\0', offset)
+            path = previous_path[:len(previous_path) - strip] + data[offset:end]
+            offset = end + 1
+        else:
+            name_length = flags & _FLAG_NAME_MASK
+            if name_length < _FLAG_NAME_MASK:
+                end = offset + name_length
+            else:
+                end = data.index(b'\0', offset)
+            path = data[offset:end]
+            # Entries are NUL padded to
+            # a multiple of eight bytes
+            entry_length = end - entry_start + 1
+            offset = entry_start + (entry_length + 7) // 8 * 8
+        previous_path = path
+
+        entries.append(IndexEntry(
+            path=path.decode('utf-8', 'surrogateescape'),
+            mode=mode,
+            ctime=ctime * _NS + ctime_ns,
+            mtime=mtime * _NS + mtime_ns,
+            ino=ino,
+            size=size,
+            sha=sha,
+            stage=(flags & _FLAG_STAGE_MASK) >> 12,
+            skip_worktree=bool(extended_flags & _EXTENDED_SKIP_WORKTREE)
+        ))
+
+    # Split index keeps most of the entries in
+    # another file which isn't supported for now
+    end = len(data) - hash_size
+    while offset + 8 <= end:
+        signature = data[offset:offset + 4]
+        extension_size, = struct.unpack_from('>I', data, offset + 4)
+        if signature == b'link':
+            raise GitError('Split git index is not supported')
+        offset += 8 + extension_size
+    return entries
+
+
+def _time_matches(entry_time: int, st_time: int) -> bool:
+    # Nanoseconds are 0 when git doesn't record them,
+    # only seconds can be compared then
+    seconds, nanoseconds = divmod(entry_time, _NS)
+    if st_time // _NS & 0xffffffff != seconds:
+        return False
+    return not nanoseconds or st_time % _NS == nanoseconds
+
+
+def stat_matches(entry: IndexEntry, st: os.stat_result, index_mtime: int, trust_ctime: bool = True) -> bool:
+    """
+    Whether the worktree file is known to have the content of
+    the entry: size, inode, mtime and ctime (unless git is told
+    not to trust it) match to the nanosecond where recorded.
+    Entries modified no earlier than the index was written
+    are racy, a change later on in the same tick wouldn't be
+    seen, so they can't be trusted by stat data.
+    """
+    if (entry.stage != 0
+            or st.st_size & 0xffffffff != entry.size
+            or (entry.ino and st.st_ino & 0xffffffff != entry.ino)
+            or not _time_matches(entry.mtime, st.st_mtime_ns)
+            or (trust_ctime and not _time_matches(entry.ctime, st.st_ctime_ns))):
+        return False
+    if entry.mtime % _NS:
+        return entry.mtime < index_mtime % (_NS << 32)
+    return entry.mtime // _NS < index_mtime // _NS & 0xffffffff
+
+
+class GitFilesCollector(FilesCollector):
+    """
+    Collects files tracked in the git index
+    instead of walking the folder.
+    """
+
+    def __init__(self,
+                 folder_path: str = None,
+                 ignore: List[str] = None,
+                 extensions: List[str] = None,
+                 stats: Stats = None):
+        FilesCollector.__init__(
+            self,
+            folder_path=folder_path,
+            ignore=ignore,
+            extensions=extensions,
+            stats=stats
+        )
+        self.repository = Repository(self.folder_path)
+
+    def __iter__(self) -> Iterable[File]:
+        repository = self.repository
+        entries = repository.read_index()
+        written = repository.index_mtime()
+
+        prefix = os.path.relpath(self.folder_path, repository.work_tree)
+        prefix = '' if prefix == '.' else prefix.replace(os.sep, '/') + '/'
+
+        ignore_parser = self.ignore_parser
+        extensions = set(self.extensions)
+        seen = set()
+        directory = None
+        evaluations = ignore_parser.evaluations
+        pruned = 0
+        stat_calls = 1
+        try:
+            for entry in entries:
+                if entry.skip_worktree:
+                    continue
+                if entry.mode & _MODE_TYPE_MASK != _MODE_REGULAR:
+                    continue
+                if not entry.path.startswith(prefix):
+                    continue
+                # Conflicting entries have several stages
+                if entry.path in seen:
+                    continue
+                seen.add(entry.path)
+
+                file_name = entry.path.rsplit('/', 1)[-1]
+                if os.path.splitext(file_name)[-1] not in extensions:
+                    pruned += 1
+                    continue
+                file_path = os.path.join(repository.work_tree, *entry.path.split('/'))
+                if ignore_parser.matches(file_path):
+                    pruned += 1
+                    continue
+
+                stat_calls += 1
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    # Deleted in the worktree
+                    continue
+
+                # Index entries are sorted, files of
+                # one folder share its path string
+                entry_directory = file_path[:len(file_path) - len(file_name) - 1]
+                if entry_directory != directory:
+                    directory = entry_directory
+                file = File.from_path(file_path, file_name, directory)
+                if stat_matches(entry, st, written, repository.trust_ctime):
+                    file.blob_sha = entry.sha
+                yield file
+        finally:
+            if self.stats is not None:
+                self.stats.add('index_entries', len(entries))
+                self.stats.add('entries_pruned', pruned)
+                self.stats.add('stat_calls', stat_calls)
+                self.stats.add('ignore_evaluations', ignore_parser.evaluations - evaluations)
+
+
+class Commit(NamedTuple):
+    tree: bytes
+    parents: Tuple[bytes, ...]
+    # Committer timestamp
+    time: int
+
+
+class TreeEntry(NamedTuple):
+    mode: int
+    name: str
+    sha: bytes
+
+
+def parse_commit(data: bytes) -> Commit:
+    tree = None
+    parents = []
+    time = 0
+    for line in data.split(b'\n'):
+        if not line:
+            # Message follows the headers
+            break
+        name, _, value = line.partition(b' ')
+        if name == b'tree':
+            tree = bytes.fromhex(value.decode('ascii'))
+        elif name == b'parent':
+            parents.append(bytes.fromhex(value.decode('ascii')))
+        elif name == b'committer':
+            time = int(value.rsplit(b' ', 2)[-2])
+    if tree is None:
+        raise GitError('Invalid commit object')
+    return Commit(tree, tuple(parents), time)
+
+
+def parse_tree(data: bytes, hash_size: int = 20) -> List[TreeEntry]:
+    entries = []
+    offset = 0
+    while offset < len(data):
+        space = data.index(b' ', offset)
+        end = data.index(b'\0', space)
+        entries.append(TreeEntry(
+            mode=int(data[offset:space], 8),
+            name=data[space + 1:end].decode('utf-8', 'surrogateescape'),
+            sha=data[end + 1:end + 1 + hash_size]
+        ))
+        offset = end + 1 + hash_size
+    return entries
+
+
+def is_tree(mode: int) -> bool:
+    return mode & _MODE_TYPE_MASK == _MODE_DIRECTORY
+
+
+def is_regular(mode: int) -> bool:
+    return mode & _MODE_TYPE_MASK == _MODE_REGULAR
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    # Delta starts with sizes of the base and the result
+    # followed by copy from base and insert instructions
+    _, offset = _read_size(delta, 0)
+    size, offset = _read_size(delta, offset)
+    result = bytearray()
+    while offset < len(delta):
+        opcode = delta[offset]
+        offset += 1
+        if opcode & 0x80:
+            copy_offset = 0
+            copy_size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    copy_offset |= delta[offset] << (8 * i)
+                    offset += 1
+            for i in range(3):
+                if opcode & (0x10 << i):
+                    copy_size |= delta[offset] << (8 * i)
+                    offset += 1
+            result += base[copy_offset:copy_offset + (copy_size or 0x10000)]
+        elif opcode:
+            result += delta[offset:offset + opcode]
+            offset += opcode
+        else:
+            raise GitError('Invalid delta instruction')
+    if len(result) != size:
+        raise GitError('Invalid delta result size')
+    return bytes(result)
+
+
+def _read_size(data: bytes, offset: int) -> Tuple[int, int]:
+    # Little endian base 128 used by deltas
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+class _Pack:
+    # Pack file looked up through its version 2 index
+
+    def __init__(self, index_path: str, hash_size: int):
+        with open(index_path, 'rb') as f:
+            data = f.read()
+        if data[:4] != PACK_INDEX_SIGNATURE or struct.unpack_from('>I', data, 4)[0] != 2:
+            raise GitError('Unsupported pack index: {}'.format(index_path))
+        self.hash_size = hash_size
+        self.fanout = struct.unpack_from('>256I', data, 8)
+        count = self.fanout[255]
+        shas_start = 8 + 256 * 4
+        offsets_start = shas_start + count * (hash_size + 4)
+        self.shas = data[shas_start:shas_start + count * hash_size]
+        self.offsets = data[offsets_start:offsets_start + count * 4]
+        self.large_offsets = data[offsets_start + count * 4:]
+        self.pack_path = index_path[:-len('.idx')] + '.pack'
+        self._data = None
+
+    @property
+    def data(self) -> mmap.mmap:
+        if self._data is None:
+            with open(self.pack_path, 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    def find(self, sha: bytes) -> Optional[int]:
+        # Binary search among hashes
+        # sharing the first byte
+        hash_size = self.hash_size
+        low = self.fanout[sha[0] - 1] if sha[0] else 0
+        high = self.fanout[sha[0]]
+        while low < high:
+            middle = (low + high) // 2
+            current = self.shas[middle * hash_size:(middle + 1) * hash_size]
+            if current < sha:
+                low = middle + 1
+            elif current > sha:
+                high = middle
+            else:
+                offset, = struct.unpack_from('>I', self.offsets, middle * 4)
+                if offset & 0x80000000:
+                    offset, = struct.unpack_from('>Q', self.large_offsets, (offset & 0x7fffffff) * 8)
+                return offset
+        return None
+
+    def find_prefix(self, prefix: str) -> Set[bytes]:
+        # Hashes starting with the hex prefix, searched
+        # from the lowest hash they can be
+        hash_size = self.hash_size
+        lowest = bytes.fromhex(prefix.ljust(hash_size * 2, '0'))
+        low = self.fanout[lowest[0] - 1] if lowest[0] else 0
+        high = self.fanout[lowest[0]]
+        while low < high:
+            middle = (low + high) // 2
+            if self.shas[middle * hash_size:(middle + 1) * hash_size] < lowest:
+                low = middle + 1
+            else:
+                high = middle
+        shas = set()
+        for position in range(low, self.fanout[lowest[0]]):
+            sha = self.shas[position * hash_size:(position + 1) * hash_size]
+            if not sha.hex().startswith(prefix):
+                break
+            shas.add(sha)
+        return shas
+
+    def _inflate(self, offset: int, size: int) -> bytes:
+        data = self.data
+        decompressor = zlib.decompressobj()
+        chunks = []
+        step = size + 64
+        while not decompressor.eof:
+            chunk = data[offset:offset + step]
+            if not chunk:
+                raise GitError('Truncated pack: {}'.format(self.pack_path))
+            chunks.append(decompressor.decompress(chunk))
+            offset += step
+        return b''.join(chunks)
+
+    def entry(self, offset: int) -> tuple:
+        # (type, data, base) of the entry, base is the offset
+        # or hash of the delta base object for deltas
+        data = self.data
+        start = offset
+        byte = data[offset]
+        offset += 1
+        kind = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = data[offset]
+            offset += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+
+        base = None
+        if kind == _OFS_DELTA:
+            byte = data[offset]
+            offset += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = data[offset]
+                offset += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base = start - distance
+        elif kind == _REF_DELTA:
+            base = bytes(data[offset:offset + self.hash_size])
+            offset += self.hash_size
+        elif kind not in _PACK_TYPES:
+            raise GitError('Invalid pack entry type: {}'.format(kind))
+        return kind, self._inflate(offset, size), base
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+
+class ObjectStore:
+    """
+    Reads objects of a repository straight from loose
+    files and packs, nothing is checked out. Recently
+    read objects are kept to resolve delta chains.
+    """
+
+    def __init__(self, repository: Repository):
+        self.hash_size = repository.hash_size
+        self.folders = [os.path.join(repository.common_dir, 'objects')]
+        # Objects borrowed from other repositories
+        try:
+            with open(os.path.join(self.folders[0], 'info', 'alternates')) as f:
+                self.folders += [
+                    os.path.join(self.folders[0], line.strip())
+                    for line in f if line.strip() and not line.startswith('#')
+                ]
+        except OSError:
+            pass
+        self._packs: Dict[str, _Pack] = {}
+        self._cache: 'OrderedDict[tuple, Tuple[str, bytes]]' = OrderedDict()
+        self._cache_size = 0
+        self._load_packs()
+
+    def _load_packs(self):
+        for folder in self.folders:
+            pack_folder = os.path.join(folder, 'pack')
+            try:
+                names = os.listdir(pack_folder)
+            except OSError:
+                continue
+            for name in sorted(names):
+                index_path = os.path.join(pack_folder, name)
+                if name.endswith('.idx') and index_path not in self._packs:
+                    self._packs[index_path] = _Pack(index_path, self.hash_size)
+
+    def _cached(self, key: tuple, value: Tuple[str, bytes]) -> Tuple[str, bytes]:
+        self._cache[key] = value
+        self._cache_size += len(value[1])
+        while self._cache_size > OBJECT_CACHE_SIZE and len(self._cache) > 1:
+            _, (_, dropped) = self._cache.popitem(last=False)
+            self._cache_size -= len(dropped)
+        return value
+
+    def _packed(self, pack: _Pack, offset: int) -> Tuple[str, bytes]:
+        key = (pack.pack_path, offset)
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.move_to_end(key)
+            return value
+        kind, data, base = pack.entry(offset)
+        if kind == _OFS_DELTA:
+            base_kind, base_data = self._packed(pack, base)
+            return self._cached(key, (base_kind, apply_delta(base_data, data)))
+        if kind == _REF_DELTA:
+            base_kind, base_data = self.read(base)
+            return self._cached(key, (base_kind, apply_delta(base_data, data)))
+        return self._cached(key, (_PACK_TYPES[kind], data))
+
+    def _loose(self, sha: bytes) -> Optional[Tuple[str, bytes]]:
+        name = sha.hex()
+        for folder in self.folders:
+            try:
+                with open(os.path.join(folder, name[:2], name[2:]), 'rb') as f:
+                    data = zlib.decompress(f.read())
+            except OSError:
+                continue
+            header, _, data = data.partition(b'\0')
+            return header.split(b' ', 1)[0].decode('ascii'), data
+        return None
+
+    def find_prefix(self, prefix: str) -> Set[bytes]:
+        """
+        Hashes of objects starting with the lowercase
+        hex prefix, loose ones and ones in packs.
+        """
+        self._load_packs()
+        shas = set()
+        for pack in self._packs.values():
+            shas |= pack.find_prefix(prefix)
+        for folder in self.folders:
+            try:
+                names = os.listdir(os.path.join(folder, prefix[:2]))
+            except OSError:
+                continue
+            shas.update(
+                bytes.fromhex(prefix[:2] + name) for name in names
+                if name.startswith(prefix[2:]) and len(name) == self.hash_size * 2 - 2
+            )
+        return shas
+
+    def _find(self, sha: bytes) -> Optional[Tuple[str, bytes]]:
+        for pack in self._packs.values():
+            offset = pack.find(sha)
+            if offset is not None:
+                return self._packed(pack, offset)
+        return self._loose(sha)
+
+    def read(self, sha: bytes) -> Tuple[str, bytes]:
+        # (type, content) of the object
+        value = self._find(sha)
+        if value is None:
+            # Repacked meanwhile
+            self._load_packs()
+            value = self._find(sha)
+        if value is None:
+            raise GitError('Object not found: {}'.format(sha.hex()))
+        return value
+
+    def read_commit(self, sha: bytes) -> Commit:
+        kind, data = self.read(sha)
+        # Annotated tags point to commits
+        while kind == 'tag':
+            target = data.split(b'\n', 1)[0].split(b' ', 1)[1]
+            kind, data = self.read(bytes.fromhex(target.decode('ascii')))
+        if kind != 'commit':
+            raise GitError('Not a commit: {}'.format(sha.hex()))
+        return parse_commit(data)
+
+    def read_tree(self, sha: bytes) -> List[TreeEntry]:
+        kind, data = self.read(sha)
+        if kind != 'tree':
+            raise GitError('Not a tree: {}'.format(sha.hex()))
+        return parse_tree(data, self.hash_size)
+
+    def close(self):
+        for pack in self._packs.values():
+            pack.close()
@@ -0,0 +1,224 @@
+import csv
+import json
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+from .cache import BlobCache, Result
+from .collector import File, FilesCollector
+from .counter import count_data
+from .git import ObjectStore, Repository, is_regular, is_tree
+from .report import CountReport, ExtensionTotals
+
+# Per extension (files, lines, bytes)
+# and binary files count of a subtree
+_Totals = Tuple[Dict[str, Tuple[int, int, int]], int]
+_EMPTY: _Totals = ({}, 0)
+
+
+class HistoryPoint(NamedTuple):
+    commit: str
+    # Committer timestamp
+    time: int
+    report: CountReport
+
+
+def parse_time(value: str) -> int:
+    # Unix timestamp or ISO date,
+    # dates without zone are UTC
+    from datetime import datetime, timezone
+    if value.isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+class History:
+    """
+    Lines counts of commits read straight from the object
+    store. Blobs are counted once by hash and subtrees
+    are summed once by path and hash, so consecutive
+    commits only count what changed between them.
+    """
+
+    def __init__(self, collector: FilesCollector, cache: BlobCache = None):
+        self.collector = collector
+        self.repository = Repository(collector.folder_path)
+        self.objects = ObjectStore(self.repository)
+        self.cache = cache
+        self.extensions = set(collector.extensions)
+        self._blobs: Dict[bytes, Result] = {}
+        self._trees: Dict[Tuple[str, bytes], _Totals] = {}
+        # Counted subtrees and blobs, the
+        # rest was reused from other commits
+        self.trees_read = 0
+        self.blobs_counted = 0
+
+        prefix = os.path.relpath(collector.folder_path, self.repository.work_tree)
+        self.prefix = '' if prefix == '.' else prefix.replace(os.sep, '/')
+
+    def commits(self, rev: str = 'HEAD', since: int = None, every: int = 1) -> List[Tuple[bytes, int]]:
+        # (hash, time) of first parent commits oldest first,
+        # every Nth one counting back from the revision
+        commits = []
+        sha = self.repository.resolve(rev)
+        while sha is not None:
+            commit = self.objects.read_commit(sha)
+            if since is not None and commit.time < since:
+                break
+            commits.append((sha, commit.time))
+            sha = commit.parents[0] if commit.parents else None
+        return commits[::max(1, every)][::-1]
+
+    def path(self, rel_path: str) -> str:
+        return os.path.join(self.repository.work_tree, *rel_path.split('/'))
+
+    def blob(self, sha: bytes, rel_path: str) -> Result:
+        result = self._blobs.get(sha)
+        if result is not None:
+            return result
+        file = File.from_path(self.path(rel_path), rel_path.rpartition('/')[2])
+        try:
+            result = self.cache.get(file, sha) if self.cache is not None else None
+        except KeyError:
+            pass
+        if result is None:
+            _, data = self.objects.read(sha)
+            result = count_data(data), len(data)
+            self.blobs_counted += 1
+            if self.cache is not None:
+                self.cache.set(file, sha, result)
+        self._blobs[sha] = result
+        return result
+
+    def _tree(self, sha: bytes, rel_dir: str) -> _Totals:
+        # Ignore rules depend on paths, so subtrees
+        # are only reused at the same place
+        key = (rel_dir, sha)
+        totals = self._trees.get(key)
+        if totals is not None:
+            return totals
+
+        ignore_parser = self.collector.ignore_parser
+        extensions = {}
+        binary = 0
+        self.trees_read += 1
+        for entry in self.objects.read_tree(sha):
+            rel_path = rel_dir + '/' + entry.name if rel_dir else entry.name
+            if is_tree(entry.mode):
+                if ignore_parser.matches_dir(self.path(rel_path)):
+                    continue
+                subtree, subtree_binary = self._tree(entry.sha, rel_path)
+                binary += subtree_binary
+                for file_ext, (files, lines, size) in subtree.items():
+                    current = extensions.get(file_ext, (0, 0, 0))
+                    extensions[file_ext] = (current[0] + files, current[1] + lines, current[2] + size)
+            elif is_regular(entry.mode):
+                file_ext = os.path.splitext(entry.name)[-1]
+                if file_ext not in self.extensions:
+                    continue
+                if ignore_parser.matches(self.path(rel_path)):
+                    continue
+                lines, size = self.blob(entry.sha, rel_path)
+                if lines is None:
+                    binary += 1
+                    continue
+                current = extensions.get(file_ext, (0, 0, 0))
+                extensions[file_ext] = (current[0] + 1, current[1] + lines, current[2] + size)
+
+        totals = self._trees[key] = (extensions, binary)
+        return totals
+
+    def folder_tree(self, tree: bytes) -> Optional[bytes]:
+        # Tree of the counted folder in the commit
+        if self.prefix:
+            for name in self.prefix.split('/'):
+                for entry in self.objects.read_tree(tree):
+                    if entry.name == name and is_tree(entry.mode):
+                        tree = entry.sha
+                        break
+                else:
+                    return None
+        return tree
+
+    def count(self, sha: bytes) -> CountReport:
+        collector = self.collector
+        report = CountReport(
+            folder_path=collector.folder_path,
+            extensions=collector.extensions,
+            ignore=collector.ignore,
+            keep_files=False
+        )
+        tree = self.folder_tree(self.objects.read_commit(sha).tree)
+        extensions, report.binary_files = self._tree(tree, self.prefix) if tree is not None else _EMPTY
+        for file_ext, (files, lines, size) in extensions.items():
+            report.totals[file_ext] = ExtensionTotals(files, lines, size)
+        return report
+
+    def points(self, rev: str = 'HEAD', since: int = None, every: int = 1) -> Iterator[HistoryPoint]:
+        for sha, time in self.commits(rev, since, every):
+            yield HistoryPoint(sha.hex(), time, self.count(sha))
+        if self.cache is not None:
+            self.cache.save()
+
+    def close(self):
+        self.objects.close()
+
+
+class HistoryReport:
+    """
+    Time series of per extension totals,
+    one point per counted commit.
+    """
+
+    def __init__(self, folder_path: str, extensions: List[str], ignore: List[str], points: List[HistoryPoint]):
+        self.folder_path = folder_path
+        self.extensions = list(extensions)
+        self.ignore = list(ignore)
+        self.points = points
+
+    @property
+    def extension_names(self) -> List[str]:
+        # Every extension seen in any commit
+        return sorted({
+            file_ext for point in self.points for file_ext in point.report.totals
+        })
+
+    def to_dict(self) -> dict:
+        return {
+            'folder_path': self.folder_path,
+            'extensions': self.extensions,
+            'ignore': self.ignore,
+            'commits': [
+                {
+                    'commit': point.commit,
+                    'time': point.time,
+                    'binary_files': point.report.binary_files,
+                    'totals': point.report.to_dict()['totals']
+                }
+                for point in self.points
+            ]
+        }
+
+    def _rows(self) -> Iterator[dict]:
+        # One row per commit and extension
+        for point in self.points:
+            for file_ext, totals in sorted(point.report.totals.items()):
+                row = {'commit': point.commit, 'time': point.time, 'extension': file_ext}
+                row.update(totals.to_dict())
+                yield row
+
+    def write(self, stream: TextIO, format: str = 'json'):
+        if format == 'json':
+            json.dump(self.to_dict(), stream)
+            stream.write('\n')
+        elif format == 'ndjson':
+            for row in self._rows():
+                stream.write(json.dumps(row) + '\n')
+        elif format == 'csv':
+            fields = ['commit', 'time', 'extension', 'files', 'lines', 'bytes']
+            writer = csv.DictWriter(stream, fields, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(self._rows())
+        else:
+            raise ValueError('Unknown format: {}'.format(format))
@@ -0,0 +1,634 @@
+import csv
+import heapq
+import json
+import math
+import os
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, TextIO, Tuple
+from .table import FileTable
+
+
+_CSV_FIELDS = ['path', 'extension', 'files', 'lines', 'bytes']
+# Columns of classified reports
+_KINDS = ['code', 'comment', 'blank']
+# Stored for files of languages
+# which aren't known
+_UNKNOWN = -1
+
+
+class FileRecord(NamedTuple):
+    path: str
+    extension: str
+    lines: int
+    bytes: int
+    code: Optional[int] = None
+    comment: Optional[int] = None
+    blank: Optional[int] = None
+
+
+class DuplicateGroup(NamedTuple):
+    # Lines and bytes of one copy
+    lines: int
+    bytes: int
+    paths: List[str]
+
+    @property
+    def wasted_lines(self) -> int:
+        return self.lines * (len(self.paths) - 1)
+
+
+class ExtensionTotals:
+    __slots__ = ('files_count', 'lines', 'bytes', 'code', 'comment', 'blank', 'lines_margin')
+
+    def __init__(self,
+                 files_count: int = 0,
+                 lines: int = 0,
+                 bytes: int = 0,
+                 code: int = None,
+                 comment: int = None,
+                 blank: int = None):
+        self.files_count = files_count
+        self.lines = lines
+        self.bytes = bytes
+        # None unless files were classified
+        self.code = code
+        self.comment = comment
+        self.blank = blank
+        # Half width of the 95% interval
+        # of estimated lines, None if exact
+        self.lines_margin: Optional[int] = None
+
+    @property
+    def classified(self) -> bool:
+        return self.code is not None
+
+    def add_kinds(self, kinds: Sequence[int], sign: int = 1):
+        code, comment, blank = kinds
+        if self.code is None:
+            self.code = self.comment = self.blank = 0
+        self.code += sign * code
+        self.comment += sign * comment
+        self.blank += sign * blank
+
+    def to_dict(self) -> dict:
+        result = {
+            'files': self.files_count,
+            'lines': self.lines,
+            'bytes': self.bytes
+        }
+        if self.classified:
+            result.update(code=self.code, comment=self.comment, blank=self.blank)
+        if self.lines_margin is not None:
+            result['lines_margin'] = self.lines_margin
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ExtensionTotals':
+        totals = cls(
+            data['files'], data['lines'], data['bytes'],
+            data.get('code'), data.get('comment'), data.get('blank')
+        )
+        # Empty in CSV, missing in JSON
+        if data.get('lines_margin') not in (None, ''):
+            totals.lines_margin = int(data['lines_margin'])
+        return totals
+
+
+def _add_totals(totals_by_ext: Dict[str, ExtensionTotals],
+                file_ext: str,
+                lines: int,
+                size: int,
+                kinds: Sequence[int] = None):
+    totals = totals_by_ext.get(file_ext)
+    if totals is None:
+        totals = totals_by_ext[file_ext] = ExtensionTotals()
+    totals.files_count += 1
+    totals.lines += lines
+    totals.bytes += size
+    if kinds is not None:
+        totals.add_kinds(kinds)
+
+
+def _merge_totals(totals_by_ext: Dict[str, ExtensionTotals], other: Dict[str, ExtensionTotals]):
+    for file_ext, other_totals in other.items():
+        totals = totals_by_ext.get(file_ext)
+        if totals is None:
+            totals = totals_by_ext[file_ext] = ExtensionTotals()
+        totals.files_count += other_totals.files_count
+        totals.lines += other_totals.lines
+        totals.bytes += other_totals.bytes
+        if other_totals.classified:
+            totals.add_kinds((other_totals.code, other_totals.comment, other_totals.blank))
+        if other_totals.lines_margin is not None:
+            # Errors of independent estimates
+            totals.lines_margin = round(math.hypot(totals.lines_margin or 0, other_totals.lines_margin))
+
+
+class CountReport:
+    """
+    Result of counting a folder.
+
+    Files are stored as columns: a FileTable of paths relative
+    to the folder and arrays of lines and bytes. With
+    `keep_files` disabled only per-extension totals are kept.
+    Classified reports have code, comment and blank columns.
+    Deduplicated reports also have totals with copies of
+    a file left out and the largest groups of copies.
+    Estimated reports have totals extrapolated from a
+    sample of files with margins of their lines.
+
+    Reports without files can still keep the `top_files`
+    files with most lines in a bounded heap and, with
+    `by_directory`, totals of every directory's own files,
+    so that rollups don't need a row per file.
+    """
+
+    def __init__(self,
+                 folder_path: str = '',
+                 extensions: List[str] = None,
+                 ignore: List[str] = None,
+                 keep_files: bool = True,
+                 classified: bool = False,
+                 deduplicated: bool = False,
+                 estimated: bool = False,
+                 top_files: int = None,
+                 by_directory: bool = False):
+        self.folder_path = folder_path
+        self.folder_name = os.path.split(folder_path)[-1]
+        self.extensions = list(extensions) if extensions else []
+        self.ignore = list(ignore) if ignore else []
+        self.keep_files = keep_files
+        self.classified = classified
+
+        self.table = FileTable()
+        self.lines_column = array('q')
+        self.bytes_column = array('q')
+        self.code_column = array('q')
+        self.comment_column = array('q')
+        self.blank_column = array('q')
+
+        self.totals: Dict[str, ExtensionTotals] = {}
+        self.binary_files = 0
+        # None unless copies were looked for
+        self.unique_totals: Optional[Dict[str, ExtensionTotals]] = {} if deduplicated else None
+        self.duplicates: List[DuplicateGroup] = []
+        self.estimated = estimated
+        # Files counted to estimate totals
+        self.sampled_files = 0
+        # Counting stopped at a time budget, files
+        # of the report are the counted ones
+        self.partial = False
+        # So did the walk, files it didn't reach
+        # are unknown and left out of totals
+        self.truncated = False
+
+        self.top_files = top_files
+        # Min-heap of (lines, -order, path, extension, bytes,
+        # kinds), earlier files win ties like in a full sort
+        self.largest: List[tuple] = []
+        self._added = 0
+        # Directory -> extension -> [files, lines, bytes]
+        # of files directly in the directory
+        self.directories: Optional[Dict[str, Dict[str, List[int]]]] = {} if by_directory else None
+
+    @property
+    def deduplicated(self) -> bool:
+        return self.unique_totals is not None
+
+    def _relative(self, file_path: str) -> str:
+        if self.folder_path and file_path.startswith(self.folder_path + os.sep):
+            file_path = file_path[len(self.folder_path) + 1:]
+        return file_path.replace(os.sep, '/')
+
+    def add(self,
+            file_path: str,
+            file_ext: str,
+            lines: Optional[int],
+            size: int,
+            kinds: Sequence[int] = None,
+            copy: bool = False):
+        # Binary files are only counted
+        if lines is None:
+            self.binary_files += 1
+            return
+
+        _add_totals(self.totals, file_ext, lines, size, kinds)
+        # Copies of files counted before
+        # are left out of unique totals
+        if self.unique_totals is not None and not copy:
+            _add_totals(self.unique_totals, file_ext, lines, size, kinds)
+
+        if self.keep_files:
+            self._load_file(self._relative(file_path), file_ext, lines, size, kinds)
+            return
+        if self.top_files:
+            self._add_largest(self._relative(file_path), file_ext, lines, size, kinds)
+        if self.directories is not None:
+            self._add_directory(self._relative(file_path).rpartition('/')[0], file_ext, 1, lines, size)
+
+    def _add_largest(self, path: str, file_ext: str, lines: int, size: int, kinds: Sequence[int] = None):
+        self._added += 1
+        entry = (lines, -self._added, path, file_ext, size, tuple(kinds) if kinds is not None else None)
+        if len(self.largest) < self.top_files:
+            heapq.heappush(self.largest, entry)
+        elif entry > self.largest[0]:
+            heapq.heapreplace(self.largest, entry)
+
+    def _add_directory(self, directory: str, file_ext: str, files_count: int, lines: int, size: int):
+        extensions = self.directories.get(directory)
+        if extensions is None:
+            extensions = self.directories[directory] = {}
+        totals = extensions.get(file_ext)
+        if totals is None:
+            extensions[file_ext] = [files_count, lines, size]
+        else:
+            totals[0] += files_count
+            totals[1] += lines
+            totals[2] += size
+
+    def largest_records(self) -> List[FileRecord]:
+        # Files of the heap, most lines first
+        return [
+            FileRecord(path, file_ext, lines, size, *(kinds or (None, None, None)))
+            for lines, _, path, file_ext, size, kinds in sorted(self.largest, reverse=True)
+        ]
+
+    def add_duplicates(self, lines: int, size: int, paths: List[str]):
+        self.duplicates.append(DuplicateGroup(lines, size, [self._relative(path) for path in paths]))
+
+    def discard(self,
+                file_ext: str,
+                lines: Optional[int],
+                size: int,
+                kinds: Sequence[int] = None):
+        # Reverts `add` of a file in totals, files
+        # can't be removed from the columns
+        if self.keep_files:
+            raise ValueError('Only reports without files support discarding')
+        if lines is None:
+            self.binary_files -= 1
+            return
+        totals = self.totals[file_ext]
+        totals.files_count -= 1
+        totals.lines -= lines
+        totals.bytes -= size
+        if kinds is not None:
+            totals.add_kinds(kinds, -1)
+        if not totals.files_count:
+            del self.totals[file_ext]
+
+    @property
+    def files_count(self) -> int:
+        return sum(totals.files_count for totals in self.totals.values())
+
+    @property
+    def total_lines(self) -> int:
+        return sum(totals.lines for totals in self.totals.values())
+
+    @property
+    def unique_files_count(self) -> int:
+        return sum(totals.files_count for totals in self.unique_totals.values())
+
+    @property
+    def unique_lines(self) -> int:
+        return sum(totals.lines for totals in self.unique_totals.values())
+
+    @property
+    def lines_margin(self) -> int:
+        return round(math.sqrt(sum(
+            totals.lines_margin ** 2 for totals in self.totals.values() if totals.lines_margin is not None
+        )))
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(totals.bytes for totals in self.totals.values())
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self) -> Iterator[FileRecord]:
+        names = self.table.extension_names
+        rows = zip(self.table, self.table.extension_column, self.lines_column, self.bytes_column)
+        if not self.classified:
+            for path, extension_id, lines, size in rows:
+                yield FileRecord(path, names[extension_id], lines, size)
+            return
+        for (path, extension_id, lines, size), *kinds in zip(
+                rows, self.code_column, self.comment_column, self.blank_column):
+            if kinds[0] == _UNKNOWN:
+                kinds = (None, None, None)
+            yield FileRecord(path, names[extension_id], lines, size, *kinds)
+
+    def record(self, i: int) -> FileRecord:
+        table = self.table
+        kinds = self.kinds(i) or (None, None, None)
+        return FileRecord(table.path(i), table.extension(i), self.lines_column[i], self.bytes_column[i], *kinds)
+
+    def kinds(self, i: int) -> Optional[Tuple[int, int, int]]:
+        # Code, comment and blank lines of the
+        # file in the row, None when not known
+        if not self.classified or self.code_column[i] == _UNKNOWN:
+            return None
+        return self.code_column[i], self.comment_column[i], self.blank_column[i]
+
+    def _file_row(self, record: FileRecord) -> dict:
+        row = record._asdict()
+        if not self.classified:
+            for kind in _KINDS:
+                del row[kind]
+        return row
+
+    def files_by_extension(self) -> Dict[str, List[int]]:
+        # Row indices of files grouped
+        # by extension in counting order
+        table = self.table
+        groups = [[] for _ in table.extension_names]
+        for i, extension_id in enumerate(table.extension_column):
+            groups[extension_id].append(i)
+        return dict(zip(table.extension_names, groups))
+
+    # Serialization
+
+    def _meta(self) -> dict:
+        meta = {
+            'folder_path': self.folder_path,
+            'extensions': self.extensions,
+            'ignore': self.ignore,
+            'binary_files': self.binary_files
+        }
+        if self.classified:
+            meta['classified'] = True
+        if self.deduplicated:
+            meta['deduplicated'] = True
+        if self.estimated:
+            meta['estimated'] = True
+            meta['sampled_files'] = self.sampled_files
+        if self.partial:
+            meta['partial'] = True
+        if self.truncated:
+            meta['truncated'] = True
+        return meta
+
+    def to_dict(self) -> dict:
+        result = self._meta()
+        result['totals'] = {
+            file_ext: totals.to_dict() for file_ext, totals in sorted(self.totals.items())
+        }
+        if self.deduplicated:
+            result['unique_totals'] = {
+                file_ext: totals.to_dict() for file_ext, totals in sorted(self.unique_totals.items())
+            }
+            result['duplicates'] = [group._asdict() for group in self.duplicates]
+        if self.keep_files:
+            result['files'] = [self._file_row(record) for record in self]
+        if self.top_files:
+            result['top_files'] = self.top_files
+            result['largest'] = [self._file_row(record) for record in self.largest_records()]
+        if self.directories is not None:
+            result['directories'] = self.directories
+        return result
+
+    def _ndjson_rows(self) -> Iterator[dict]:
+        meta = self._meta()
+        meta['type'] = 'report'
+        yield meta
+        for file_ext, totals in sorted(self.totals.items()):
+            row = totals.to_dict()
+            row['type'] = 'extension'
+            row['extension'] = file_ext
+            yield row
+        if self.deduplicated:
+            for file_ext, totals in sorted(self.unique_totals.items()):
+                row = totals.to_dict()
+                row['type'] = 'unique_extension'
+                row['extension'] = file_ext
+                yield row
+            for group in self.duplicates:
+                row = group._asdict()
+                row['type'] = 'duplicates'
+                yield row
+        for record in self:
+            row = self._file_row(record)
+            row['type'] = 'file'
+            yield row
+
+    def _csv_fields(self) -> List[str]:
+        fields = _CSV_FIELDS + _KINDS if self.classified else _CSV_FIELDS
+        return fields + ['lines_margin'] if self.estimated else fields
+
+    def _csv_rows(self) -> Iterator[list]:
+        # One row per file, or per extension
+        # when files weren't kept
+        if self.keep_files:
+            for record in self:
+                row = [record.path, record.extension, 1, record.lines, record.bytes]
+                if self.classified:
+                    row += ['' if kind is None else kind for kind in record[4:]]
+                yield row
+        else:
+            for file_ext, totals in sorted(self.totals.items()):
+                row = ['', file_ext, totals.files_count, totals.lines, totals.bytes]
+                if self.classified:
+                    row += [totals.code, totals.comment, totals.blank] if totals.classified else ['', '', '']
+                if self.estimated:
+                    row.append('' if totals.lines_margin is None else totals.lines_margin)
+                yield row
+
+    def write(self, stream: TextIO, format: str = 'json'):
+        if format == 'json':
+            json.dump(self.to_dict(), stream)
+            stream.write('\n')
+        elif format == 'ndjson':
+            for row in self._ndjson_rows():
+                stream.write(json.dumps(row) + '\n')
+        elif format == 'csv':
+            writer = csv.writer(stream, lineterminator='\n')
+            writer.writerow(self._csv_fields())
+            writer.writerows(self._csv_rows())
+        else:
+            raise ValueError('Unknown format: {}'.format(format))
+
+    @classmethod
+    def merged(cls, reports: List['CountReport']) -> 'CountReport':
+        # Totals of several reports, files aren't kept
+        report = cls(keep_files=False)
+        for other in reports:
+            report.classified = report.classified or other.classified
+            report.extensions.extend(
+                file_ext for file_ext in other.extensions if file_ext not in report.extensions)
+            report.binary_files += other.binary_files
+            report.estimated = report.estimated or other.estimated
+            report.sampled_files += other.sampled_files
+            report.partial = report.partial or other.partial
+            report.truncated = report.truncated or other.truncated
+            _merge_totals(report.totals, other.totals)
+            if other.deduplicated:
+                if report.unique_totals is None:
+                    report.unique_totals = {}
+                _merge_totals(report.unique_totals, other.unique_totals)
+                # Paths are made relative to no root
+                report.duplicates.extend(
+                    group._replace(paths=[os.path.join(other.folder_path, path) for path in group.paths])
+                    for group in other.duplicates
+                )
+        report.duplicates.sort(key=lambda group: group.wasted_lines, reverse=True)
+        return report
+
+    @classmethod
+    def _from_meta(cls, meta: dict, keep_files: bool) -> 'CountReport':
+        report = cls(
+            folder_path=meta.get('folder_path', ''),
+            extensions=meta.get('extensions'),
+            ignore=meta.get('ignore'),
+            keep_files=keep_files,
+            classified=meta.get('classified', False),
+            deduplicated=meta.get('deduplicated', False),
+            estimated=meta.get('estimated', False)
+        )
+        report.binary_files = meta.get('binary_files', 0)
+        report.sampled_files = meta.get('sampled_files', 0)
+        report.partial = meta.get('partial', False)
+        report.truncated = meta.get('truncated', False)
+        return report
+
+    def _load_file(self, path: str, file_ext: str, lines: int, size: int, kinds: Sequence[int] = None):
+        self.table.append(path, file_ext)
+        self.lines_column.append(lines)
+        self.bytes_column.append(size)
+        if self.classified:
+            code, comment, blank = kinds if kinds is not None else (_UNKNOWN,) * 3
+            self.code_column.append(code)
+            self.comment_column.append(comment)
+            self.blank_column.append(blank)
+
+    def _load_row(self, row: dict):
+        kinds = None
+        # Empty in CSV, null in JSON
+        if row.get('code') not in (None, ''):
+            kinds = tuple(int(row[kind]) for kind in _KINDS)
+        self._load_file(row['path'], row['extension'], int(row['lines']), int(row['bytes']), kinds)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CountReport':
+        # Inverse of `to_dict`
+        report = cls._from_meta(data, keep_files='files' in data)
+        for file_ext, totals in data.get('totals', {}).items():
+            report.totals[file_ext] = ExtensionTotals.from_dict(totals)
+        if report.deduplicated:
+            for file_ext, totals in data.get('unique_totals', {}).items():
+                report.unique_totals[file_ext] = ExtensionTotals.from_dict(totals)
+            report.duplicates = [DuplicateGroup(**group) for group in data.get('duplicates', [])]
+        for row in data.get('files', []):
+            report._load_row(row)
+        report.top_files = data.get('top_files')
+        for row in data.get('largest', []):
+            kinds = tuple(row[kind] for kind in _KINDS) if row.get('code') is not None else None
+            report._add_largest(row['path'], row['extension'], row['lines'], row['bytes'], kinds)
+        if 'directories' in data:
+            report.directories = data['directories']
+        return report
+
+    @classmethod
+    def read(cls, stream: TextIO, format: str = 'json') -> 'CountReport':
+        if format == 'json':
+            return cls.from_dict(json.load(stream))
+
+        if format == 'ndjson':
+            report_meta = {}
+            rows = []
+            totals = {}
+            unique_totals = {}
+            duplicates = []
+            for line in stream:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if row['type'] == 'report':
+                    report_meta = row
+                elif row['type'] == 'extension':
+                    totals[row['extension']] = ExtensionTotals.from_dict(row)
+                elif row['type'] == 'unique_extension':
+                    unique_totals[row['extension']] = ExtensionTotals.from_dict(row)
+                elif row['type'] == 'duplicates':
+                    duplicates.append(DuplicateGroup(row['lines'], row['bytes'], row['paths']))
+                elif row['type'] == 'file':
+                    rows.append(row)
+            report = cls._from_meta(report_meta, keep_files=bool(rows))
+            report.totals = totals
+            if report.deduplicated:
+                report.unique_totals = unique_totals
+                report.duplicates = duplicates
+            for row in rows:
+                report._load_row(row)
+            return report
+
+        if format == 'csv':
+            reader = csv.DictReader(stream)
+            fields = reader.fieldnames or ()
+            report = cls(keep_files=False, classified='code' in fields, estimated='lines_margin' in fields)
+            for row in reader:
+                file_ext = row['extension']
+                files_count, lines, size = int(row['files']), int(row['lines']), int(row['bytes'])
+                totals = report.totals.get(file_ext)
+                if totals is None:
+                    totals = report.totals[file_ext] = ExtensionTotals()
+                totals.files_count += files_count
+                totals.lines += lines
+                totals.bytes += size
+                if row.get('code'):
+                    totals.add_kinds([int(row[kind]) for kind in _KINDS])
+                if row.get('lines_margin'):
+                    totals.lines_margin = round(math.hypot(totals.lines_margin or 0, int(row['lines_margin'])))
+                if row['path']:
+                    report.keep_files = True
+                    report._load_row(row)
+            return report
+
+        raise ValueError('Unknown format: {}'.format(format))
+
+
+class RootsReport:
+    """
+    Reports of several roots counted together
+    and the grand totals over all of them.
+    """
+
+    def __init__(self, reports: List[CountReport]):
+        self.reports = reports
+        self.total = CountReport.merged(reports)
+
+    def to_dict(self) -> dict:
+        total = self.total.to_dict()
+        del total['folder_path']
+        return {
+            'roots': [report.to_dict() for report in self.reports],
+            'total': total
+        }
+
+    def write(self, stream: TextIO, format: str = 'json'):
+        if format == 'json':
+            json.dump(self.to_dict(), stream)
+            stream.write('\n')
+        elif format == 'ndjson':
+            # Rows of every root carry its path,
+            # grand totals come last without one
+            for report in self.reports:
+                for row in report._ndjson_rows():
+                    row['root'] = report.folder_path
+                    stream.write(json.dumps(row) + '\n')
+            for row in self.total._ndjson_rows():
+                if row['type'] == 'report':
+                    row['type'] = 'total'
+                    del row['folder_path']
+                row['root'] = None
+                stream.write(json.dumps(row) + '\n')
+        elif format == 'csv':
+            # Grand totals per extension come
+            # last with an empty root
+            writer = csv.writer(stream, lineterminator='\n')
+            writer.writerow(['root'] + self.total._csv_fields())
+            for report in self.reports:
+                writer.writerows([report.folder_path] + row for row in report._csv_rows())
+            writer.writerows([''] + row for row in self.total._csv_rows())
+        else:
+            raise ValueError('Unknown format: {}'.format(format))
@@ -0,0 +1,176 @@
+import csv
+import heapq
+import json
+from typing import Dict, List, TextIO
+from .report import CountReport, FileRecord
+
+
+class DirectoryTotals:
+    __slots__ = ('path', 'depth', 'files_count', 'lines', 'bytes', 'extensions')
+
+    def __init__(self, path: str):
+        # Relative and '/' separated,
+        # empty for the counted folder
+        self.path = path
+        self.depth = path.count('/') + 1 if path else 0
+        self.files_count = 0
+        self.lines = 0
+        self.bytes = 0
+        # Extension -> [files, lines]
+        self.extensions: Dict[str, List[int]] = {}
+
+    def add(self, other: 'DirectoryTotals'):
+        self.files_count += other.files_count
+        self.lines += other.lines
+        self.bytes += other.bytes
+        for file_ext, (files_count, lines) in other.extensions.items():
+            totals = self.extensions.get(file_ext)
+            if totals is None:
+                self.extensions[file_ext] = [files_count, lines]
+            else:
+                totals[0] += files_count
+                totals[1] += lines
+
+    def to_dict(self) -> dict:
+        return {
+            'path': self.path,
+            'files': self.files_count,
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'extensions': {
+                file_ext: {'files': files_count, 'lines': lines}
+                for file_ext, (files_count, lines) in sorted(self.extensions.items())
+            }
+        }
+
+
+class DirectoryRollup:
+    """
+    Files, lines and bytes of every directory subtree of a
+    report. Files are summed into their directories in one
+    pass over the report columns, or taken from directory
+    totals the report summed while counting, then directories
+    are added to their parents from the deepest ones up.
+    """
+
+    def __init__(self, report: CountReport):
+        self.folder_path = report.folder_path
+        if report.keep_files or report.directories is None:
+            own = self._own_from_columns(report)
+        else:
+            own = []
+            for directory, extensions in report.directories.items():
+                node = DirectoryTotals(directory)
+                for file_ext, (files_count, lines, size) in extensions.items():
+                    node.files_count += files_count
+                    node.lines += lines
+                    node.bytes += size
+                    node.extensions[file_ext] = [files_count, lines]
+                own.append(node)
+
+        # Directories without files of their
+        # own are created as parents on the way
+        self.directories: Dict[str, DirectoryTotals] = {node.path: node for node in own}
+        self.directories.setdefault('', DirectoryTotals(''))
+        levels: Dict[int, List[DirectoryTotals]] = {}
+        for node in self.directories.values():
+            levels.setdefault(node.depth, []).append(node)
+        for depth in range(max(levels), 0, -1):
+            for node in levels.get(depth, ()):
+                parent_path = node.path.rpartition('/')[0]
+                parent = self.directories.get(parent_path)
+                if parent is None:
+                    parent = self.directories[parent_path] = DirectoryTotals(parent_path)
+                    levels.setdefault(depth - 1, []).append(parent)
+                parent.add(node)
+
+    @staticmethod
+    def _own_from_columns(report: CountReport) -> List[DirectoryTotals]:
+        table = report.table
+        names = table.extension_names
+        own = [DirectoryTotals(directory) for directory in table.directories]
+        for directory_id, extension_id, lines, size in zip(
+                table.directory_column, table.extension_column, report.lines_column, report.bytes_column):
+            node = own[directory_id]
+            node.files_count += 1
+            node.lines += lines
+            node.bytes += size
+            totals = node.extensions.get(names[extension_id])
+            if totals is None:
+                node.extensions[names[extension_id]] = [1, lines]
+            else:
+                totals[0] += 1
+                totals[1] += lines
+        return own
+
+    def tree(self, depth: int = None) -> List[DirectoryTotals]:
+        # Directories down to the depth,
+        # every one followed by its subtree
+        return sorted(
+            (node for node in self.directories.values() if depth is None or node.depth <= depth),
+            key=lambda node: node.path.split('/') if node.path else []
+        )
+
+    def largest(self, count: int, depth: int = 1) -> List[DirectoryTotals]:
+        # Directories at the depth with most lines,
+        # a bounded heap instead of a full sort
+        return heapq.nlargest(
+            count,
+            (node for node in self.directories.values() if node.depth == depth),
+            key=lambda node: node.lines
+        )
+
+
+def largest_files(report: CountReport, count: int) -> List[FileRecord]:
+    # Files with most lines, O(files * log count),
+    # or the ones the report kept while counting
+    if not report.keep_files:
+        return report.largest_records()[:count]
+    lines = report.lines_column
+    return [report.record(i) for i in heapq.nlargest(count, range(len(lines)), key=lines.__getitem__)]
+
+
+def rollup_rows(report: CountReport, by_dir: bool = False, depth: int = None, top: int = None) -> List[dict]:
+    # Directories of the tree (or the largest ones
+    # when `top` is set) or the largest files
+    if not by_dir:
+        return [
+            {'path': record.path, 'extension': record.extension, 'lines': record.lines, 'bytes': record.bytes}
+            for record in largest_files(report, top)
+        ]
+    rollup = DirectoryRollup(report)
+    nodes = rollup.largest(top, depth if depth is not None else 1) if top else rollup.tree(depth)
+    return [node.to_dict() for node in nodes]
+
+
+def write_rollup(reports: List[CountReport],
+                 stream: TextIO,
+                 format: str = 'json',
+                 by_dir: bool = False,
+                 depth: int = None,
+                 top: int = None):
+    # Rows of several roots carry their path
+    key = 'directories' if by_dir else 'files'
+    fields = ['path', 'files', 'lines', 'bytes'] if by_dir else ['path', 'extension', 'lines', 'bytes']
+    roots = [(report.folder_path, rollup_rows(report, by_dir, depth, top)) for report in reports]
+    several = len(roots) > 1
+    if format == 'json':
+        documents = [{'folder_path': folder_path, key: rows} for folder_path, rows in roots]
+        json.dump({'roots': documents} if several else documents[0], stream)
+        stream.write('\n')
+    elif format == 'ndjson':
+        for folder_path, rows in roots:
+            for row in rows:
+                if several:
+                    row['root'] = folder_path
+                stream.write(json.dumps(row) + '\n')
+    elif format == 'csv':
+        writer = csv.DictWriter(
+            stream, (['root'] if several else []) + fields, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        for folder_path, rows in roots:
+            for row in rows:
+                row['root'] = folder_path
+                writer.writerow(row)
+    else:
+        raise ValueError('Unknown format: {}'.format(format))
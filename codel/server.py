@@ -0,0 +1,151 @@
+import json
+import os
+import socketserver
+from collections import OrderedDict
+from typing import Tuple
+from .cache import CountCache
+from .client import PROTOCOL_VERSION, ServerError, ping, socket_path
+from .collector import FilesCollector
+from .engine import CountingEngine
+from .report import CountReport
+from .watch import LiveCount, merge_changes, start_live_count
+
+# Folders kept indexed at once,
+# least recently used are dropped
+MAX_INDEXES = 16
+
+IndexKey = Tuple[str, Tuple[str, ...], Tuple[str, ...], bool]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # One JSON request line, one JSON response line
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self.server.respond(json.loads(line))
+        except Exception as e:
+            response = {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class CountServer(socketserver.UnixStreamServer):
+    """
+    Daemon keeping folders indexed in memory. Counted files
+    are revalidated through inotify events before every
+    answer, or stat data at most every `interval` seconds
+    when polling. Indexes are scanned again when inotify
+    drops events or a client asks for it.
+    """
+
+    def __init__(self, path: str = None, poll: bool = False, interval: float = 1.0):
+        self.path = path if path else socket_path()
+        self.poll = poll
+        self.interval = interval
+        self.indexes: 'OrderedDict[IndexKey, LiveCount]' = OrderedDict()
+        self.stopping = False
+        if os.path.exists(self.path):
+            if ping(self.path) is not None:
+                raise ServerError('Server is already running at {}'.format(self.path))
+            # Left by a server which didn't exit cleanly
+            os.unlink(self.path)
+
+        # Only the user may connect
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def _index(self, key: IndexKey, rescan: bool = False) -> LiveCount:
+        live = self.indexes.get(key)
+        if live is not None:
+            self.indexes.move_to_end(key)
+            # Apply changes made since the previous query,
+            # an overflow of inotify rescans the folder
+            pending = {}
+            merge_changes(pending, live.source.read(0))
+            if rescan:
+                live.rescan()
+            elif pending:
+                live.apply(pending)
+            return live
+
+        folder, extensions, ignore, gitignore = key
+        collector = FilesCollector(
+            folder_path=folder,
+            ignore=list(ignore),
+            extensions=list(extensions),
+            gitignore=gitignore
+        )
+        engine = CountingEngine(cache=CountCache(folder))
+        live = self.indexes[key] = start_live_count(collector, engine, poll=self.poll, interval=self.interval)
+        while len(self.indexes) > MAX_INDEXES:
+            _, dropped = self.indexes.popitem(last=False)
+            dropped.source.close()
+        return live
+
+    def respond(self, request: dict) -> dict:
+        if request.get('version') != PROTOCOL_VERSION:
+            return {'ok': False, 'error': 'Unsupported protocol version'}
+
+        command = request.get('command')
+        if command == 'ping':
+            return {
+                'ok': True,
+                'version': PROTOCOL_VERSION,
+                'pid': os.getpid(),
+                'indexes': [key[0] for key in self.indexes]
+            }
+        if command == 'stop':
+            self.stopping = True
+            return {'ok': True}
+        if command == 'rescan':
+            # Indexes of the folder, or all of them
+            folder = request.get('folder')
+            keys = [key for key in self.indexes if folder is None or key[0] == os.path.abspath(folder)]
+            for key in keys:
+                self._index(key, rescan=True)
+            return {'ok': True, 'indexes': len(keys)}
+        if command != 'count':
+            return {'ok': False, 'error': 'Unknown command: {}'.format(command)}
+
+        key = (
+            os.path.abspath(request['folder']),
+            tuple(request['extensions']),
+            tuple(request.get('ignore', ())),
+            bool(request.get('gitignore', True))
+        )
+        live = self._index(key, rescan=bool(request.get('rescan', False)))
+        report = live.report
+        top_files = request.get('top_files')
+        by_directory = bool(request.get('by_directory', False))
+        if request.get('keep_files', True) or top_files or by_directory:
+            # Rollups are made here, only their
+            # rows are sent instead of every file
+            report = CountReport(
+                folder_path=live.folder_path,
+                extensions=live.collector.extensions,
+                ignore=live.collector.ignore,
+                keep_files=request.get('keep_files', True),
+                top_files=top_files,
+                by_directory=by_directory
+            )
+            for file_path, (file_ext, lines, size) in live.files.items():
+                report.add(file_path, file_ext, lines, size)
+        return {'ok': True, 'report': report.to_dict()}
+
+    def serve(self):
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            for live in self.indexes.values():
+                live.source.close()
+            self.server_close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, TextIO
+
+_END = object()
+
+
+class _WorkerStats:
+    __slots__ = ('busy', 'cpu', 'files', 'tasks')
+
+    def __init__(self):
+        self.busy = 0.0
+        self.cpu = 0.0
+        self.files = 0
+        self.tasks = 0
+
+
+class Stats:
+    """
+    Counters, phase timers and per-worker utilisation
+    of a run. Hot paths count into locals and flush
+    here once, so passing no Stats costs nothing.
+    """
+
+    def __init__(self, trace: bool = False):
+        self.counters = Counter()
+        self.phases: Dict[str, List[float]] = {}
+        self.workers: Dict[str, _WorkerStats] = {}
+        self.trace = trace
+        self.events: List[dict] = []
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    def add(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def add_phase(self, name: str, wall: float, cpu: float):
+        phase = self.phases.setdefault(name, [0.0, 0.0])
+        phase[0] += wall
+        phase[1] += cpu
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.time()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_phase(
+                name,
+                time.perf_counter() - wall,
+                time.process_time() - cpu
+            )
+            self._event(name, 'main', start, time.time())
+
+    def timed(self, iterable: Iterable, name: str) -> Iterator:
+        # Times the work done to produce
+        # every item of a lazy iterable
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    def add_worker(self, worker: str, start: float, end: float, cpu: float, files: int):
+        # Called from worker threads as well
+        with self._lock:
+            stats = self.workers.get(worker)
+            if stats is None:
+                stats = self.workers[worker] = _WorkerStats()
+            stats.busy += end - start
+            stats.cpu += cpu
+            stats.files += files
+            stats.tasks += 1
+            self._event('count', worker, start, end, files=files)
+
+    def _event(self, name: str, thread: str, start: float, end: float, **args):
+        if not self.trace:
+            return
+        self.events.append({
+            'name': name,
+            'ph': 'X',
+            'pid': os.getpid(),
+            'tid': thread,
+            'ts': (start - self._start) * 1e6,
+            'dur': (end - start) * 1e6,
+            'args': args
+        })
+
+    def write_trace(self, stream: TextIO):
+        # Chrome trace event format, opens
+        # in chrome://tracing or Perfetto
+        json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, stream)
+
+    def to_dict(self) -> dict:
+        return {
+            'counters': dict(self.counters),
+            'phases': {
+                name: {'wall': wall, 'cpu': cpu}
+                for name, (wall, cpu) in self.phases.items()
+            },
+            'workers': {
+                name: {
+                    'busy': worker.busy,
+                    'cpu': worker.cpu,
+                    'files': worker.files,
+                    'tasks': worker.tasks
+                }
+                for name, worker in self.workers.items()
+            }
+        }
+
+    def __str__(self):
+        result = 'Counters\n'
+        for name, value in sorted(self.counters.items()):
+            result += '  {: <24} {}\n'.format(name, value)
+
+        result += 'Phases (wall / cpu)\n'
+        for name, (wall, cpu) in self.phases.items():
+            result += '  {: <24} {:.3f}s / {:.3f}s\n'.format(name, wall, cpu)
+
+        if self.workers:
+            # Busy time relative to the time
+            # files were being counted
+            count_wall = self.phases.get('count', [0.0])[0]
+            result += 'Workers (busy / cpu / files / utilisation)\n'
+            for name, worker in sorted(self.workers.items()):
+                utilisation = worker.busy / count_wall * 100 if count_wall else 0.0
+                result += '  {: <24} {:.3f}s / {:.3f}s / {} / {:.0f}%\n'.format(
+                    name, worker.busy, worker.cpu, worker.files, utilisation)
+        return result.rstrip('\n')
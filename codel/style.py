@@ -1,200 +1,405 @@
-from .collector import FilesCollector
+from .report import CountReport, RootsReport
+from .utils import attr, fg
 from abc import ABC, abstractmethod
-from colored import fg, attr
 import shutil
-from tqdm import tqdm
-from multiprocessing import Manager
-from .utils import empty_content
+from io import StringIO
+from typing import Optional, TextIO, Tuple
+
+
+class _ReportApplicable(ABC):
+    def apply(self, report: CountReport) -> str:
+        stream = StringIO()
+        self.write(report, stream)
+        return stream.getvalue()
 
-class _CollectorApplicable(ABC):
     @abstractmethod
-    def apply(self, collector: FilesCollector) -> str:
+    def write(self, report: CountReport, stream: TextIO):
         pass
 
 
-class _Stylizer(_CollectorApplicable):
-    def apply(self, collector: FilesCollector) -> str:
-        result = ''
-        for block in self.stylizer_blocks:
-            result += block.apply(collector) + '\n'
-        return result
+class _Stylizer(_ReportApplicable):
+    def write(self, report: CountReport, stream: TextIO):
+        self._write_blocks(self.stylizer_blocks, report, stream)
+
+    @staticmethod
+    def _write_blocks(blocks: list, report: CountReport, stream: TextIO):
+        for block in blocks:
+            block.write(report, stream)
+            stream.write('\n')
 
 
-class _FolderNameStylizerBlock(_CollectorApplicable):
-    def apply(self, collector: FilesCollector) -> str:
-        return '{}{}Directory:{} {}'.format(
+class _FolderNameStylizerBlock(_ReportApplicable):
+    def write(self, report: CountReport, stream: TextIO):
+        stream.write('{}{}Directory:{} {}'.format(
             fg(149),
             attr(1),
             attr(0),
-            collector.folder_name
-        )
+            report.folder_name
+        ))
 
 
-class _FolderPathStylizerBlock(_CollectorApplicable):
-    def apply(self, collector: FilesCollector) -> str:
-        return '{}{}Path:{} {}'.format(
+class _FolderPathStylizerBlock(_ReportApplicable):
+    def write(self, report: CountReport, stream: TextIO):
+        stream.write('{}{}Path:{} {}'.format(
             fg(149),
             attr(1),
             attr(0),
-            collector.folder_path
-        )
+            report.folder_path
+        ))
 
 
-class _ExtensionsStylizerBlock(_CollectorApplicable):
-    def apply(self, collector: FilesCollector) -> str:
-        return '{}{}Extensions:{} {}'.format(
+class _ExtensionsStylizerBlock(_ReportApplicable):
+    def write(self, report: CountReport, stream: TextIO):
+        stream.write('{}{}Extensions:{} {}'.format(
             fg(149),
             attr(1),
             attr(0),
-            ', '.join(collector.extensions)
-        )
+            ', '.join(report.extensions)
+        ))
 
 
-class _IgnoreStylizerBlock(_CollectorApplicable):
-    def apply(self, collector: FilesCollector) -> str:
-        return '{}{}Ignore: {}{}'.format(
+class _IgnoreStylizerBlock(_ReportApplicable):
+    def write(self, report: CountReport, stream: TextIO):
+        stream.write('{}{}Ignore: {}{}'.format(
             fg(149),
             attr(1),
             attr(0),
-            ', '.join(collector.ignore)
-        )
+            ', '.join(report.ignore)
+        ))
 
 
-class _LinesStylizerBlock(_CollectorApplicable):
-    def __init__(self, short: bool = False):
-        self.short = short
+def _lines(lines: int, margin: Optional[int]) -> str:
+    # Estimated lines with their 95% interval
+    if margin is None:
+        return str(lines)
+    return '~{} ± {}'.format(lines, margin)
 
-    def apply(self, collector: FilesCollector) -> str:
-        result = ''
 
-        # Sort files by extension
-        files = [f for f in collector]
-        files.sort(key=lambda f: f.file_ext)
+def _kinds(kinds: Optional[Tuple[int, int, int]]) -> str:
+    if kinds is None:
+        return ''
+    return ' ({} code, {} comment, {} blank)'.format(*kinds)
 
+
+class _LinesStylizerBlock(_ReportApplicable):
+    def __init__(self, short: bool = False):
+        self.short = short
+
+    def write(self, report: CountReport, stream: TextIO):
         # Info about screen to
         # make result prettier
         terminal_size = shutil.get_terminal_size()
-
-        print('Counting lines')
-        progress_bar = tqdm(total=len(files))
-
-        # Resultant variables
-        lines_mean = None
-        total_lines = 0
-
-        # Temp variables
-        # for current extension
-        current_ext = None
-        extension_result = ''
-        extension_lines = 0
-        extension_files_count = 0
-
-        for i, file in enumerate(files, 0):
-            if file.file_ext != current_ext:
-                if i != 0:
-                    # Complete extension result
-                    # with header (summary)
-                    extension_result = (
-                        terminal_size.columns - 1) * '-' + '\n' + extension_result
-                    extension_result = '\n{}{} - {} files - {} lines{}\n'.format(
-                        attr(1),
-                        current_ext,
-                        extension_files_count,
-                        extension_lines, attr(0)
-                    ) + extension_result
-
-                    # Save to overall variables
-                    result += extension_result
-                    total_lines += extension_lines
-
-                    # Refresh temp variables
-                    extension_result = ''
-                    extension_lines = 0
-                    extension_files_count = 0
-
-                current_ext = file.file_ext
-
-            file_lines = file.count_lines()
-
-            # Update mean of lines count
-            if lines_mean is None:
-                lines_mean = file_lines
-            else:
-                lines_mean = (lines_mean * i + file_lines) / (i + 1)
-
-            # Write info about each
-            # file to result if required
-            if not self.short:
-                extension_result += '{: <40} -> {}\n'.format(
-                    file.file_name, file_lines)
-
-            # Update extension variables
-            extension_lines += file_lines
-            extension_files_count += 1
-
-            # Move progress bar
-            progress_bar.update()
-
-        else:
-            # Save extension variables
-            # to resultant variables
-            extension_result = (
-                terminal_size.columns - 1) * '-' + '\n' + extension_result
-            extension_result = '\n{}{} - {} files - {} lines{}\n'.format(
+        separator = (terminal_size.columns - 1) * '-' + '\n'
+
+        files = None
+        if not self.short and report.keep_files:
+            files = report.files_by_extension()
+
+        for file_ext in sorted(report.totals):
+            totals = report.totals[file_ext]
+            kinds = ''
+            if totals.classified:
+                kinds = _kinds((totals.code, totals.comment, totals.blank))
+            stream.write('\n{}{} - {} files - {} lines{}{}\n'.format(
                 attr(1),
-                current_ext,
-                extension_files_count,
-                extension_lines, attr(0)
-            ) + extension_result
-            result += extension_result
-            total_lines += extension_lines
-            if lines_mean is None:
-                lines_mean = 0
-
-        result += '\n'
-
-        result += '{}{}Files{} -> {}{}{}\n'.format(
+                file_ext,
+                totals.files_count,
+                _lines(totals.lines, totals.lines_margin),
+                kinds,
+                attr(0)
+            ))
+            stream.write(separator)
+            if files is not None:
+                stream.writelines(
+                    '{: <40} -> {}{}\n'.format(
+                        report.table.name(i),
+                        report.lines_column[i],
+                        _kinds(report.kinds(i)))
+                    for i in files.get(file_ext, ())
+                )
+
+        # Computed from exact totals instead
+        # of a running floating point mean
+        files_count = report.files_count
+        total_lines = report.total_lines
+        lines_mean = total_lines / files_count if files_count else 0
+
+        stream.write('\n')
+        stream.write('{}{}Files{} -> {}{}{}\n'.format(
             fg(149),
             attr(1),
             attr(0),
             attr(1),
-            len(files),
+            files_count,
             attr(0)
-        )
-        result += '{}{}Lines/File{} -> {}{}{}\n'.format(
+        ))
+        stream.write('{}{}Lines/File{} -> {}{}{}\n'.format(
             fg(149),
             attr(1),
             attr(0),
             attr(1),
             lines_mean,
             attr(0)
-        )
-        result += '{}{}Total Count{} -> {}{}{}'.format(
+        ))
+        stream.write('{}{}Total Count{} -> {}{}{}'.format(
             fg(149),
             attr(1),
             attr(0),
             attr(1),
-            total_lines,
+            _lines(total_lines, report.lines_margin if report.estimated else None),
             attr(0)
-        )
-
-        progress_bar.close()
+        ))
+        if report.estimated:
+            stream.write('\n{}{}{}{} -> {}{}{}'.format(
+                fg(149),
+                attr(1),
+                'Counted Files' if report.partial else 'Sampled Files',
+                attr(0),
+                attr(1),
+                report.sampled_files,
+                attr(0)
+            ))
+        if report.truncated:
+            stream.write('\n{}{}Files Not Walked{} -> {}unknown{}'.format(
+                fg(149),
+                attr(1),
+                attr(0),
+                attr(1),
+                attr(0)
+            ))
+        if report.deduplicated:
+            self._write_unique(report, stream)
 
-        return result
+    def _write_unique(self, report: CountReport, stream: TextIO):
+        stream.write('\n{}{}Unique Files{} -> {}{}{}\n'.format(
+            fg(149),
+            attr(1),
+            attr(0),
+            attr(1),
+            report.unique_files_count,
+            attr(0)
+        ))
+        stream.write('{}{}Unique Lines{} -> {}{}{}'.format(
+            fg(149),
+            attr(1),
+            attr(0),
+            attr(1),
+            report.unique_lines,
+            attr(0)
+        ))
+        if self.short:
+            return
+        for group in report.duplicates:
+            stream.write('\n\n{}{} copies - {} lines each{}\n'.format(
+                attr(1),
+                len(group.paths),
+                group.lines,
+                attr(0)
+            ))
+            stream.write('\n'.join(group.paths))
 
 
-class _BlankLineStylizerBlock(_CollectorApplicable):
-    def apply(self, collector: FilesCollector) -> str:
-        return '\n'
+class _BlankLineStylizerBlock(_ReportApplicable):
+    def write(self, report: CountReport, stream: TextIO):
+        stream.write('\n')
 
 
 class DefaultStylizer(_Stylizer):
+    """
+    Folder and its options followed by its lines. The header
+    only needs the options, `write_header` can write it from
+    an empty report before counting and `write_body` the
+    lines when counting is done.
+    """
+
     def __init__(self, short: bool = False):
-        self.stylizer_blocks = [
+        self.header_blocks = [
             _BlankLineStylizerBlock(),
             _FolderNameStylizerBlock(),
             _FolderPathStylizerBlock(),
             _ExtensionsStylizerBlock(),
-            _IgnoreStylizerBlock(),
-            _LinesStylizerBlock(short=short)
+            _IgnoreStylizerBlock()
         ]
+        self.body_blocks = [_LinesStylizerBlock(short=short)]
+        self.stylizer_blocks = self.header_blocks + self.body_blocks
+
+    def write_header(self, report: CountReport, stream: TextIO):
+        self._write_blocks(self.header_blocks, report, stream)
+
+    def write_body(self, report: CountReport, stream: TextIO):
+        self._write_blocks(self.body_blocks, report, stream)
+
+
+class _RootsStylizerBlock(_ReportApplicable):
+    def write(self, report: RootsReport, stream: TextIO):
+        stream.write('{}{}Roots:{} {}\n'.format(
+            fg(149),
+            attr(1),
+            attr(0),
+            len(report.reports)
+        ))
+        stream.writelines(
+            '{: <40} -> {} files - {} lines\n'.format(
+                root.folder_path,
+                root.files_count,
+                _lines(root.total_lines, root.lines_margin if root.estimated else None))
+            for root in report.reports
+        )
+
+
+class RootsStylizer(_ReportApplicable):
+    """
+    Every root rendered on its own followed
+    by the grand total over all of them.
+    """
+
+    def __init__(self, short: bool = False):
+        self.root_stylizer = DefaultStylizer(short=short)
+        self.roots_block = _RootsStylizerBlock()
+        self.total_block = _LinesStylizerBlock(short=True)
+
+    def write(self, report: RootsReport, stream: TextIO):
+        for root in report.reports:
+            self.root_stylizer.write(root, stream)
+            stream.write('\n')
+        stream.write('\n')
+        self.roots_block.write(report, stream)
+        self.total_block.write(report.total, stream)
+
+
+class HistoryStylizer(_ReportApplicable):
+    """
+    Lines per extension of every counted
+    commit, oldest first, as a table.
+    """
+
+    def write(self, report: 'HistoryReport', stream: TextIO):
+        from datetime import datetime, timezone
+        names = report.extension_names
+        columns = ['Date', 'Commit'] + names + ['Total']
+        rows = []
+        for point in report.points:
+            totals = point.report.totals
+            rows.append(
+                [
+                    datetime.fromtimestamp(point.time, timezone.utc).strftime('%Y-%m-%d %H:%M'),
+                    point.commit[:10]
+                ]
+                + [str(totals[file_ext].lines if file_ext in totals else 0) for file_ext in names]
+                + [str(point.report.total_lines)]
+            )
+        widths = [max(len(row[i]) for row in rows + [columns]) for i in range(len(columns))]
+
+        stream.write('{}{}{}{}\n'.format(
+            fg(149),
+            attr(1),
+            '  '.join(column.rjust(width) for column, width in zip(columns, widths)),
+            attr(0)
+        ))
+        stream.writelines(
+            '  '.join(value.rjust(width) for value, width in zip(row, widths)) + '\n'
+            for row in rows
+        )
+
+
+class _PerRootStylizer(_ReportApplicable):
+    # Roots are rendered one after another
+    # under their paths
+
+    def write(self, report, stream: TextIO):
+        if not isinstance(report, RootsReport):
+            self.write_report(report, stream)
+            return
+        for root in report.reports:
+            _FolderPathStylizerBlock().write(root, stream)
+            stream.write('\n')
+            self.write_report(root, stream)
+            stream.write('\n')
+
+    @abstractmethod
+    def write_report(self, report: CountReport, stream: TextIO):
+        pass
+
+
+class DirectoryStylizer(_PerRootStylizer):
+    """
+    Lines of every directory subtree down to the depth as an
+    indented tree, or the largest directories at the depth.
+    """
+
+    def __init__(self, depth: int = None, top: int = None):
+        self.depth = depth
+        self.top = top
+
+    def write_report(self, report: CountReport, stream: TextIO):
+        from .rollup import DirectoryRollup
+        rollup = DirectoryRollup(report)
+        if self.top:
+            stream.writelines(
+                '{: <40} -> {} files - {} lines\n'.format(node.path, node.files_count, node.lines)
+                for node in rollup.largest(self.top, self.depth if self.depth is not None else 1)
+            )
+            return
+        for node in rollup.tree(self.depth):
+            name = node.path.rpartition('/')[2] if node.path else report.folder_name
+            extensions = sorted(node.extensions.items(), key=lambda item: item[1][1], reverse=True)
+            stream.write('{}{}{}/{} - {} files - {} lines ({})\n'.format(
+                '  ' * node.depth,
+                attr(1),
+                name,
+                attr(0),
+                node.files_count,
+                node.lines,
+                ', '.join('{} {}'.format(file_ext, lines) for file_ext, (_, lines) in extensions)
+            ))
+
+
+class TopFilesStylizer(_PerRootStylizer):
+    """
+    Files with most lines, largest first.
+    """
+
+    def __init__(self, top: int):
+        self.top = top
+
+    def write_report(self, report: CountReport, stream: TextIO):
+        from .rollup import largest_files
+        stream.writelines(
+            '{: <40} -> {}\n'.format(record.path, record.lines)
+            for record in largest_files(report, self.top)
+        )
+
+
+class DiffStylizer(_ReportApplicable):
+    """
+    Change of lines per extension between two
+    sides followed by the files which changed.
+    """
+
+    def __init__(self, short: bool = False):
+        self.short = short
+
+    def write(self, report, stream: TextIO):
+        stream.write('{}{}{} -> {}{}\n\n'.format(fg(149), attr(1), report.before, report.after, attr(0)))
+        if not report.totals:
+            stream.write('No changes\n')
+            return
+        for file_ext, totals in sorted(report.totals.items(), key=lambda item: abs(item[1].lines), reverse=True):
+            stream.write('{}{: <8}{}{:+d} lines - {} added, {} removed, {} modified\n'.format(
+                attr(1),
+                file_ext,
+                attr(0),
+                totals.lines,
+                totals.added,
+                totals.removed,
+                totals.modified
+            ))
+        stream.write('{}{: <8}{}{:+d} lines\n'.format(attr(1), 'Total', attr(0), report.total_lines))
+        if self.short or not report.files:
+            return
+
+        stream.write('\n')
+        stream.writelines(
+            '{: <40} {: <9} {:+d}\n'.format(delta.path, delta.status, delta.lines)
+            for delta in sorted(report.files)
+        )
@@ -0,0 +1,71 @@
+from array import array
+from typing import Dict, Iterator, List
+
+
+class FileTable:
+    """
+    Compact table of relative file paths. Directories and
+    extensions are interned and referenced by ids, names are
+    packed into one buffer and decoded on demand, so a file
+    costs a few bytes of arrays plus the bytes of its name.
+    """
+
+    def __init__(self):
+        self.directories: List[str] = []
+        self._directory_ids: Dict[str, int] = {}
+        self.extension_names: List[str] = []
+        self._extension_ids: Dict[str, int] = {}
+        self.directory_column = array('I')
+        self.extension_column = array('I')
+        self._names = bytearray()
+        self._name_ends = array('Q')
+
+    def directory_id(self, directory: str) -> int:
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self._directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+        return directory_id
+
+    def extension_id(self, file_ext: str) -> int:
+        extension_id = self._extension_ids.get(file_ext)
+        if extension_id is None:
+            extension_id = self._extension_ids[file_ext] = len(self.extension_names)
+            self.extension_names.append(file_ext)
+        return extension_id
+
+    def append(self, path: str, file_ext: str):
+        # Paths are relative and '/' separated
+        directory, _, name = path.rpartition('/')
+        self.directory_column.append(self.directory_id(directory))
+        self.extension_column.append(self.extension_id(file_ext))
+        self._names += name.encode('utf-8', 'surrogateescape')
+        self._name_ends.append(len(self._names))
+
+    def __len__(self):
+        return len(self._name_ends)
+
+    def name(self, i: int) -> str:
+        start = self._name_ends[i - 1] if i else 0
+        return self._names[start:self._name_ends[i]].decode('utf-8', 'surrogateescape')
+
+    def directory(self, i: int) -> str:
+        return self.directories[self.directory_column[i]]
+
+    def extension(self, i: int) -> str:
+        return self.extension_names[self.extension_column[i]]
+
+    def path(self, i: int) -> str:
+        directory = self.directory(i)
+        return directory + '/' + self.name(i) if directory else self.name(i)
+
+    def __iter__(self) -> Iterator[str]:
+        # Paths in insertion order
+        directories = self.directories
+        names = self._names
+        start = 0
+        for directory_id, end in zip(self.directory_column, self._name_ends):
+            name = names[start:end].decode('utf-8', 'surrogateescape')
+            directory = directories[directory_id]
+            yield directory + '/' + name if directory else name
+            start = end
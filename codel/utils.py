@@ -1,13 +1,25 @@
 import os
-from gitignore_parser import (
-    rule_from_pattern
-)
-from typing import List
-from io import StringIO
+import re
+from functools import lru_cache
+from typing import Iterable, List
 from contextlib import contextmanager
 
 
+# Imports of optional or slow modules are deferred
+# to the first use to keep startup fast
+
+def fg(color) -> str:
+    from colored import fg
+    return fg(color)
+
+
+def attr(attribute) -> str:
+    from colored import attr
+    return attr(attribute)
+
+
 def parse_gitignore_from_stream(stream, folder: str):
+    from gitignore_parser import rule_from_pattern
     rules = []
     counter = 0
     for line in stream:
@@ -20,18 +32,247 @@ def parse_gitignore_from_stream(stream, folder: str):
     return lambda file_path: any(r.match(file_path) for r in rules)
 
 
+@lru_cache(maxsize=None)
+def _unanchored() -> str:
+    # Regex prefix gitignore_parser uses for
+    # patterns which aren't anchored to the base
+    from gitignore_parser import rule_from_pattern
+    return rule_from_pattern('x').regex[:-len('x$')]
+
+
+_ANY_NAME = '[^/]*'
+_LITERAL = re.compile(r'(?:[^\\.^$*+?{}\[\]|()]|\\.)*')
+_ESCAPED = re.compile(r'\\(.)')
+
+
+def _literal(regex: str):
+    # Unescaped text if the regex matches it literally
+    if not _LITERAL.fullmatch(regex):
+        return None
+    return _ESCAPED.sub(r'\1', regex)
+
+
+class _RuleGroup:
+    """
+    Consecutive rules sharing negation merged into
+    basename and suffix lookups plus one regex.
+    """
+
+    def __init__(self, negation: bool):
+        self.negation = negation
+        self.names = set()
+        self.suffixes = []
+        self.regexes = []
+        self.regex = None
+
+    def add(self, rule):
+        regex = rule.regex
+        unanchored = _unanchored()
+        if regex.startswith(unanchored):
+            body = regex[len(unanchored):]
+            end = r'($|\/)' if rule.directory_only else '$'
+            if body.endswith(end):
+                body = body[:-len(end)]
+                name = _literal(body)
+                if name is not None:
+                    self.names.add(name)
+                    return
+                if body.startswith(_ANY_NAME):
+                    suffix = _literal(body[len(_ANY_NAME):])
+                    if suffix:
+                        self.suffixes.append(suffix)
+                        return
+        self.regexes.append(regex)
+
+    def compile(self):
+        self.suffixes = tuple(self.suffixes)
+        if self.regexes:
+            self.regex = re.compile('|'.join('(?:{})'.format(r) for r in self.regexes))
+
+    def matches(self, path: str, name: str) -> bool:
+        if name in self.names:
+            return True
+        if self.suffixes and name.endswith(self.suffixes):
+            return True
+        return self.regex is not None and self.regex.search(path) is not None
+
+
+class _RuleSet:
+    """
+    Rules of one source applied to paths
+    relative to its base directory.
+    """
+
+    def __init__(self, rules: list, base: str):
+        self.base = base
+        self._prefix_length = len(base) + 1 if base else 0
+        self._file_groups = self._groups(rules, directories=False)
+        self._dir_groups = self._groups(rules, directories=True)
+
+    @staticmethod
+    def _groups(rules: list, directories: bool) -> List[_RuleGroup]:
+        groups = []
+        for rule in rules:
+            if rule.directory_only and not directories:
+                continue
+            if not groups or groups[-1].negation != rule.negation:
+                groups.append(_RuleGroup(rule.negation))
+            groups[-1].add(rule)
+        for group in groups:
+            group.compile()
+        return groups
+
+    def verdict(self, rel_path: str, is_dir: bool):
+        # True/False if the last matching rule ignores
+        # or re-includes the path, None if none matches
+        path = rel_path[self._prefix_length:]
+        name = path.rpartition('/')[2]
+        groups = self._dir_groups if is_dir else self._file_groups
+        for group in reversed(groups):
+            if group.matches(path, name):
+                return not group.negation
+        return None
+
+
+def _parse_rules(lines: Iterable[str], source_path: str) -> list:
+    from gitignore_parser import rule_from_pattern
+    rules = []
+    for counter, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        rule = rule_from_pattern(line, source=(source_path, counter))
+        if rule:
+            rules.append(rule)
+    return rules
+
+
+def _read_rules(path: str) -> list:
+    try:
+        with open(path, errors='replace') as f:
+            return _parse_rules(f, path)
+    except OSError:
+        return []
+
+
+def _work_tree(folder: str):
+    # Top of the git work tree the
+    # folder belongs to if any
+    path = folder
+    while True:
+        if os.path.exists(os.path.join(path, '.git')):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
 class IgnoreParser:
-    def __init__(self, ignore: List[str], folder: str = None):
+    """
+    Compiled gitignore-like matcher.
+
+    Verdicts are cached per directory so a whole ignored
+    subtree is decided once. With `gitignore` enabled
+    `.gitignore` files are loaded the way git does.
+    """
+
+    def __init__(self, ignore: List[str], folder: str = None, gitignore: bool = False):
         self._ignore = ignore
-        self._ignore_stream = StringIO('\n'.join(ignore))
-        self._folder = folder if folder else os.getcwd()
-        self._matches = parse_gitignore_from_stream(
-            self._ignore_stream,
-            self._folder
+        self._folder = os.path.abspath(folder) if folder else os.getcwd()
+        self._gitignore = gitignore
+        # Number of paths decided by rules
+        self.evaluations = 0
+
+        # Paths are matched relative to the top
+        # of the git work tree in gitignore mode
+        self._top = self._folder
+        if gitignore:
+            self._top = _work_tree(self._folder) or self._folder
+        self._top_prefix = os.path.join(self._top, '')
+        self._folder_rel = self._relative(self._folder)
+
+        # Patterns passed explicitly have
+        # the highest precedence
+        self._ignore_rules = _RuleSet(
+            _parse_rules(ignore, os.path.join(self._folder, '.gitignore')),
+            self._folder_rel
         )
+        top_rule_sets = ()
+        if gitignore:
+            top_rule_sets = self._load_rule_sets(
+                os.path.join(self._top, '.git', 'info', 'exclude'), '')
+            top_rule_sets += self._load_rule_sets(
+                os.path.join(self._top, '.gitignore'), '')
+        self._directories = {'': (False, top_rule_sets)}
+
+    def _relative(self, path: str) -> str:
+        if path == self._top:
+            return ''
+        if path.startswith(self._top_prefix):
+            path = path[len(self._top_prefix):]
+        else:
+            path = os.path.relpath(path, self._top)
+        if os.sep != '/':
+            path = path.replace(os.sep, '/')
+        return path
+
+    @staticmethod
+    def _load_rule_sets(path: str, base: str) -> tuple:
+        rules = _read_rules(path)
+        return (_RuleSet(rules, base),) if rules else ()
+
+    def _within_folder(self, rel_path: str) -> bool:
+        return not self._folder_rel or rel_path.startswith(self._folder_rel + '/')
+
+    def _verdict(self, rule_sets: tuple, rel_path: str, is_dir: bool) -> bool:
+        self.evaluations += 1
+        if self._within_folder(rel_path):
+            verdict = self._ignore_rules.verdict(rel_path, is_dir)
+            if verdict is not None:
+                return verdict
+        for rule_set in reversed(rule_sets):
+            verdict = rule_set.verdict(rel_path, is_dir)
+            if verdict is not None:
+                return verdict
+        return False
+
+    def _directory(self, rel_dir: str):
+        # (ignored, rule sets) of the directory
+        state = self._directories.get(rel_dir)
+        if state is not None:
+            return state
+
+        parent, _, name = rel_dir.rpartition('/')
+        parent_ignored, rule_sets = self._directory(parent)
+        if parent_ignored:
+            ignored = True
+        elif not self._within_folder(rel_dir):
+            # Counted folder and its
+            # parents are never ignored
+            ignored = False
+        elif self._gitignore and name == '.git':
+            ignored = True
+        else:
+            ignored = self._verdict(rule_sets, rel_dir, is_dir=True)
+
+        if not ignored and self._gitignore:
+            rule_sets += self._load_rule_sets(
+                os.path.join(self._top, *rel_dir.split('/'), '.gitignore'), rel_dir)
+
+        state = self._directories[rel_dir] = (ignored, rule_sets)
+        return state
+
+    def matches(self, path: str) -> bool:
+        rel_path = self._relative(path)
+        ignored, rule_sets = self._directory(rel_path.rpartition('/')[0])
+        if ignored:
+            return True
+        return self._verdict(rule_sets, rel_path, is_dir=False)
+
+    def matches_dir(self, path: str) -> bool:
+        # Whether the whole directory is excluded
+        # and doesn't have to be walked at all
+        return self._directory(self._relative(path))[0]
 
-    def matches(self, path: str):
-        return self._matches(path)
 
 @contextmanager
 def empty_content():
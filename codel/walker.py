@@ -0,0 +1,108 @@
+import os
+from typing import Callable, Iterable, List, Set, Tuple
+from .stats import Stats
+from .utils import IgnoreParser
+
+
+class DirectoryWalker:
+    """
+    Single pass `os.scandir` walker. Ignored directories
+    are pruned before descending into them.
+    """
+
+    def __init__(self,
+                 root: str,
+                 extensions: List[str] = None,
+                 ignore_parser: IgnoreParser = None,
+                 follow_symlinks: bool = True,
+                 stats: Stats = None,
+                 on_directory: Callable[[str], None] = None):
+        self.root = os.path.abspath(root)
+        self.extensions = set(extensions) if extensions is not None else None
+        self.ignore_parser = ignore_parser
+        self.follow_symlinks = follow_symlinks
+        self.stats = stats
+        # Called with every directory before
+        # it's scanned, e.g. to watch it
+        self.on_directory = on_directory
+
+    def _directory_id(self, entry: os.DirEntry) -> Tuple[int, int]:
+        st = entry.stat(follow_symlinks=self.follow_symlinks)
+        return st.st_dev, st.st_ino
+
+    def __iter__(self) -> Iterable[os.DirEntry]:
+        # Nothing can match an empty
+        # set of extensions
+        if self.extensions is not None and not self.extensions:
+            return
+
+        try:
+            st = os.stat(self.root)
+        except OSError:
+            return
+
+        # (st_dev, st_ino) of every visited
+        # directory to break symlink loops
+        visited: Set[Tuple[int, int]] = {(st.st_dev, st.st_ino)}
+        stack = [self.root]
+
+        extensions = self.extensions
+        ignore_parser = self.ignore_parser
+        follow_symlinks = self.follow_symlinks
+        on_directory = self.on_directory
+
+        # Counted in locals and
+        # flushed once at the end
+        directories, entries, pruned, stat_calls = 0, 0, 0, 1
+        try:
+            while stack:
+                directory_path = stack.pop()
+                if on_directory is not None:
+                    on_directory(directory_path)
+                try:
+                    scanner = os.scandir(directory_path)
+                except OSError:
+                    continue
+                directories += 1
+
+                subdirectories = []
+                with scanner:
+                    for entry in scanner:
+                        entries += 1
+                        try:
+                            if follow_symlinks and entry.is_symlink():
+                                # Resolving the target costs a stat
+                                stat_calls += 1
+                            if entry.is_dir(follow_symlinks=follow_symlinks):
+                                if ignore_parser is not None and ignore_parser.matches_dir(entry.path):
+                                    pruned += 1
+                                    continue
+                                stat_calls += 1
+                                directory_id = self._directory_id(entry)
+                                if directory_id in visited:
+                                    continue
+                                visited.add(directory_id)
+                                subdirectories.append(entry.path)
+                            elif entry.is_file(follow_symlinks=follow_symlinks):
+                                if extensions is not None:
+                                    if os.path.splitext(entry.name)[-1] not in extensions:
+                                        pruned += 1
+                                        continue
+                                if ignore_parser is not None and ignore_parser.matches(entry.path):
+                                    pruned += 1
+                                    continue
+                                yield entry
+                        except OSError:
+                            # Entry vanished or is
+                            # not accessible anymore
+                            continue
+
+                # Keep directory order stable
+                # for the depth-first traversal
+                stack.extend(reversed(subdirectories))
+        finally:
+            if self.stats is not None:
+                self.stats.add('directories_visited', directories)
+                self.stats.add('entries_seen', entries)
+                self.stats.add('entries_pruned', pruned)
+                self.stats.add('stat_calls', stat_calls)
@@ -0,0 +1,432 @@
+import errno
+import json
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+from .cache import Result
+from .collector import File, FilesCollector
+from .counter import count_file
+from .engine import CountingEngine
+from .report import CountReport
+from .utils import IgnoreParser
+from .walker import DirectoryWalker
+
+# Kinds of changes reported by sources
+CHANGED = 'changed'
+DIRECTORY_CREATED = 'directory_created'
+DIRECTORY_REMOVED = 'directory_removed'
+# Directory removed and created again, or
+# replaced by a file, since the last update
+DIRECTORY_REPLACED = 'directory_replaced'
+RESCAN = 'rescan'
+_DIRECTORY_CHANGES = (DIRECTORY_CREATED, DIRECTORY_REMOVED, DIRECTORY_REPLACED)
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_EXCL_UNLINK = 0x04000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_ONLYDIR | _IN_EXCL_UNLINK
+)
+# wd, mask, cookie, name length
+_EVENT = struct.Struct('iIII')
+
+Change = Tuple[str, str]
+
+
+class WatchError(Exception):
+    pass
+
+
+class _ChangeSource(ABC):
+    def watch_directory(self, path: str):
+        pass
+
+    @abstractmethod
+    def read(self, timeout: Optional[float]) -> List[Change]:
+        # Changes since the previous call, waits
+        # up to `timeout` seconds (forever if None)
+        pass
+
+    def close(self):
+        pass
+
+
+class InotifySource(_ChangeSource):
+    """
+    Linux inotify through ctypes, one
+    watch per directory of the tree.
+    """
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        if not sys.platform.startswith('linux'):
+            raise WatchError('inotify is only available on Linux')
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise WatchError('inotify_init1: {}'.format(os.strerror(ctypes.get_errno())))
+        self._paths: Dict[int, str] = {}
+
+    def watch_directory(self, path: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            error = self._ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # Removed before it could be watched
+                return
+            raise WatchError('inotify_add_watch {}: {}'.format(path, os.strerror(error)))
+        # Moved directories keep their watch,
+        # the path is updated when re-added
+        self._paths[wd] = path
+
+    def _unwatch(self, path: str):
+        # Directories moved out of the tree would keep
+        # reporting changes under their old paths
+        prefix = os.path.join(path, '')
+        for wd, directory in list(self._paths.items()):
+            if directory == path or directory.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._paths[wd]
+
+    def read(self, timeout: Optional[float]) -> List[Change]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        changes = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            changes.extend(self._parse(data))
+        return changes
+
+    def _parse(self, data: bytes) -> Iterator[Change]:
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                yield '', RESCAN
+                continue
+            if mask & _IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+            directory = self._paths.get(wd)
+            if directory is None or mask & _IN_DELETE_SELF:
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    yield path, DIRECTORY_CREATED
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    # Moves inside the tree are watched
+                    # again when the target is walked
+                    if mask & _IN_MOVED_FROM:
+                        self._unwatch(path)
+                    yield path, DIRECTORY_REMOVED
+            else:
+                yield path, CHANGED
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingSource(_ChangeSource):
+    """
+    Fallback comparing stat data of the counted
+    files every `interval` seconds. Unlike inotify
+    its cost grows with the size of the tree, so it
+    isn't walked more often than that however often
+    changes are read.
+    """
+
+    def __init__(self, live: 'LiveCount', interval: float = 1.0):
+        self.live = live
+        self.interval = interval
+        # Taken before the initial count, changes made
+        # meanwhile are recounted by the first poll
+        self._snapshot = self._take_snapshot()
+        self._taken = time.monotonic()
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        snapshot = {}
+        for entry in self.live.walk(self.live.folder_path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return snapshot
+
+    def read(self, timeout: Optional[float]) -> List[Change]:
+        wait = self._taken + self.interval - time.monotonic()
+        if wait > 0:
+            if timeout is not None and timeout < wait:
+                time.sleep(timeout)
+                return []
+            time.sleep(wait)
+
+        snapshot = self._take_snapshot()
+        self._taken = time.monotonic()
+        previous = self._snapshot
+        self._snapshot = snapshot
+        changes = [
+            (path, CHANGED) for path, signature in snapshot.items()
+            if previous.get(path) != signature
+        ]
+        changes.extend((path, CHANGED) for path in previous if path not in snapshot)
+        return changes
+
+
+class LiveCount:
+    """
+    Totals of a folder kept up to date by
+    recounting only files that changed.
+    """
+
+    def __init__(self, collector: FilesCollector, engine: CountingEngine = None):
+        self.collector = collector
+        self.folder_path = collector.folder_path
+        self.extensions = set(collector.extensions)
+        self.engine = engine if engine is not None else CountingEngine()
+        self.source: _ChangeSource = None
+        # Path -> (extension, lines, bytes) of counted files
+        self.files: Dict[str, Tuple[str, Optional[int], int]] = {}
+        self.report = self._empty_report()
+
+    def _empty_report(self) -> CountReport:
+        return CountReport(
+            folder_path=self.folder_path,
+            extensions=self.collector.extensions,
+            ignore=self.collector.ignore,
+            keep_files=False
+        )
+
+    def walk(self, root: str, watch: bool = False) -> Iterator[os.DirEntry]:
+        walker = DirectoryWalker(
+            root=root,
+            extensions=self.collector.extensions,
+            ignore_parser=self.collector.ignore_parser,
+            on_directory=self.source.watch_directory if watch else None
+        )
+        return iter(walker)
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self.folder_path).replace(os.sep, '/')
+
+    def _wanted(self, path: str) -> bool:
+        if os.path.splitext(path)[-1] not in self.extensions:
+            return False
+        return not self.collector.ignore_parser.matches(path)
+
+    def _set(self, path: str, result: Optional[Result]) -> Optional[dict]:
+        # Applies the new state of a file and
+        # returns its delta if anything changed
+        old = self.files.get(path)
+        file_ext = os.path.splitext(path)[-1]
+        new = (file_ext, result[0], result[1]) if result is not None else None
+        if old == new:
+            return None
+
+        if old is not None:
+            self.report.discard(*old)
+            del self.files[path]
+        if new is not None:
+            self.report.add(path, *new)
+            self.files[path] = new
+
+        old_lines, old_size = (old[1] or 0, old[2]) if old is not None else (0, 0)
+        new_lines, new_size = (new[1] or 0, new[2]) if new is not None else (0, 0)
+        return {
+            'type': 'file',
+            'event': 'created' if old is None else 'deleted' if new is None else 'modified',
+            'path': self._relative(path),
+            'extension': file_ext,
+            'lines': new[1] if new is not None else 0,
+            'bytes': new_size,
+            'lines_delta': new_lines - old_lines,
+            'bytes_delta': new_size - old_size
+        }
+
+    def _count_tree(self, root: str) -> Dict[str, Result]:
+        files = (File.from_entry(entry) for entry in self.walk(root, watch=True))
+        if root != self.folder_path:
+            # New directories are small, the engine and
+            # its cache are only used for whole tree
+            return {file.file_path: count_file(file.file_path) for file in files}
+        return {file.file_path: result for file, result in self.engine.count_files(files)}
+
+    def start(self, source: _ChangeSource):
+        # Directories are watched before they are
+        # scanned so that no change gets lost
+        self.source = source
+        for path, result in self._count_tree(self.folder_path).items():
+            self._set(path, result)
+
+    def rescan(self) -> List[dict]:
+        # Ignore rules may have changed as well
+        self.collector.ignore_parser = IgnoreParser(
+            self.collector.ignore,
+            self.folder_path,
+            gitignore=self.collector.gitignore
+        )
+        counted = self._count_tree(self.folder_path)
+        deltas = [self._set(path, counted.get(path)) for path in set(self.files) | set(counted)]
+        return [delta for delta in deltas if delta is not None]
+
+    def apply(self, changes: Dict[str, str]) -> List[dict]:
+        if RESCAN in changes.values() or any(
+                os.path.basename(path) == '.gitignore' for path in changes):
+            return self.rescan()
+
+        deltas = []
+        for path, kind in changes.items():
+            if kind in (DIRECTORY_REMOVED, DIRECTORY_REPLACED):
+                prefix = os.path.join(path, '')
+                removed = [file_path for file_path in self.files if file_path.startswith(prefix)]
+                deltas.extend(self._set(file_path, None) for file_path in removed)
+            if kind in (DIRECTORY_CREATED, DIRECTORY_REPLACED) and os.path.isdir(path):
+                if not self.collector.ignore_parser.matches_dir(path):
+                    deltas.extend(
+                        self._set(file_path, result)
+                        for file_path, result in self._count_tree(path).items()
+                    )
+            if kind in (CHANGED, DIRECTORY_REPLACED) and (path in self.files or self._wanted(path)):
+                result = None
+                if os.path.isfile(path):
+                    result = count_file(path)
+                deltas.append(self._set(path, result))
+        return [delta for delta in deltas if delta is not None]
+
+    def totals(self) -> dict:
+        report = self.report
+        return {
+            'type': 'totals',
+            'files': report.files_count,
+            'lines': report.total_lines,
+            'bytes': report.total_bytes,
+            'binary_files': report.binary_files,
+            'extensions': {
+                file_ext: totals.to_dict() for file_ext, totals in sorted(report.totals.items())
+            }
+        }
+
+
+def merge_changes(pending: Dict[str, str], changes: List[Change]):
+    for path, kind in changes:
+        # Later changes override earlier ones, a directory
+        # which went away and came back (or turned into a
+        # file or out of one) is scanned again as a whole
+        previous = pending.get(path)
+        if previous is not None and previous != kind and (
+                previous in _DIRECTORY_CHANGES or kind in _DIRECTORY_CHANGES):
+            kind = DIRECTORY_REPLACED
+        pending[path] = kind
+
+
+def start_live_count(collector: FilesCollector,
+                     engine: CountingEngine = None,
+                     poll: bool = False,
+                     interval: float = 1.0) -> LiveCount:
+    # Counts the folder and subscribes to its changes,
+    # inotify is used unless unavailable or exhausted
+    live = LiveCount(collector, engine)
+    if not poll:
+        try:
+            source = InotifySource()
+        except (WatchError, OSError, AttributeError):
+            source = None
+        if source is not None:
+            try:
+                live.start(source)
+                return live
+            except WatchError:
+                # Out of inotify watches
+                source.close()
+                live = LiveCount(collector, engine)
+    live.start(PollingSource(live, interval))
+    return live
+
+
+def _emit(live: LiveCount, deltas: List[dict], stream: TextIO, format: str, short: bool):
+    if format == 'ndjson':
+        for delta in deltas:
+            stream.write(json.dumps(delta) + '\n')
+        stream.write(json.dumps(live.totals()) + '\n')
+    else:
+        from .style import DefaultStylizer
+        DefaultStylizer(short=short).write(live.report, stream)
+        stream.write('\n')
+    stream.flush()
+
+
+def watch(collector: FilesCollector,
+          engine: CountingEngine = None,
+          stream: TextIO = sys.stdout,
+          format: str = 'ndjson',
+          debounce: float = 0.2,
+          poll: bool = False,
+          interval: float = 1.0,
+          short: bool = True,
+          max_updates: int = None):
+    """
+    Count the folder once and keep emitting updated totals.
+
+    Changes are collected until none arrive for `debounce`
+    seconds (at most ten times that long) and then only the
+    affected files are recounted. In `ndjson` format every
+    update is a row per changed file followed by totals.
+    """
+    live = start_live_count(collector, engine, poll, interval)
+    source = live.source
+    try:
+        _emit(live, [], stream, format, short)
+
+        updates = 0
+        pending: Dict[str, str] = {}
+        first_change = None
+        while max_updates is None or updates < max_updates:
+            changes = source.read(debounce if pending else None)
+            now = time.monotonic()
+            merge_changes(pending, changes)
+            if pending and first_change is None:
+                first_change = now
+            if not pending:
+                continue
+            if changes and now - first_change < debounce * 10:
+                continue
+
+            deltas = live.apply(pending)
+            pending = {}
+            first_change = None
+            if deltas:
+                _emit(live, deltas, stream, format, short)
+                updates += 1
+    finally:
+        source.close()
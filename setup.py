@@ -14,7 +14,7 @@ setup(
     # Name of the package
     name='codel',
     # Packages to include into the distribution
-    packages=find_packages('.'),
+    packages=find_packages('.', exclude=['benchmarks', 'benchmarks.*', 'tests', 'tests.*']),
     # Start with a small number and increase it with
     # every change you make https://semver.org
     version='1.1.1',
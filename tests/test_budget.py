@@ -0,0 +1,82 @@
+import os
+import random
+from codel.budget import _borrowed, budget_reports
+from codel.collector import FilesCollector
+from codel.counter import count_file
+from codel.engine import CountingEngine
+from codel.estimate import CONFIDENCE_Z
+
+
+def test_stratum_without_donors_is_unknown():
+    estimate = _borrowed(3, 1000, [], [])
+    assert estimate.lines == 500
+    assert round(CONFIDENCE_Z * estimate.variance ** 0.5) == 500
+
+
+def test_borrowed_lines_widen_the_margin():
+    # Donors agree with each other exactly
+    donor = [(10, 100)] * 5
+    one = _borrowed(10, 1000, [], [donor])
+    assert one.lines == 100
+    assert one.variance > 0
+    several = _borrowed(10, 1000, [], [donor, [(30, 100)] * 5])
+    assert several.variance > 0
+    # Counted file of the stratum is kept as it is
+    counted = _borrowed(10, 1000, [(7, 100)], [donor])
+    assert counted.lines == 7 + 90
+    assert counted.files_count == 10
+
+
+def test_walk_stops_at_the_deadline(tmp_path):
+    for i in range(20):
+        with open(os.path.join(tmp_path, '{}.py'.format(i)), 'w') as f:
+            f.write('x\n')
+    collector = FilesCollector(str(tmp_path), extensions=['.py'], gitignore=False)
+    report, = budget_reports(CountingEngine(jobs=1), [collector], 1e-9)
+    assert report.truncated and report.partial and report.estimated
+    assert report.files_count == 0
+
+    collector = FilesCollector(str(tmp_path), extensions=['.py'], gitignore=False)
+    report, = budget_reports(CountingEngine(jobs=1), [collector], 60)
+    assert not report.truncated and not report.partial
+    assert (report.files_count, report.total_lines) == (20, 20)
+
+
+class _StoppingEngine:
+    # Counts the first files it is given, as
+    # when the budget runs out after them
+    cache = None
+    stats = None
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def count_files(self, files, batch_size=None):
+        for file, _ in zip(files, range(self.limit)):
+            yield file, count_file(file.file_path)
+
+
+def _varied_tree(folder, count, seed=0):
+    # Larger files have longer lines
+    rng = random.Random(seed)
+    lines = 0
+    for i in range(count):
+        size = int(10 ** rng.uniform(2, 4.5))
+        width = 4 + size // 100
+        text = ''.join('x' * rng.randrange(2 * width) + '\n' for _ in range(max(size // (width + 1), 1)))
+        lines += text.count('\n')
+        with open(os.path.join(folder, '{}.c'.format(i)), 'w') as f:
+            f.write(text)
+    return lines
+
+
+def test_counted_files_are_kept_exactly(tmp_path):
+    lines = _varied_tree(str(tmp_path), 2000)
+    collector = FilesCollector(str(tmp_path), extensions=['.c'], gitignore=False)
+    report, = budget_reports(_StoppingEngine(1900), [collector], 60)
+    assert report.partial and report.sampled_files == 1900
+    totals = report.totals['.c']
+    assert totals.files_count == 2000
+    assert abs(totals.lines - lines) <= totals.lines_margin
+    # Only the 100 uncounted files are estimated
+    assert totals.lines_margin < lines / 50
@@ -0,0 +1,46 @@
+import os
+from codel.cache import CountCache
+from codel.collector import FilesCollector
+from codel.engine import CountingEngine
+
+
+def _count(folder, load=True):
+    cache = CountCache(str(folder), load=load)
+    collector = FilesCollector(str(folder), extensions=['.py'], gitignore=False)
+    report = CountingEngine(jobs=1, cache=cache).report(collector)
+    cache.save()
+    return report, cache
+
+
+def test_unchanged_tree_isnt_written(tmp_path):
+    (tmp_path / 'a.py').write_text('x\ny\n')
+    (tmp_path / 'b.py').write_text('z\n')
+    _count(tmp_path)
+    before = os.stat(tmp_path / '.codel' / 'cache.bin')
+
+    report, cache = _count(tmp_path)
+    assert report.total_lines == 3 and cache.hits == 2
+    after = os.stat(tmp_path / '.codel' / 'cache.bin')
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+
+
+def test_changed_or_deleted_files_are_written(tmp_path):
+    (tmp_path / 'a.py').write_text('x\ny\n')
+    (tmp_path / 'b.py').write_text('z\n')
+    _count(tmp_path)
+    cache_path = tmp_path / '.codel' / 'cache.bin'
+
+    before = os.stat(cache_path)
+    (tmp_path / 'a.py').write_text('x\n')
+    assert _count(tmp_path)[0].total_lines == 2
+    assert os.stat(cache_path).st_ino != before.st_ino
+
+    before = os.stat(cache_path)
+    os.unlink(tmp_path / 'b.py')
+    _count(tmp_path)
+    assert os.stat(cache_path).st_ino != before.st_ino
+    assert len(CountCache(str(tmp_path))._entries) == 1
+
+    before = os.stat(cache_path)
+    _count(tmp_path, load=False)
+    assert os.stat(cache_path).st_ino != before.st_ino
@@ -0,0 +1,57 @@
+import io
+import random
+import pytest
+from codel import classify as classify_module
+from codel import counter
+from codel.classify import Classifier, classify
+from codel.counter import count_data, count_file_classified, count_stream_classified
+
+TEXTS = {
+    '.c': (
+        'int a; /* one */\n\n/* open\n  still\n\n  "quoted */ " */\nchar *s = "/* no";\n'
+        '// line\n  \nx = 1; // trailing\n/* last\n'
+    ),
+    '.py': (
+        'a = 1\n"""doc\n# not a comment\n\n"""\n# comment\n\ns = \'#\'  # tail\n\'\'\'open\n\nx\n'
+    ),
+    '.sh': 'echo "# no"\n# yes\n\n  \necho x',
+}
+
+
+@pytest.mark.parametrize('file_ext', sorted(TEXTS))
+def test_chunks_agree_with_whole_text(file_ext):
+    data = (TEXTS[file_ext] * 20).encode()
+    lines = count_data(data)
+    whole = classify(data, file_ext, lines)
+    assert sum(whole) == lines and all(whole)
+    rng = random.Random(0)
+    for _ in range(50):
+        classifier = Classifier(file_ext)
+        offset = 0
+        while offset < len(data):
+            size = rng.randint(1, 40)
+            classifier.feed(data[offset:offset + size])
+            offset += size
+        assert classifier.close(lines) == whole
+
+
+def test_files_are_read_in_chunks(tmp_path, monkeypatch):
+    data = (TEXTS['.c'] * 200).encode()
+    path = tmp_path / 'a.c'
+    path.write_bytes(data)
+    expected = count_data(data), len(data), classify(data, '.c', count_data(data))
+    monkeypatch.setattr(counter, 'CHUNK_SIZE', 64)
+    assert count_file_classified(str(path)) == expected
+    assert count_stream_classified(io.BytesIO(b'\0' * 1000), '.c') == (None, 1000, None)
+
+
+def test_long_open_comment_isnt_classified(monkeypatch):
+    monkeypatch.setattr(classify_module, 'MAX_PENDING', 100)
+    data = b'x;\n/*' + b' comment\n' * 20 + b'*/\n'
+    lines = count_data(data)
+    # Closed within the chunk
+    assert classify(data, '.c', lines) == (1, 21, 0)
+    classifier = Classifier('.c')
+    for offset in range(0, len(data), 30):
+        classifier.feed(data[offset:offset + 30])
+    assert classifier.close(lines) is None
@@ -0,0 +1,30 @@
+import pytest
+from codel import counter
+from codel.collector import FilesCollector
+from codel.engine import CountingEngine
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize('mmap_threshold', [counter.MMAP_THRESHOLD, 1])
+def test_copies_counted_and_hashed_in_one_pass(tmp_path, monkeypatch, mmap_threshold):
+    monkeypatch.setattr(counter, 'MMAP_THRESHOLD', mmap_threshold)
+    text = b''.join(b'line %d\n' % i for i in range(5000))
+    _write(tmp_path / 'a.py', text)
+    _write(tmp_path / 'b.py', text)
+    # Same size and prefix, other content
+    _write(tmp_path / 'c.py', text[:-2] + b'x\n')
+    # Same size as others, other prefix
+    _write(tmp_path / 'd.py', b'y' + text[1:])
+
+    def report(dedup):
+        collector = FilesCollector(str(tmp_path), extensions=['.py'], gitignore=False)
+        return CountingEngine(jobs=1, dedup=dedup).report(collector)
+
+    deduplicated = report(True)
+    assert deduplicated.total_lines == report(False).total_lines == 4 * 5000
+    assert deduplicated.unique_files_count == 3
+    assert [sorted(group.paths) for group in deduplicated.duplicates] == [['a.py', 'b.py']]
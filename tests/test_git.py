@@ -0,0 +1,176 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import pytest
+from codel.git import GitError, GitFilesCollector, ObjectStore, Repository, parse_index, stat_matches
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+
+
+def _git(repo, *args) -> str:
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_NAME='a', GIT_AUTHOR_EMAIL='a@a', GIT_COMMITTER_NAME='a', GIT_COMMITTER_EMAIL='a@a',
+        GIT_CONFIG_GLOBAL=os.devnull, GIT_CONFIG_NOSYSTEM='1'
+    )
+    return subprocess.run(
+        ['git', '-C', str(repo)] + list(args), env=env, check=True, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, universal_newlines=True
+    ).stdout
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    _git(tmp_path, 'init', '-q', '-b', 'main')
+    _write(tmp_path / 'a.py', 'a\n')
+    _write(tmp_path / 'src' / 'b.py', 'b\nb\n')
+    _write(tmp_path / 'src' / 'deep' / 'c.py', 'c\n')
+    _write(tmp_path / 'src' / 'deep' / 'd.txt', 'd\n')
+    _git(tmp_path, 'add', '.')
+    _git(tmp_path, 'commit', '-q', '-m', 'init')
+    return tmp_path
+
+
+def _staged(repo):
+    # (mode, sha, stage, path) of `git ls-files -s`
+    entries = []
+    for line in _git(repo, 'ls-files', '-s').splitlines():
+        info, path = line.split('\t')
+        mode, sha, stage = info.split()
+        entries.append((int(mode, 8), sha, int(stage), path))
+    return entries
+
+
+def _parsed(repo):
+    with open(repo / '.git' / 'index', 'rb') as f:
+        entries = parse_index(f.read())
+    return [(entry.mode, entry.sha.hex(), entry.stage, entry.path) for entry in entries]
+
+
+@pytest.mark.parametrize('version', [2, 3, 4])
+def test_index_versions(repo, version):
+    _git(repo, 'update-index', '--index-version', str(version))
+    assert _parsed(repo) == _staged(repo)
+
+
+def test_conflict_stages(repo):
+    _git(repo, 'checkout', '-q', '-b', 'other')
+    _write(repo / 'a.py', 'other\n')
+    _git(repo, 'commit', '-q', '-am', 'other')
+    _git(repo, 'checkout', '-q', 'main')
+    _write(repo / 'a.py', 'main\n')
+    _git(repo, 'commit', '-q', '-am', 'main')
+    with pytest.raises(subprocess.CalledProcessError):
+        _git(repo, 'merge', '-q', 'other')
+
+    staged = _staged(repo)
+    assert sorted(stage for _, _, stage, path in staged if path == 'a.py') == [1, 2, 3]
+    assert _parsed(repo) == staged
+    files = [file for file in GitFilesCollector(str(repo), extensions=['.py']) if file.file_name == 'a.py']
+    assert len(files) == 1 and files[0].blob_sha is None
+
+
+def test_collected_files_and_blobs(repo):
+    collected = {
+        os.path.relpath(file.file_path, str(repo)).replace(os.sep, '/'): file.blob_sha.hex()
+        for file in GitFilesCollector(str(repo), extensions=['.py'])
+    }
+    assert collected == {path: sha for _, sha, _, path in _staged(repo) if path.endswith('.py')}
+
+
+def test_packed_objects_with_deltas(repo):
+    text = ''.join('line {}\n'.format(i) for i in range(2000))
+    for i in range(6):
+        text = text.replace('line {}\n'.format(i * 300), 'changed {}\n'.format(i))
+        _write(repo / 'big.py', text)
+        _git(repo, 'add', 'big.py')
+        _git(repo, 'commit', '-q', '-m', str(i))
+    _git(repo, 'gc', '-q', '--aggressive')
+    assert not [name for name in os.listdir(repo / '.git' / 'objects') if len(name) == 2]
+    pack = [name for name in os.listdir(repo / '.git' / 'objects' / 'pack') if name.endswith('.idx')][0]
+    verified = _git(repo, 'verify-pack', '-v', str(repo / '.git' / 'objects' / 'pack' / pack))
+    assert 'chain length' in verified
+
+    repository = Repository(str(repo))
+    store = ObjectStore(repository)
+    try:
+        for sha in _git(repo, 'rev-list', '--objects', '--all').split():
+            if len(sha) != 40:
+                continue
+            kind, data = store.read(bytes.fromhex(sha))
+            assert kind == _git(repo, 'cat-file', '-t', sha).strip()
+            if kind == 'blob':
+                assert data.decode() == _git(repo, 'cat-file', 'blob', sha)
+        head = store.read_commit(repository.resolve('HEAD'))
+        assert head.tree.hex() == _git(repo, 'rev-parse', 'HEAD^{tree}').strip()
+    finally:
+        store.close()
+
+
+def test_same_second_edit_isnt_trusted(repo):
+    path = repo / 'a.py'
+    second = 1700000000
+    os.utime(path, ns=(second * 10 ** 9 + 100, second * 10 ** 9 + 100))
+    _git(repo, 'add', 'a.py')
+    # Same size, same second, written before the index
+    _write(path, 'z\n')
+    os.utime(path, ns=(second * 10 ** 9 + 500, second * 10 ** 9 + 500))
+    index_path = repo / '.git' / 'index'
+    os.utime(index_path, ns=((second + 10) * 10 ** 9, (second + 10) * 10 ** 9))
+
+    with open(index_path, 'rb') as f:
+        entry = [entry for entry in parse_index(f.read()) if entry.path == 'a.py'][0]
+    assert entry.mtime % 10 ** 9 == 100
+    st = os.stat(path)
+    written = os.stat(index_path).st_mtime_ns
+    assert not stat_matches(entry, st, written, trust_ctime=False)
+
+    # Unchanged stat data is trusted, unless the
+    # index was written no later than the file
+    os.utime(path, ns=(second * 10 ** 9 + 100, second * 10 ** 9 + 100))
+    assert stat_matches(entry, os.stat(path), written, trust_ctime=False)
+    assert not stat_matches(entry, os.stat(path), second * 10 ** 9 + 100, trust_ctime=False)
+    # ctime changed by the edit
+    assert not stat_matches(entry, os.stat(path), written)
+
+
+def _colliding_blobs():
+    # Two contents whose blob hashes share 4 hex digits
+    seen = {}
+    for i in range(100000):
+        text = 'blob {}\n'.format(i)
+        sha = hashlib.sha1('blob {}\0{}'.format(len(text), text).encode()).hexdigest()
+        if sha[:4] in seen:
+            return seen[sha[:4]], text
+        seen[sha[:4]] = text
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_hash_prefixes(repo, packed):
+    blobs = []
+    for i, text in enumerate(_colliding_blobs()):
+        _write(repo / 'blob.txt', text)
+        blobs.append(_git(repo, 'hash-object', '-w', 'blob.txt').strip())
+        _git(repo, 'tag', 'blob{}'.format(i), blobs[-1])
+    if packed:
+        _git(repo, 'gc', '-q', '--prune=now')
+        assert not [name for name in os.listdir(repo / '.git' / 'objects') if len(name) == 2]
+
+    repository = Repository(str(repo))
+    head = _git(repo, 'rev-parse', 'HEAD').strip()
+    assert repository.resolve(head[:8]).hex() == head
+    assert repository.resolve(head[:9].upper()).hex() == head
+    unique = len(os.path.commonprefix(blobs)) + 1
+    for sha in blobs:
+        assert repository.resolve(sha[:unique]).hex() == sha
+    with pytest.raises(GitError, match='Ambiguous'):
+        repository.resolve(blobs[0][:4])
+    with pytest.raises(GitError, match='Unknown'):
+        repository.resolve(blobs[0][:3])
@@ -0,0 +1,89 @@
+import os
+import shutil
+import subprocess
+import pytest
+from codel.utils import IgnoreParser
+
+GITIGNORE = """\
+/build
+*.log
+!keep.log
+docs/**/*.tmp
+out/
+**/cache
+"""
+NESTED_GITIGNORE = """\
+!*.log
+secret.txt
+"""
+# Path -> whether git ignores it
+EXPECTED = {
+    'build/x.py': True,
+    'src/build/x.py': False,
+    'a.log': True,
+    'keep.log': False,
+    'src/keep.log': False,
+    'src/a.log': True,
+    'sub/a.log': False,
+    'sub/secret.txt': True,
+    'secret.txt': False,
+    'docs/c.tmp': True,
+    'docs/a/b/c.tmp': True,
+    'other/c.tmp': False,
+    'out/x.py': True,
+    'src/out': False,
+    'cache/x.py': True,
+    'src/deep/cache/x.py': True,
+    'src/x.py': False,
+}
+
+
+def _write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    os.mkdir(tmp_path / '.git')
+    _write(str(tmp_path / '.gitignore'), GITIGNORE)
+    _write(str(tmp_path / 'sub' / '.gitignore'), NESTED_GITIGNORE)
+    for path in EXPECTED:
+        _write(os.path.join(str(tmp_path), *path.split('/')))
+    return tmp_path
+
+
+def test_gitignore_rules(tree):
+    parser = IgnoreParser([], str(tree), gitignore=True)
+    verdicts = {path: parser.matches(os.path.join(str(tree), *path.split('/'))) for path in EXPECTED}
+    assert verdicts == EXPECTED
+    assert parser.matches_dir(str(tree / 'build'))
+    assert parser.matches_dir(str(tree / 'src' / 'deep' / 'cache'))
+    assert not parser.matches_dir(str(tree / 'src' / 'build'))
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+def test_gitignore_rules_agree_with_git(tree):
+    shutil.rmtree(str(tree / '.git'))
+    subprocess.run(['git', '-C', str(tree), 'init', '-q'], check=True)
+    checked = subprocess.run(
+        ['git', '-C', str(tree), 'check-ignore', '--stdin'],
+        input='\n'.join(EXPECTED), stdout=subprocess.PIPE, universal_newlines=True
+    )
+    assert set(checked.stdout.split()) == {path for path, ignored in EXPECTED.items() if ignored}
+
+
+def test_explicit_patterns(tmp_path):
+    parser = IgnoreParser(['*.md', 'vendor/', '/top.py', '!keep.md', 'a/**/b'], str(tmp_path))
+    root = str(tmp_path)
+    assert parser.matches(os.path.join(root, 'x.md'))
+    assert not parser.matches(os.path.join(root, 'keep.md'))
+    assert parser.matches(os.path.join(root, 'vendor', 'x.py'))
+    assert parser.matches_dir(os.path.join(root, 'src', 'vendor'))
+    assert not parser.matches(os.path.join(root, 'vendor'))
+    assert parser.matches(os.path.join(root, 'top.py'))
+    assert not parser.matches(os.path.join(root, 'src', 'top.py'))
+    assert parser.matches(os.path.join(root, 'a', 'b'))
+    assert parser.matches(os.path.join(root, 'a', 'x', 'y', 'b'))
+    assert not parser.matches(os.path.join(root, 'x', 'a', 'b'))
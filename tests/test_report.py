@@ -0,0 +1,23 @@
+import csv
+import io
+from codel.report import CountReport, RootsReport
+
+
+def _report(folder_path, files):
+    report = CountReport(folder_path=folder_path, keep_files=False)
+    for file in files:
+        report.add(*file)
+    return report
+
+
+def test_roots_csv_has_grand_totals():
+    roots = RootsReport([
+        _report('/a', [('/a/x.py', '.py', 3, 30), ('/a/y.md', '.md', 1, 5)]),
+        _report('/b', [('/b/z.py', '.py', 4, 40)]),
+    ])
+    stream = io.StringIO()
+    roots.write(stream, 'csv')
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+    totals = {row['extension']: (int(row['files']), int(row['lines'])) for row in rows if not row['root']}
+    assert totals == {'.md': (1, 1), '.py': (2, 7)}
+    assert len(rows) == 5
@@ -0,0 +1,37 @@
+from codel.report import CountReport
+from codel.rollup import DirectoryRollup, largest_files
+
+
+FILES = [
+    ('/r/a.py', '.py', 5, 50),
+    ('/r/d/b.py', '.py', 9, 90),
+    ('/r/d/c.txt', '.txt', 5, 20),
+    ('/r/d/e/f.py', '.py', 1, 10),
+    ('/r/bin', '.py', None, 7),
+    ('/r/g/h.txt', '.txt', 9, 30),
+]
+
+
+def _report(**options):
+    report = CountReport(folder_path='/r', **options)
+    for file in FILES:
+        report.add(*file)
+    return report
+
+
+def test_top_files_kept_while_counting():
+    full = _report()
+    top = _report(keep_files=False, top_files=3)
+    assert len(top) == 0
+    assert largest_files(top, 3) == largest_files(full, 3)
+    assert [record.path for record in largest_files(top, 3)] == ['d/b.py', 'g/h.txt', 'a.py']
+    assert largest_files(CountReport.from_dict(top.to_dict()), 2) == largest_files(full, 2)
+
+
+def test_directories_kept_while_counting():
+    full = _report()
+    totals = _report(keep_files=False, by_directory=True)
+    assert len(totals) == 0
+    for report in (totals, CountReport.from_dict(totals.to_dict())):
+        rows = [node.to_dict() for node in DirectoryRollup(report).tree()]
+        assert rows == [node.to_dict() for node in DirectoryRollup(full).tree()]
@@ -0,0 +1,127 @@
+import os
+import shutil
+import sys
+import time
+import pytest
+from codel.collector import FilesCollector
+from codel.engine import CountingEngine
+from codel.watch import (
+    CHANGED, DIRECTORY_CREATED, DIRECTORY_REMOVED, DIRECTORY_REPLACED, LiveCount, PollingSource,
+    merge_changes, start_live_count
+)
+
+
+def _write(path, lines):
+    with open(path, 'w') as f:
+        f.write('x\n' * lines)
+
+
+def _tree(tmp_path):
+    _write(tmp_path / 'a.py', 2)
+    os.mkdir(tmp_path / 'd')
+    _write(tmp_path / 'd' / 'x.py', 3)
+    return FilesCollector(str(tmp_path), extensions=['.py'], gitignore=False)
+
+
+def _fresh(collector):
+    report = CountingEngine(jobs=1).report(FilesCollector(
+        collector.folder_path, extensions=collector.extensions, gitignore=False))
+    return report.files_count, report.total_lines
+
+
+def _recreate(tmp_path):
+    shutil.rmtree(tmp_path / 'd')
+    os.mkdir(tmp_path / 'd')
+    _write(tmp_path / 'd' / 'y.py', 4)
+
+
+def test_later_directory_change_overrides_earlier_one():
+    pending = {}
+    merge_changes(pending, [('d', DIRECTORY_REMOVED), ('d', DIRECTORY_CREATED)])
+    assert pending == {'d': DIRECTORY_REPLACED}
+    merge_changes(pending, [('e', DIRECTORY_CREATED), ('e', DIRECTORY_REMOVED), ('f', CHANGED)])
+    assert pending['e'] == DIRECTORY_REPLACED
+    assert pending['f'] == CHANGED
+
+
+def test_directory_removed_and_recreated(tmp_path):
+    collector = _tree(tmp_path)
+    live = LiveCount(collector, CountingEngine(jobs=1))
+    live.start(PollingSource(live, interval=0))
+    _recreate(tmp_path)
+
+    # Events inotify reports for the sequence above
+    pending = {}
+    merge_changes(pending, [
+        (str(tmp_path / 'd' / 'x.py'), CHANGED),
+        (str(tmp_path / 'd'), DIRECTORY_REMOVED),
+        (str(tmp_path / 'd'), DIRECTORY_CREATED),
+        (str(tmp_path / 'd' / 'y.py'), CHANGED),
+    ])
+    live.apply(pending)
+    assert (live.report.files_count, live.report.total_lines) == _fresh(collector) == (2, 6)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_directory_removed_and_recreated_with_inotify(tmp_path):
+    collector = _tree(tmp_path)
+    live = start_live_count(collector, CountingEngine(jobs=1))
+    try:
+        _recreate(tmp_path)
+        pending = {}
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            changes = live.source.read(0.2)
+            if not changes and pending:
+                break
+            merge_changes(pending, changes)
+        live.apply(pending)
+        assert (live.report.files_count, live.report.total_lines) == _fresh(collector) == (2, 6)
+
+        # The new directory is watched
+        _write(tmp_path / 'd' / 'z.py', 5)
+        changes = live.source.read(5)
+        pending = {}
+        merge_changes(pending, changes)
+        live.apply(pending)
+        assert (live.report.files_count, live.report.total_lines) == _fresh(collector) == (3, 11)
+    finally:
+        live.source.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_directory_moved_out_is_not_watched(tmp_path):
+    os.mkdir(tmp_path / 'root')
+    collector = _tree(tmp_path / 'root')
+    live = start_live_count(collector, CountingEngine(jobs=1))
+    try:
+        os.rename(tmp_path / 'root' / 'd', tmp_path / 'moved')
+        pending = {}
+        merge_changes(pending, live.source.read(5))
+        live.apply(pending)
+        assert (live.report.files_count, live.report.total_lines) == (1, 2)
+
+        _write(tmp_path / 'moved' / 'x.py', 7)
+        assert live.source.read(0.2) == []
+    finally:
+        live.source.close()
+
+
+def test_polling_walks_at_most_once_per_interval(tmp_path):
+    collector = _tree(tmp_path)
+    live = LiveCount(collector, CountingEngine(jobs=1))
+    live.start(PollingSource(live, interval=60))
+    _write(tmp_path / 'a.py', 5)
+    assert live.source.read(0) == []
+
+    live.source.interval = 0
+    assert live.source.read(0) == [(str(tmp_path / 'a.py'), CHANGED)]
+
+
+def test_rescan(tmp_path):
+    collector = _tree(tmp_path)
+    live = LiveCount(collector, CountingEngine(jobs=1))
+    live.start(PollingSource(live, interval=60))
+    _recreate(tmp_path)
+    live.rescan()
+    assert (live.report.files_count, live.report.total_lines) == _fresh(collector) == (2, 6)